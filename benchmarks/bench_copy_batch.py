@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+	Benchmark for the storage of the row events in the log tables.
+	The script compares the previous CSV COPY, with the rows mogrified by psycopg2 and the json encoded with pg_encoder,
+	with the COPY BINARY built with the copy helpers and the row_encoder, the same encoding used by pg_engine.
+	Both formats are loaded into a temporary table with the log table's data types, the encoding and the COPY
+	times are reported separately.
+
+	Usage, from the repository root: python -m benchmarks.bench_copy_batch --dsn "dbname=test" [--rows 5000] [--batches 20]
+"""
+import argparse
+import io
+import json
+import time
+import psycopg2
+from pg_ninja.lib.pg_lib import pg_encoder, row_encoder, copy_bigint, copy_text, copy_jsonb
+from pg_ninja.lib.pg_lib import COPY_BINARY_HEADER, COPY_BINARY_TRAILER, COPY_LOG_FIELDS
+
+LOG_COLUMNS = "i_id_batch, v_table_name, v_schema_name, enm_binlog_event, t_binlog_name, i_binlog_position, jsb_event_after, jsb_event_before, i_my_event_time"
+
+def build_batch(rows):
+	"""
+		Builds a batch of update events using the row_encoder's golden sample as row image.
+	"""
+	group_insert = []
+	for row_id in range(rows):
+		event_after = row_encoder.get_golden_sample()
+		event_after["id"] = row_id
+		group_insert.append({
+			"global_data": {
+				"batch_id": 1,
+				"table": "t_bench",
+				"schema": "sch_bench",
+				"action": "update",
+				"binlog": "mysql-bin.000001",
+				"logpos": row_id,
+				"event_time": 1514862245,
+			},
+			"event_after": event_after,
+			"event_before": {"id": row_id},
+		})
+	return group_insert
+
+def encode_csv(pgsql_cur, group_insert):
+	"""
+		The CSV encoding used before the COPY BINARY.
+	"""
+	insert_list = []
+	for row_data in group_insert:
+		global_data = row_data["global_data"]
+		insert_list.append(pgsql_cur.mogrify("%s,%s,%s,%s,%s,%s,%s,%s,%s", (
+				global_data["batch_id"],
+				global_data["table"],
+				global_data["schema"],
+				global_data["action"],
+				global_data["binlog"],
+				global_data["logpos"],
+				json.dumps(row_data["event_after"], cls=pg_encoder),
+				json.dumps(row_data["event_before"], cls=pg_encoder),
+				global_data["event_time"],
+			)
+		))
+	csv_file = io.StringIO()
+	csv_file.write(b"\n".join(insert_list).decode())
+	csv_file.seek(0)
+	return csv_file
+
+def encode_binary(copy_buffer, dumps, pg_encoding, group_insert):
+	"""
+		The COPY BINARY encoding, the same loop of pg_engine's __copy_batch.
+	"""
+	copy_buffer.seek(0)
+	copy_buffer.truncate()
+	copy_buffer.write(COPY_BINARY_HEADER)
+	for row_data in group_insert:
+		global_data = row_data["global_data"]
+		copy_buffer.write(b"".join((
+				COPY_LOG_FIELDS,
+				copy_bigint(global_data["batch_id"]),
+				copy_text(global_data["table"], pg_encoding),
+				copy_text(global_data["schema"], pg_encoding),
+				copy_text(global_data["action"], pg_encoding),
+				copy_text(global_data["binlog"], pg_encoding),
+				copy_bigint(global_data["logpos"]),
+				copy_jsonb(dumps(row_data["event_after"]), pg_encoding),
+				copy_jsonb(dumps(row_data["event_before"]), pg_encoding),
+				copy_bigint(global_data["event_time"]),
+			))
+		)
+	copy_buffer.write(COPY_BINARY_TRAILER)
+	copy_buffer.seek(0)
+	return copy_buffer
+
+def run_csv(pgsql_cur, group_insert, batches):
+	encode_time = copy_time = 0
+	sql_copy = "COPY t_log_bench (%s) FROM STDIN WITH NULL 'NULL' CSV QUOTE '''' DELIMITER ',' ESCAPE '''';" % LOG_COLUMNS
+	for batch_id in range(batches):
+		start = time.perf_counter()
+		csv_file = encode_csv(pgsql_cur, group_insert)
+		encoded = time.perf_counter()
+		pgsql_cur.copy_expert(sql_copy, csv_file)
+		encode_time += encoded - start
+		copy_time += time.perf_counter() - encoded
+	return encode_time, copy_time
+
+def run_binary(pgsql_cur, pg_encoding, group_insert, batches):
+	encode_time = copy_time = 0
+	sql_copy = "COPY t_log_bench (%s) FROM STDIN WITH (FORMAT BINARY);" % LOG_COLUMNS
+	copy_buffer = io.BytesIO()
+	dumps = row_encoder().dumps
+	for batch_id in range(batches):
+		start = time.perf_counter()
+		encode_binary(copy_buffer, dumps, pg_encoding, group_insert)
+		encoded = time.perf_counter()
+		pgsql_cur.copy_expert(sql_copy, copy_buffer)
+		encode_time += encoded - start
+		copy_time += time.perf_counter() - encoded
+	return encode_time, copy_time
+
+def main():
+	parser = argparse.ArgumentParser(description='Log table COPY benchmark.')
+	parser.add_argument('--dsn', required=True, help='the PostgreSQL connection string')
+	parser.add_argument('--rows', type=int, default=5000, help='number of rows per batch')
+	parser.add_argument('--batches', type=int, default=20, help='number of batches copied')
+	args = parser.parse_args()
+
+	pgsql_conn = psycopg2.connect(args.dsn)
+	pgsql_conn.set_session(autocommit=True)
+	pgsql_cur = pgsql_conn.cursor()
+	pgsql_cur.execute("""
+		CREATE TEMPORARY TABLE t_log_bench
+		(
+			i_id_event bigserial,
+			i_id_batch bigint,
+			v_table_name character varying(100),
+			v_schema_name character varying(100),
+			enm_binlog_event text,
+			t_binlog_name text,
+			i_binlog_position bigint,
+			jsb_event_after jsonb,
+			jsb_event_before jsonb,
+			i_my_event_time bigint
+		);
+	""")
+	pg_encoding = psycopg2.extensions.encodings[pgsql_conn.encoding]
+	group_insert = build_batch(args.rows)
+	total_rows = args.rows*args.batches
+
+	csv_times = run_csv(pgsql_cur, group_insert, args.batches)
+	pgsql_cur.execute("TRUNCATE t_log_bench;")
+	binary_times = run_binary(pgsql_cur, pg_encoding, group_insert, args.batches)
+	pgsql_conn.close()
+
+	print("Rows: %s in %s batches" % (total_rows, args.batches))
+	for copy_format, (encode_time, copy_time) in (("CSV", csv_times), ("BINARY", binary_times)):
+		total_time = encode_time + copy_time
+		print("%s: encoding %.3f s, COPY %.3f s, total %.3f s (%.0f rows/s)" % (copy_format, encode_time, copy_time, total_time, total_rows/total_time))
+	print("Speedup: %.2fx" % (sum(csv_times)/sum(binary_times), ))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+	Benchmark for the log tables durability set with the source's parameter log_tables_durability.
+	The same batches are loaded with COPY BINARY, one transaction per batch as the read replica does,
+	into a logged table with synchronous_commit on (logged), into a logged table with synchronous_commit
+	off (async) and into an unlogged table (unlogged).
+	The tables are created in the schema sch_ninja_bench, which is dropped at the end.
+
+	Usage, from the repository root: python -m benchmarks.bench_log_durability --dsn "dbname=test" [--rows 1000] [--batches 200]
+"""
+import argparse
+import io
+import time
+import psycopg2
+from pg_ninja.lib.pg_lib import row_encoder
+from benchmarks.bench_copy_batch import LOG_COLUMNS, build_batch, encode_binary
+
+DURABILITY_MODES = [
+	("logged", "", "on"),
+	("async", "", "off"),
+	("unlogged", "UNLOGGED", "off"),
+]
+
+def run_mode(pgsql_cur, table_name, synchronous_commit, pg_encoding, group_insert, batches):
+	pgsql_cur.execute("SET synchronous_commit=%s;" % synchronous_commit)
+	sql_copy = "COPY sch_ninja_bench.%s (%s) FROM STDIN WITH (FORMAT BINARY);" % (table_name, LOG_COLUMNS)
+	copy_buffer = io.BytesIO()
+	dumps = row_encoder().dumps
+	start = time.perf_counter()
+	for batch_id in range(batches):
+		encode_binary(copy_buffer, dumps, pg_encoding, group_insert)
+		pgsql_cur.copy_expert(sql_copy, copy_buffer)
+	return time.perf_counter() - start
+
+def main():
+	parser = argparse.ArgumentParser(description='Log tables durability benchmark.')
+	parser.add_argument('--dsn', required=True, help='the PostgreSQL connection string')
+	parser.add_argument('--rows', type=int, default=1000, help='number of rows per batch')
+	parser.add_argument('--batches', type=int, default=200, help='number of batches, each batch is committed')
+	args = parser.parse_args()
+
+	pgsql_conn = psycopg2.connect(args.dsn)
+	pgsql_conn.set_session(autocommit=True)
+	pgsql_cur = pgsql_conn.cursor()
+	pg_encoding = psycopg2.extensions.encodings[pgsql_conn.encoding]
+	group_insert = build_batch(args.rows)
+	total_rows = args.rows*args.batches
+	pgsql_cur.execute("CREATE SCHEMA sch_ninja_bench;")
+	try:
+		results = []
+		for durability, table_persistence, synchronous_commit in DURABILITY_MODES:
+			table_name = "t_log_%s" % durability
+			pgsql_cur.execute("""
+				CREATE %s TABLE sch_ninja_bench.%s
+				(
+					i_id_event bigserial PRIMARY KEY,
+					i_id_batch bigint,
+					v_table_name character varying(100),
+					v_schema_name character varying(100),
+					enm_binlog_event text,
+					t_binlog_name text,
+					i_binlog_position bigint,
+					jsb_event_after jsonb,
+					jsb_event_before jsonb,
+					i_my_event_time bigint
+				);
+			""" % (table_persistence, table_name))
+			results.append((durability, run_mode(pgsql_cur, table_name, synchronous_commit, pg_encoding, group_insert, args.batches)))
+	finally:
+		pgsql_cur.execute("DROP SCHEMA sch_ninja_bench CASCADE;")
+		pgsql_conn.close()
+
+	print("Rows: %s in %s batches" % (total_rows, args.batches))
+	logged_time = results[0][1]
+	for durability, run_time in results:
+		print("%s: %.3f s (%.0f rows/s, %.0f batches/s, %.2fx)" % (durability, run_time, total_rows/run_time, args.batches/run_time, logged_time/run_time))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+	Benchmark for the replay latency added by the wait between the replay runs.
+	A producer thread simulates the read replica, closing a batch at random intervals with the same notification
+	sent by set_batch_processed. The consumer simulates the replay daemon and measures, for each batch,
+	the time between the batch processed and the replay daemon woken up.
+	The polling mode sleeps sleep_loop seconds between the runs, as the replay daemon did before the notifications.
+	The notify mode waits with pg_engine's listen_replay and wait_replay, using sleep_loop as timeout.
+	The intervals between the batches are generated with a fixed seed, so both modes see the same sequence.
+
+	Usage, from the repository root: python -m benchmarks.bench_replay_wakeup --dsn "dbname=test" [--batches 20] [--sleep-loop 1]
+"""
+import argparse
+import logging
+import random
+import threading
+import time
+import psycopg2
+from pg_ninja.lib.pg_lib import pg_engine
+
+BENCH_SOURCE_ID = 0
+
+def produce_batches(dsn, channel, intervals, sent_times):
+	"""
+		Sends a notification for each batch after the given interval and saves the send time.
+	"""
+	pgsql_conn = psycopg2.connect(dsn)
+	pgsql_conn.set_session(autocommit=True)
+	pgsql_cur = pgsql_conn.cursor()
+	for id_batch, interval in enumerate(intervals):
+		time.sleep(interval)
+		sent_times[id_batch] = time.time()
+		pgsql_cur.execute("SELECT pg_notify(%s, %s);", (channel, str(id_batch)))
+	pgsql_conn.close()
+
+def start_producer(dsn, channel, intervals):
+	sent_times = {}
+	producer = threading.Thread(target=produce_batches, args=(dsn, channel, intervals, sent_times))
+	producer.start()
+	return producer, sent_times
+
+def run_polling(dsn, engine, intervals, sleep_loop):
+	producer, sent_times = start_producer(dsn, engine.get_replay_channel(), intervals)
+	latencies = {}
+	while len(latencies) < len(intervals):
+		time.sleep(sleep_loop)
+		woken_time = time.time()
+		for id_batch, sent_time in list(sent_times.items()):
+			if id_batch not in latencies:
+				latencies[id_batch] = woken_time - sent_time
+	producer.join()
+	return list(latencies.values())
+
+def run_notify(dsn, engine, intervals, sleep_loop):
+	engine.listen_replay()
+	producer, sent_times = start_producer(dsn, engine.get_replay_channel(), intervals)
+	latencies = {}
+	while len(latencies) < len(intervals):
+		notified_batches = engine.wait_replay(sleep_loop)
+		woken_time = time.time()
+		for id_batch in notified_batches:
+			latencies[int(id_batch)] = woken_time - sent_times[int(id_batch)]
+	producer.join()
+	return list(latencies.values())
+
+def main():
+	parser = argparse.ArgumentParser(description='Replay wake up latency benchmark.')
+	parser.add_argument('--dsn', required=True, help='the PostgreSQL connection string')
+	parser.add_argument('--batches', type=int, default=20, help='number of batches closed by the producer')
+	parser.add_argument('--sleep-loop', type=float, default=1.0, help='the replay sleep_loop in seconds')
+	parser.add_argument('--seed', type=int, default=42, help='the seed for the intervals between the batches')
+	args = parser.parse_args()
+
+	random.seed(args.seed)
+	intervals = [random.uniform(0, 2*args.sleep_loop) for id_batch in range(args.batches)]
+	engine = pg_engine()
+	engine.logger = logging.getLogger("bench_replay_wakeup")
+	engine.i_id_source = BENCH_SOURCE_ID
+	engine.pgsql_conn = psycopg2.connect(args.dsn)
+	engine.pgsql_conn.set_session(autocommit=True)
+	engine.pgsql_cur = engine.pgsql_conn.cursor()
+
+	results = [
+		("polling", run_polling(args.dsn, engine, intervals, args.sleep_loop)),
+		("notify", run_notify(args.dsn, engine, intervals, args.sleep_loop)),
+	]
+	engine.pgsql_conn.close()
+
+	print("Batches: %s, sleep_loop: %s s" % (args.batches, args.sleep_loop))
+	for wait_mode, latencies in results:
+		latencies.sort()
+		print("%s: latency avg %.3f s, median %.3f s, max %.3f s" % (wait_mode, sum(latencies)/len(latencies), latencies[len(latencies)//2], latencies[-1]))
+
+if __name__ == "__main__":
+	main()
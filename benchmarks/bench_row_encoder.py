@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+	Micro-benchmark for the json encoding of the row images.
+	The script compares json.dumps with the pg_encoder class, which builds a new encoder for each row
+	and checks the types with isinstance, with the row_encoder reused for all the rows.
+	No database connection is required.
+
+	Usage, from the repository root: python -m benchmarks.bench_row_encoder [--rows 100000]
+"""
+import argparse
+import json
+import time
+from pg_ninja.lib.pg_lib import pg_encoder, row_encoder
+
+def run_pg_encoder(rows, row_data):
+	start = time.perf_counter()
+	for row_id in range(rows):
+		json.dumps(row_data, cls=pg_encoder)
+	return time.perf_counter() - start
+
+def run_row_encoder(rows, row_data, encoder):
+	dumps = encoder.dumps
+	start = time.perf_counter()
+	for row_id in range(rows):
+		dumps(row_data)
+	return time.perf_counter() - start
+
+def main():
+	parser = argparse.ArgumentParser(description='Row encoder micro-benchmark.')
+	parser.add_argument('--rows', type=int, default=100000, help='number of row images encoded')
+	args = parser.parse_args()
+
+	row_data = row_encoder.get_golden_sample()
+	encoder = row_encoder()
+	if encoder.dumps(row_data) != json.dumps(row_data, cls=pg_encoder):
+		raise SystemExit("The row_encoder output does not match pg_encoder")
+
+	legacy_time = run_pg_encoder(args.rows, row_data)
+	encoder_time = run_row_encoder(args.rows, row_data, encoder)
+	print("Rows: %s, columns: %s, backend: %s" % (args.rows, len(row_data), encoder.backend))
+	print("json.dumps with pg_encoder: %.3f s (%.0f rows/s)" % (legacy_time, args.rows/legacy_time))
+	print("row_encoder: %.3f s (%.0f rows/s)" % (encoder_time, args.rows/encoder_time))
+	print("Speedup: %.2fx" % (legacy_time/encoder_time, ))
+
+if __name__ == "__main__":
+	main()
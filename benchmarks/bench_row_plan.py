@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+	Micro-benchmark for the per-table row plans used by the read replica.
+	The script compares the previous per-column processing of the row images (type lookup and hexify check
+	for each column of event_after and event_before) with the row plan, which lists only the columns requiring
+	the conversion to hexadecimal string.
+	No database connection is required.
+
+	Usage, from the repository root: python -m benchmarks.bench_row_plan [--rows 100000] [--columns 100] [--binary 2]
+"""
+import argparse
+import binascii
+import time
+from pg_ninja.lib.mysql_lib import mysql_source
+
+def build_table(columns, binary):
+	"""
+		Builds the column/type mappings and a sample update row for a table with the given number of columns.
+		The first binary columns are varbinary, the others are integers and varchars.
+	"""
+	column_map = {}
+	row_after = {}
+	for column_id in range(columns):
+		column_name = "column_%s" % column_id
+		if column_id < binary:
+			column_map[column_name] = 'varbinary'
+			row_after[column_name] = b'\x00\x01binary'
+		elif column_id % 2:
+			column_map[column_name] = 'int'
+			row_after[column_name] = column_id
+		else:
+			column_map[column_name] = 'varchar'
+			row_after[column_name] = 'value %s' % column_id
+	return column_map, row_after
+
+def legacy_transform(event_after, event_before, column_map, hexify):
+	"""
+		The per-column processing of the row images used before the row plans.
+	"""
+	for event_image in (event_after, event_before):
+		for column_name in event_image:
+			try:
+				column_type = column_map[column_name]
+			except KeyError:
+				column_type = 'text'
+			if column_type in hexify and event_image[column_name]:
+				event_image[column_name] = binascii.hexlify(event_image[column_name]).decode()
+			elif column_type in hexify and isinstance(event_image[column_name], bytes):
+				event_image[column_name] = ''
+
+def run_legacy(rows, row_after, column_map, hexify):
+	start = time.perf_counter()
+	for row_id in range(rows):
+		legacy_transform(dict(row_after), dict(row_after), column_map, hexify)
+	return time.perf_counter() - start
+
+def run_plan(rows, row_after, source):
+	hexify_row = source._mysql_source__hexify_row
+	start = time.perf_counter()
+	row_plan = source._mysql_source__get_row_plan('bench', 'wide_table')
+	for row_id in range(rows):
+		event_after = dict(row_after)
+		event_before = dict(row_after)
+		row_plan["columns"].issuperset(event_after)
+		if row_plan["hexify"]:
+			hexify_row(event_after, row_plan["hexify"])
+			hexify_row(event_before, row_plan["hexify"])
+	return time.perf_counter() - start
+
+def main():
+	parser = argparse.ArgumentParser(description='Row plan micro-benchmark.')
+	parser.add_argument('--rows', type=int, default=100000, help='number of update rows processed')
+	parser.add_argument('--columns', type=int, default=100, help='number of columns of the table')
+	parser.add_argument('--binary', type=int, default=2, help='number of varbinary columns of the table')
+	args = parser.parse_args()
+
+	column_map, row_after = build_table(args.columns, args.binary)
+	source = mysql_source()
+	source.hexify = source.hexify_always
+	source.obfuscation = {}
+	source.table_type_map = {'bench': {'wide_table': column_map}}
+
+	legacy_time = run_legacy(args.rows, row_after, column_map, source.hexify)
+	plan_time = run_plan(args.rows, row_after, source)
+	print("Rows: %s, columns: %s, varbinary columns: %s" % (args.rows, args.columns, args.binary))
+	print("Per column processing: %.3f s (%.0f rows/s)" % (legacy_time, args.rows/legacy_time))
+	print("Row plan: %.3f s (%.0f rows/s)" % (plan_time, args.rows/plan_time))
+	print("Speedup: %.2fx" % (legacy_time/plan_time, ))
+
+if __name__ == "__main__":
+	main()
@@ -69,7 +69,7 @@ class replica_engine(object):
 		"""
 			Class constructor.
 		"""
-		self.catalog_version = '2.0.3'
+		self.catalog_version = '2.0.4'
 		self.upgradable_version = '0.18'
 		self.lst_yes= ['yes',  'Yes', 'y', 'Y']
 		python_lib=get_python_lib()
@@ -551,7 +551,8 @@ class replica_engine(object):
 		while True:
 			try:
 				self.mysql_source.read_replica()
-				time.sleep(self.sleep_loop)
+				if not self.mysql_source.my_stream:
+					time.sleep(self.sleep_loop)
 			except Exception:
 			    queue.put(traceback.format_exc())
 			    break
@@ -559,11 +560,15 @@ class replica_engine(object):
 	def replay_replica(self, queue,log_replay):
 		"""
 			The method replays the row images stored in the target postgresql database.
+			Between the replay runs the method waits for the read replica's notification of a processed batch, 
+			using the sleep_loop as timeout.
 		"""
 		self.pg_engine.logger  = log_replay[0]
 		tables_error  = []
 		self.pg_engine.connect_db()
 		self.pg_engine.set_source_id()
+		self.pg_engine.set_synchronous_commit()
+		self.pg_engine.listen_replay()
 		while True:
 			try:
 				tables_error = self.pg_engine.replay_replica()
@@ -574,7 +579,7 @@ class replica_engine(object):
 					notifier_message = "There was an error during the replay of data. %s. The affected tables are no longer replicated." % (tables_removed)
 					self.logger.error(notifier_message)
 					self.notifier.send_message(notifier_message, 'error')
-				time.sleep(self.sleep_loop)
+				self.pg_engine.wait_replay(self.sleep_loop)
 			except Exception:
 			    queue.put(traceback.format_exc())
 			    break
@@ -611,6 +616,8 @@ class replica_engine(object):
 		
 		self.pg_engine.connect_db()
 		self.pg_engine.clean_not_processed_batches()
+		self.pg_engine.set_log_tables()
+		self.pg_engine.rewind_lost_batches()
 		self.pg_engine.disconnect_db()
 				
 		self.logger.info("Starting the replica daemons for source %s " % (self.args.source))
@@ -829,6 +836,10 @@ class replica_engine(object):
 				tab_body.append(tab_row)
 				tab_row = ['Skipped rows', replica_counters[1]]
 				tab_body.append(tab_row)
+				tab_row = ['Replay chunk rows', replica_counters[3]]
+				tab_body.append(tab_row)
+				tab_row = ['Last chunk time (ms)', replica_counters[4]]
+				tab_body.append(tab_row)
 			print(tabulate(tab_body, tablefmt="simple"))
 			if tables_no_replica[2]:
 				print('\n== Tables with replica disabled ==')
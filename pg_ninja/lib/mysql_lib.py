@@ -1,16 +1,217 @@
 import time
 import sys
-import io
 import pymysql
-import codecs
 import binascii
 import hashlib
+import threading
+import queue
+import multiprocessing as mp
 from pymysqlreplication import BinLogStreamReader
-from pymysqlreplication.event import QueryEvent, GtidEvent, HeartbeatLogEvent
+from pymysqlreplication.event import QueryEvent, GtidEvent, HeartbeatLogEvent, XidEvent
 from pymysqlreplication.row_event import DeleteRowsEvent,UpdateRowsEvent,WriteRowsEvent
 from pymysqlreplication.event import RotateEvent
 from pg_ninja import sql_token
 from os import remove
+from shutil import copyfileobj
+
+class gtid_set(object):
+	"""
+		The class stores a MySQL GTID set in memory as a dictionary with the server UUID as key 
+		and the sorted list of the executed intervals as value. Each interval is a list with the first and the last 
+		transaction id, both included.
+		The set is parsed from the Executed_Gtid_Set format (e.g. uuid1:1-100:105-110,\nuuid2:1-20) and is serialised 
+		in the same format by the method __str__.
+		The tagged GTIDs introduced by MySQL 8.4 (e.g. uuid1:1-100:tag1:1-5) are stored with the key uuid:tag, 
+		as the tagged transactions have their own sequence of transaction ids.
+	"""
+	def __init__(self, gtid_text=None):
+		"""
+			Class constructor, the optional gtid_text is parsed and merged into the set.
+			
+			:param gtid_text: the gtid set in the Executed_Gtid_Set format
+		"""
+		self.intervals = {}
+		if gtid_text:
+			self.merge_text(gtid_text)
+	
+	def __str__(self):
+		"""
+			The method serialises the gtid set in the Executed_Gtid_Set format, with the server UUIDs sorted.
+		"""
+		gtid_pack = []
+		for server_uuid in sorted(self.intervals):
+			interval_list = []
+			for interval in self.intervals[server_uuid]:
+				if interval[0] == interval[1]:
+					interval_list.append("%s" % (interval[0], ))
+				else:
+					interval_list.append("%s-%s" % (interval[0], interval[1]))
+			gtid_pack.append("%s:%s" % (server_uuid, ':'.join(interval_list)))
+		return ",\n".join(gtid_pack)
+	
+	def merge_text(self, gtid_text):
+		"""
+			The method parses a gtid set in the Executed_Gtid_Set format and merges it into the set.
+			
+			:param gtid_text: the gtid set in the Executed_Gtid_Set format
+		"""
+		for gtid_item in gtid_text.split(","):
+			gtid_item = gtid_item.strip()
+			if not gtid_item:
+				continue
+			gtid_elements = gtid_item.split(":")
+			source_uuid = gtid_elements[0].strip().lower()
+			server_uuid = source_uuid
+			for interval in gtid_elements[1:]:
+				interval = interval.strip()
+				if not interval[:1].isdigit():
+					server_uuid = "%s:%s" % (source_uuid, interval.lower())
+					continue
+				interval = interval.split("-")
+				self.add_interval(server_uuid, int(interval[0]), int(interval[-1]))
+	
+	def merge(self, other_set):
+		"""
+			The method merges another gtid_set object into the set.
+			
+			:param other_set: the gtid_set to merge
+		"""
+		for server_uuid in other_set.intervals:
+			for interval in other_set.intervals[server_uuid]:
+				self.add_interval(server_uuid, interval[0], interval[1])
+	
+	def add_gtid(self, gtid):
+		"""
+			The method adds a single transaction to the set, using the format uuid:transaction_id of the GtidEvent
+			or uuid:tag:transaction_id for the tagged transactions.
+			
+			:param gtid: the gtid string 
+		"""
+		gtid_elements = gtid.split(":")
+		transaction_id = int(gtid_elements[-1])
+		self.add_interval(':'.join(gtid_elements[:-1]).lower(), transaction_id, transaction_id)
+	
+	def add_interval(self, server_uuid, interval_start, interval_end):
+		"""
+			The method adds an interval of transactions to the set for the given server UUID.
+			The intervals are kept sorted and the overlapping or adjacent intervals are merged.
+			The common case of a transaction following the last interval is managed without sorting the list.
+			
+			:param server_uuid: the server UUID
+			:param interval_start: the interval's first transaction id
+			:param interval_end: the interval's last transaction id
+		"""
+		interval_list = self.intervals.setdefault(server_uuid, [])
+		if interval_list:
+			last_interval = interval_list[-1]
+			if last_interval[0] <= interval_start and interval_start <= last_interval[1] + 1:
+				last_interval[1] = max(last_interval[1], interval_end)
+				return
+		interval_list.append([interval_start, interval_end])
+		if len(interval_list) > 1 and interval_list[-2][0] > interval_start:
+			interval_list.sort()
+		merged_list = [interval_list[0]]
+		for interval in interval_list[1:]:
+			if interval[0] <= merged_list[-1][1] + 1:
+				merged_list[-1][1] = max(merged_list[-1][1], interval[1])
+			else:
+				merged_list.append(interval)
+		self.intervals[server_uuid] = merged_list
+
+class copy_stream(object):
+	"""
+		The class is a read only file like object which streams the rows of an unbuffered cursor to psycopg2's copy_expert.
+		The rows are pulled from the cursor with fetchmany only when the buffer has not enough bytes for the read, 
+		so the memory used is limited by fetch_rows regardless of the table's size and no temporary file is required.
+		Each row's first column is the csv data, the rows are encoded with the PostgreSQL connection's encoding.
+		The following columns, if any, are the row's primary key. The keys of the first and the last row streamed 
+		are kept in first_key and last_key.
+		The stream ends after max_rows rows, so each COPY loads a slice of the table and a failed slice 
+		can be loaded again with the inserts.
+	"""
+	def __init__(self, cursor, max_rows, encoding, fetch_rows=1000):
+		"""
+			Class constructor.
+			
+			:param cursor: the unbuffered cursor with the csv data already executed
+			:param max_rows: the maximum number of rows streamed
+			:param encoding: the python codec used to encode the rows
+			:param fetch_rows: the number of rows pulled from the cursor with each fetchmany
+		"""
+		self.cursor = cursor
+		self.max_rows = max_rows
+		self.encoding = encoding
+		self.fetch_rows = fetch_rows
+		self.rows = 0
+		self.buffer = bytearray()
+		self.first_key = None
+		self.last_key = None
+	
+	def __fetch(self):
+		"""
+			The method pulls the next rows from the cursor and appends them encoded to the buffer.
+			
+			:return: False if there are no more rows to stream
+			:rtype: boolean
+		"""
+		fetch_rows = min(self.fetch_rows, self.max_rows - self.rows)
+		if fetch_rows <= 0:
+			return False
+		csv_results = self.cursor.fetchmany(fetch_rows)
+		if len(csv_results) == 0:
+			self.max_rows = self.rows
+			return False
+		if self.rows == 0:
+			self.first_key = tuple(csv_results[0][1:])
+		self.last_key = tuple(csv_results[-1][1:])
+		self.rows += len(csv_results)
+		self.buffer += "\n".join(d[0] for d in csv_results).encode(self.encoding)
+		self.buffer += b"\n"
+		return True
+	
+	def has_rows(self):
+		"""
+			The method returns whether the stream has any row to read.
+			
+			:return: True if there are rows to read
+			:rtype: boolean
+		"""
+		return len(self.buffer) > 0 or self.__fetch()
+	
+	def read(self, size=-1):
+		"""
+			The method returns up to size bytes from the stream, an empty bytes object when the stream ends.
+			
+			:param size: the number of bytes to read, all the remaining bytes if negative
+			:return: the encoded csv data
+			:rtype: bytes
+		"""
+		while (size < 0 or len(self.buffer) < size) and self.__fetch():
+			pass
+		if size < 0:
+			size = len(self.buffer)
+		csv_data = bytes(self.buffer[:size])
+		del self.buffer[:size]
+		return csv_data
+	
+	def skip_rows(self):
+		"""
+			The method discards the stream's remaining rows, so the cursor is positioned at the next slice.
+			It's used when the COPY of the slice fails before reading the whole stream.
+		"""
+		self.buffer = bytearray()
+		while self.rows < self.max_rows:
+			csv_results = self.cursor.fetchmany(min(self.fetch_rows, self.max_rows - self.rows))
+			if len(csv_results) == 0:
+				break
+			self.last_key = tuple(csv_results[-1][1:])
+			self.rows += len(csv_results)
+	
+	def close(self):
+		"""
+			The method releases the stream's buffer. The cursor is not closed.
+		"""
+		self.buffer = bytearray()
 
 class mysql_source(object):
 	def __init__(self):
@@ -27,6 +228,26 @@ class mysql_source(object):
 		self.schema_only = {}
 		self.gtid_mode = False
 		self.gtid_enable = False
+		self.table_type_map = {}
+		self.type_map_version = None
+		self.row_plans = {}
+		self.fk_tables = {}
+		self.chunk_status = {}
+		self.consistent_points = {}
+		self.tables_consistent = []
+		self.batch_writer = None
+		self.writer_error = None
+		self.keep_stream_open = False
+		self.replica_compaction = False
+		self.replica_changed_columns = False
+		self.batch_compaction = False
+		self.my_stream = None
+		self.stream_pending = None
+		self.stream_binlogfile = None
+		self.stream_binlog_seq = None
+		self.gtid_executed = gtid_set()
+		self.copy_snapshot = None
+		self.copy_lock = 'table'
 	
 	def __del__(self):
 		"""
@@ -448,13 +669,29 @@ class mysql_source(object):
 		master_status = self.cursor_buffered.fetchall()
 		return master_status
 		
-	def copy_data(self, schema, table):
+	def copy_data(self, schema, table, copy_chunk=None):
 		"""
 			The method copy the data between the origin and destination table.
 			The method locks the table read only mode and  gets the log coordinates which are returned to the calling method.
+			The rows are read from the unbuffered cursor using the class copy_stream, so only a few rows are kept in memory. 
+			With the copy_mode direct each slice is streamed to the COPY, with the copy_mode file each slice is streamed 
+			to a file in the out_dir, encoded with the MySQL connection's charset, and then copied.
+			If the class attribute copy_snapshot is set the table is not locked. The data is read with the unbuffered 
+			connection already in a consistent snapshot and the snapshot's log coordinates are returned.
+			With the copy_lock snapshot the table lock is released as soon as the log coordinates are collected and 
+			a consistent snapshot is started on the unbuffered connection. The data is then read from the snapshot.
+			With the copy_lock table the lock is held until the end of the copy. 
+			In both cases the time the lock is held is logged.
+			The snapshot started by the method is always ended when the method exits, also when the copy fails, so the 
+			following tables are never copied with a stale snapshot and log coordinates. The buffered connection is closed 
+			as well, which releases the table lock if the copy failed before the unlock.
+			If copy_chunk is set only the rows within the chunk's primary key range are copied.
+			If the table has a primary key the rows are read in the key's order, and the keys of the first and last row 
+			of each failed slice are saved, so the fallback to inserts reads the slice by key range.
 			
 			:param schema: the origin's schema
 			:param table: the table name 
+			:param copy_chunk: the optional dictionary with the primary key range to copy, built by __get_copy_chunks
 			:return: the log coordinates for the given table
 			:rtype: dictionary
 		"""
@@ -485,6 +722,8 @@ class mysql_source(object):
 		self.cursor_buffered.execute(sql_rows, (schema, table))
 		count_rows = self.cursor_buffered.fetchone()
 		total_rows = count_rows["table_rows"]
+		if copy_chunk:
+			total_rows = min(total_rows, copy_chunk["rows"])
 		copy_limit = int(count_rows["copy_limit"])
 		if copy_limit == 0:
 			copy_limit=1000000
@@ -494,62 +733,100 @@ class mysql_source(object):
 		slice=range_slices[0]
 		self.logger.debug("The table %s.%s will be copied in %s  estimated slice(s) of %s rows"  % (schema, table, total_slices, copy_limit))
 
-		out_file='%s/%s_%s.csv' % (self.out_dir, schema, table )
-		self.lock_table(schema, table)
-		master_status = self.get_master_coordinates()
-		select_columns = self.generate_select_statements(schema, table)
-		csv_data = ""
-		sql_csv = "SELECT %s as data FROM `%s`.`%s`;" % (select_columns["select_csv"], schema, table)
-		column_list = select_columns["column_list"]
-		self.logger.debug("Executing query for table %s.%s"  % (schema, table ))
-		self.connect_db_unbuffered()
+		chunk_filter = self.__get_chunk_filter(copy_chunk)
+		if copy_chunk:
+			out_file='%s/%s_%s_%s.csv' % (self.out_dir, schema, table, copy_chunk["number"])
+		else:
+			out_file='%s/%s_%s.csv' % (self.out_dir, schema, table )
+		table_snapshot = False
 		try:
-			self.cursor_unbuffered.execute(sql_csv)
-		except pymysql.Error as e:
-			self.logger.debug("Could not get data from table %s.%s"  % (schema, table ))
-			print('Got error {!r}, errno is {}'.format(e, e.args[0]))
-		while True:
-			csv_results = self.cursor_unbuffered.fetchmany(copy_limit)
-			if len(csv_results) == 0:
-				break
-			csv_data="\n".join(d[0] for d in csv_results )
-			
-			if self.copy_mode == 'direct':
-				csv_file = io.StringIO()
-				csv_file.write(csv_data)
-				csv_file.seek(0)
-
-			if self.copy_mode == 'file':
-				csv_file = codecs.open(out_file, 'wb', self.charset)
-				csv_file.write(csv_data)
-				csv_file.close()
-				csv_file = open(out_file, 'rb')
+			if self.copy_snapshot:
+				master_status = self.copy_snapshot
+			else:
+				lock_start = time.time()
+				self.lock_table(schema, table)
+				master_status = self.get_master_coordinates()
+				if self.copy_lock == 'snapshot':
+					table_snapshot = True
+					self.start_copy_snapshot(master_status)
+					self.logger.debug("unlocking the table `%s`.`%s`" % (schema, table) )
+					sql_unlock = "UNLOCK TABLES;" 
+					self.cursor_buffered.execute(sql_unlock)
+					self.logger.info("The table %s.%s was locked for %.3f seconds" % (schema, table, time.time() - lock_start))
+			select_columns = self.generate_select_statements(schema, table)
+			key_columns = ["`%s`" % column_name for index in self.__get_index_data(schema, table) if index["index_name"] == 'PRIMARY' for column_name in index["index_columns"].split(',')]
+			if key_columns:
+				key_select = ",%s" % ",".join(key_columns)
+				key_order = " ORDER BY %s" % ",".join(key_columns)
+			else:
+				key_select = ""
+				key_order = ""
+			slice_keys = {}
+			sql_csv = "SELECT %s as data%s FROM `%s`.`%s`%s%s;" % (select_columns["select_csv"], key_select, schema, table, chunk_filter, key_order)
+			column_list = select_columns["column_list"]
+			self.logger.debug("Executing query for table %s.%s"  % (schema, table ))
+			if not self.copy_snapshot:
+				self.connect_db_unbuffered()
 			try:
-				self.pg_engine.copy_data(csv_file, loading_schema, table, column_list)
-			except:
-				self.logger.info("Table %s.%s error in PostgreSQL copy, saving slice number for the fallback to insert statements " %  (loading_schema, table ))
-				slice_insert.append(slice)
+				self.cursor_unbuffered.execute(sql_csv)
+			except pymysql.Error as e:
+				self.logger.debug("Could not get data from table %s.%s"  % (schema, table ))
+				print('Got error {!r}, errno is {}'.format(e, e.args[0]))
+			if self.copy_mode == 'direct':
+				copy_encoding = self.pg_engine.get_client_encoding()
+			else:
+				copy_encoding = self.charset
+			while True:
+				csv_stream = copy_stream(self.cursor_unbuffered, copy_limit, copy_encoding)
+				if not csv_stream.has_rows():
+					break
+				if self.copy_mode == 'file':
+					with open(out_file, 'wb') as csv_out:
+						copyfileobj(csv_stream, csv_out)
+					csv_file = open(out_file, 'rb')
+				else:
+					csv_file = csv_stream
+				try:
+					self.pg_engine.copy_data(csv_file, loading_schema, table, column_list)
+				except:
+					self.logger.info("Table %s.%s error in PostgreSQL copy, saving slice number for the fallback to insert statements " %  (loading_schema, table ))
+					slice_insert.append(slice)
+					csv_stream.skip_rows()
+					slice_keys[slice] = (csv_stream.first_key, csv_stream.last_key)
 				
-			self.print_progress(slice+1,total_slices, schema, table)
-			slice+=1
+				self.print_progress(slice+1,total_slices, schema, table)
+				slice+=1
 
-			csv_file.close()
-		self.cursor_unbuffered.close()
-		self.disconnect_db_unbuffered()
-		if len(slice_insert)>0:
-			ins_arg={}
-			ins_arg["slice_insert"] = slice_insert
-			ins_arg["table"] = table
-			ins_arg["schema"] = schema
-			ins_arg["select_stat"] = select_columns["select_stat"]
-			ins_arg["column_list"] = column_list
-			ins_arg["copy_limit"] = copy_limit
-			self.insert_table_data(ins_arg)
-		
+				csv_file.close()
+				csv_stream.close()
+			if not self.copy_snapshot:
+				self.cursor_unbuffered.close()
+				self.disconnect_db_unbuffered()
+			if len(slice_insert)>0:
+				ins_arg={}
+				ins_arg["slice_insert"] = slice_insert
+				ins_arg["table"] = table
+				ins_arg["schema"] = schema
+				ins_arg["select_stat"] = select_columns["select_stat"]
+				ins_arg["column_list"] = column_list
+				ins_arg["copy_limit"] = copy_limit
+				ins_arg["chunk_filter"] = chunk_filter
+				ins_arg["key_columns"] = key_columns
+				ins_arg["slice_keys"] = slice_keys
+				self.insert_table_data(ins_arg)
+			if copy_chunk:
+				self.logger.info("Table %s.%s copied chunk %s of %s" % (schema, table, copy_chunk["number"], copy_chunk["total"]))
+		finally:
+			if table_snapshot:
+				self.copy_snapshot = None
+				self.disconnect_db_unbuffered()
+				self.disconnect_db_buffered()
 		
-		self.logger.debug("unlocking the table `%s`.`%s`" % (schema, table) )
-		sql_unlock = "UNLOCK TABLES;" 
-		self.cursor_buffered.execute(sql_unlock)
+		if not table_snapshot and not self.copy_snapshot:
+			self.logger.debug("unlocking the table `%s`.`%s`" % (schema, table) )
+			sql_unlock = "UNLOCK TABLES;" 
+			self.cursor_buffered.execute(sql_unlock)
+			self.logger.info("The table %s.%s was locked for %.3f seconds" % (schema, table, time.time() - lock_start))
 		self.disconnect_db_buffered()
 		
 		try:
@@ -563,10 +840,12 @@ class mysql_source(object):
 			This method is a fallback procedure whether copy_table_data fails.
 			The ins_args is a list with the informations required to run the select for building the insert
 			statements and the slices's start and stop.
-			The process is performed in memory and can take a very long time to complete.
+			If the table has a primary key each slice is selected by the range between the keys of the slice's first and last row, 
+			otherwise the slice is selected with limit and offset.
+			The rows are fetched and inserted in groups of 1000 rows.
 			
 			:param pg_engine: the postgresql engine
-			:param ins_arg: the list with the insert arguments (slice_insert, schema, table, select_stat,column_list, copy_limit)
+			:param ins_arg: the list with the insert arguments (slice_insert, schema, table, select_stat,column_list, copy_limit, chunk_filter, key_columns, slice_keys)
 		"""
 		slice_insert= ins_arg["slice_insert"]
 		table = ins_arg["table"]
@@ -574,18 +853,33 @@ class mysql_source(object):
 		select_stat = ins_arg["select_stat"]
 		column_list = ins_arg["column_list"]
 		copy_limit = ins_arg["copy_limit"] 
-		self.connect_db_unbuffered()
+		chunk_filter = ins_arg["chunk_filter"]
+		key_columns = ins_arg["key_columns"]
+		slice_keys = ins_arg["slice_keys"]
+		if not self.copy_snapshot:
+			self.connect_db_unbuffered()
 		loading_schema = self.schema_loading[schema]["loading"]
 		num_insert = 1
 		for slice in slice_insert:
 			self.logger.info("Executing inserts in %s.%s. Slice %s. Rows per slice %s." %  (loading_schema, table, num_insert, copy_limit ,   ))
-			offset = slice*copy_limit
-			sql_fallback = "SELECT %s FROM `%s`.`%s` LIMIT %s, %s;" % (select_stat, schema, table, offset, copy_limit)
+			if key_columns:
+				first_key, last_key = slice_keys[slice]
+				key_list = "(%s)" % ",".join(key_columns)
+				first_values = "(%s)" % ",".join([self.conn_unbuffered.escape(key_value) for key_value in first_key])
+				last_values = "(%s)" % ",".join([self.conn_unbuffered.escape(key_value) for key_value in last_key])
+				sql_fallback = "SELECT %s FROM `%s`.`%s` WHERE %s>=%s AND %s<=%s ORDER BY %s;" % (select_stat, schema, table, key_list, first_values, key_list, last_values, ",".join(key_columns))
+			else:
+				offset = slice*copy_limit
+				sql_fallback = "SELECT %s FROM `%s`.`%s`%s LIMIT %s, %s;" % (select_stat, schema, table, chunk_filter, offset, copy_limit)
 			self.cursor_unbuffered.execute(sql_fallback)
-			insert_data =  self.cursor_unbuffered.fetchall()
-			self.pg_engine.insert_data(loading_schema, table, insert_data , column_list)
+			while True:
+				insert_data =  self.cursor_unbuffered.fetchmany(1000)
+				if len(insert_data) == 0:
+					break
+				self.pg_engine.insert_data(loading_schema, table, insert_data , column_list)
 			num_insert +=1
-		self.disconnect_db_unbuffered()
+		if not self.copy_snapshot:
+			self.disconnect_db_unbuffered()
 		
 	
 	def print_progress (self, iteration, total, schema, table):
@@ -618,6 +912,22 @@ class mysql_source(object):
 		loading_schema = self.schema_loading[schema]["loading"]
 		self.connect_db_buffered()
 		self.logger.debug("Creating indices on table %s.%s " % (schema, table))
+		index_data = self.__get_index_data(schema, table)
+		table_pkey = self.pg_engine.create_indices(loading_schema, table, index_data)
+		self.disconnect_db_buffered()
+		return table_pkey
+	
+	def __get_index_data(self, schema, table):
+		"""
+			The method returns the btree indices of the given table from the information_schema, 
+			with the index name, the uniqueness and the comma separated list of columns.
+			The method assumes there is a buffered database connection active.
+			
+			:param schema: the origin's schema
+			:param table: the table name 
+			:return: the list of dictionaries with the index metadata
+			:rtype: list
+		"""
 		sql_index = """
 			SELECT 
 				index_name,
@@ -636,33 +946,450 @@ class mysql_source(object):
 			;
 		"""
 		self.cursor_buffered.execute(sql_index, (schema, table))
-		index_data = self.cursor_buffered.fetchall()
-		table_pkey = self.pg_engine.create_indices(loading_schema, table, index_data)
-		self.disconnect_db_buffered()
-		return table_pkey
+		return self.cursor_buffered.fetchall()
 		
 		
 	def copy_tables(self):
 		"""
 			The method copies the data between tables, from the mysql schema to the corresponding
 			postgresql loading schema. Before the copy starts the table is locked and then the lock is released.
+			If the source's copy_workers is greater than one the tables are copied by the method __copy_tables_parallel instead.
 		"""
-		
+		try:
+			copy_workers = max(int(self.source_config["copy_workers"]), 1)
+		except KeyError:
+			copy_workers = 1
+		if copy_workers > 1:
+			self.__copy_tables_parallel(copy_workers)
+			return
 		
 		for schema in self.schema_tables:
-			loading_schema = self.schema_loading[schema]["loading"]
-			destination_schema = self.schema_loading[schema]["destination"]
 			table_list = self.schema_tables[schema]
 			for table in table_list:
-				self.logger.info("Copying the source table %s into %s.%s" %(table, loading_schema, table) )
-				try:
-					master_status = self.copy_data(schema, table)
-					table_pkey = self.create_indices(schema, table)
-					self.pg_engine.store_table(destination_schema, table, table_pkey, master_status)
-					self.logger.info("Stored the table %s.%s in the replica schema" %(destination_schema, table, ) )
-				except:
-					self.logger.info("An error occurred when copying the table %s.%s. The table will not be replicated." %(destination_schema, table) )
-				
+				self.__copy_table(schema, table)
+	
+	def __copy_table(self, schema, table):
+		"""
+			The method copies the table's data, creates the indices and stores the table with its log coordinates 
+			in the replica catalogue. If any error happens the table is not stored and won't be replicated.
+			
+			:param schema: the origin's schema
+			:param table: the table name 
+		"""
+		loading_schema = self.schema_loading[schema]["loading"]
+		destination_schema = self.schema_loading[schema]["destination"]
+		self.logger.info("Copying the source table %s into %s.%s" %(table, loading_schema, table) )
+		try:
+			master_status = self.copy_data(schema, table)
+			table_pkey = self.create_indices(schema, table)
+			self.pg_engine.store_table(destination_schema, table, table_pkey, master_status)
+			self.logger.info("Stored the table %s.%s in the replica schema" %(destination_schema, table, ) )
+		except:
+			self.logger.info("An error occurred when copying the table %s.%s. The table will not be replicated." %(destination_schema, table) )
+	
+	def __copy_tables_parallel(self, copy_workers):
+		"""
+			The method copies the tables using copy_workers processes, each one with its own MySQL and PostgreSQL connections.
+			The workers are processes and not threads, so the python work of fetching, decoding and encoding the rows 
+			runs in parallel and is not serialised by the global interpreter lock.
+			The global read lock is held until all the workers' unbuffered connections have started a transaction 
+			with consistent snapshot, then the lock is released. This way all the workers read the data at the same 
+			log coordinates, which are stored with each table. 
+			The snapshot is consistent only for the transactional storage engines (e.g. InnoDB).
+			The tables are queued from the largest to the smallest, in order to balance the workers' load.
+			The tables larger than the source's copy_split_size are split in primary key ranges by the method __get_copy_chunks, 
+			and each range is queued separately, so the workers copy the large tables' chunks concurrently.
+			The chunks' status is kept in shared memory values, inherited by the workers. For this reason the processes 
+			are always started with the fork method, regardless of the platform's default.
+			When all the workers are finished their exit codes are checked. A worker ended abnormally is logged 
+			with the tables split in chunks left incomplete, which are not replicated.
+			
+			:param copy_workers: the number of copy workers
+		"""
+		self.set_copy_split_size()
+		copy_context = mp.get_context("fork")
+		table_list = []
+		self.chunk_status = {}
+		table_sizes = self.__get_table_sizes()
+		for schema, table, data_length in table_sizes:
+			copy_chunks = None
+			if self.copy_split_size and data_length >= self.copy_split_size:
+				copy_chunks = self.__get_copy_chunks(schema, table)
+			if copy_chunks:
+				self.chunk_status[(schema, table)] = {"pending": copy_context.Value('i', len(copy_chunks)), "failed": copy_context.Value('b', 0)}
+				for copy_chunk in copy_chunks:
+					table_list.append((schema, table, copy_chunk))
+			else:
+				table_list.append((schema, table, None))
+		copy_workers = min(copy_workers, len(table_list))
+		if copy_workers == 0:
+			return
+		self.logger.info("Copying %s tables in %s chunks with %s workers" % (len(table_sizes), len(table_list), copy_workers))
+		table_queue = copy_context.Queue()
+		for table_item in table_list:
+			table_queue.put(table_item)
+		for worker_id in range(copy_workers):
+			table_queue.put(None)
+		snapshot_queue = copy_context.Queue()
+		worker_list = [self.__get_copy_worker(worker_id) for worker_id in range(copy_workers)]
+		copy_processes = []
+		self.connect_db_buffered()
+		self.logger.debug("locking the tables for the consistent snapshot")
+		self.cursor_buffered.execute("FLUSH TABLES WITH READ LOCK;")
+		try:
+			master_status = self.get_master_coordinates()
+			for copy_worker in worker_list:
+				copy_process = copy_context.Process(target=copy_worker.copy_queued_tables, args=(table_queue, snapshot_queue, master_status), name="copy_worker", daemon=True)
+				copy_process.start()
+				copy_processes.append(copy_process)
+			self.__wait_copy_snapshots(copy_processes, snapshot_queue)
+		except:
+			for copy_process in copy_processes:
+				copy_process.terminate()
+			raise
+		finally:
+			self.logger.debug("unlocking the tables")
+			self.cursor_buffered.execute("UNLOCK TABLES;")
+			self.disconnect_db_buffered()
+		self.logger.info("Consistent snapshot taken at the log coordinates %s" % (master_status, ))
+		for copy_process in copy_processes:
+			copy_process.join()
+		self.__check_copy_workers(copy_processes)
+	
+	def __check_copy_workers(self, copy_processes):
+		"""
+			The method checks the copy workers' exit codes after the parallel copy. 
+			Each worker ended abnormally is logged with its exit code. In that case the tables split in chunks with 
+			pending chunks are logged as well, as the worker may have stopped while copying one of their chunks 
+			and the table is not stored in the replica catalogue.
+			
+			:param copy_processes: the list of the copy workers' processes
+			:return: the number of workers ended abnormally
+			:rtype: integer
+		"""
+		failed_workers = [copy_process for copy_process in copy_processes if copy_process.exitcode != 0]
+		for copy_process in failed_workers:
+			self.logger.error("The copy worker %s ended with exit code %s. The table being copied by the worker will not be replicated." % (copy_process.pid, copy_process.exitcode))
+		if failed_workers:
+			for (schema, table), table_chunks in self.chunk_status.items():
+				if table_chunks["pending"].value > 0:
+					self.logger.error("The table %s.%s has %s chunks not copied. The table will not be replicated." % (schema, table, table_chunks["pending"].value))
+		return len(failed_workers)
+	
+	def __wait_copy_snapshots(self, copy_processes, snapshot_queue):
+		"""
+			The method waits until all the copy workers have started the transaction with consistent snapshot.
+			Each worker puts None in the snapshot queue when the snapshot is started, or the error message if the 
+			snapshot failed. An exception is raised if any worker failed or exited without starting the snapshot.
+			
+			:param copy_processes: the list of the copy workers' processes
+			:param snapshot_queue: the queue where the workers report the snapshot's start
+		"""
+		started_snapshots = 0
+		while started_snapshots < len(copy_processes):
+			try:
+				snapshot_error = snapshot_queue.get(timeout=1)
+			except queue.Empty:
+				if [copy_process for copy_process in copy_processes if copy_process.exitcode not in (None, 0)]:
+					raise Exception("A copy worker exited before starting the consistent snapshot")
+				continue
+			if snapshot_error:
+				raise Exception("A copy worker could not start the consistent snapshot: %s" % (snapshot_error, ))
+			started_snapshots += 1
+	
+	def __get_table_sizes(self):
+		"""
+			The method returns the tables to copy ordered by the estimated data size, from the largest to the smallest.
+			
+			:return: the list of tuples with schema, table and data size
+			:rtype: list
+		"""
+		self.connect_db_buffered()
+		sql_size = """
+			SELECT 
+				coalesce(data_length,0) as data_length
+			FROM 
+				information_schema.TABLES 
+			WHERE 
+					table_schema=%s 
+				AND	table_name=%s 
+			;
+		"""
+		table_sizes = []
+		for schema in self.schema_tables:
+			for table in self.schema_tables[schema]:
+				self.cursor_buffered.execute(sql_size, (schema, table))
+				table_size = self.cursor_buffered.fetchone()
+				table_sizes.append((schema, table, table_size["data_length"] if table_size else 0))
+		self.disconnect_db_buffered()
+		return sorted(table_sizes, key=lambda table_size: table_size[2], reverse=True)
+	
+	def __get_copy_worker(self, worker_id):
+		"""
+			The method returns a new mysql_source instance configured for copying the tables, 
+			with a dedicated pg_engine. The connections are opened by the worker's process in copy_queued_tables.
+			The pg_engine's index sequence starts from a different value for each worker, in order to keep 
+			the index names unique within the loading schema.
+			
+			:param worker_id: the worker's number
+			:return: the copy worker
+			:rtype: mysql_source
+		"""
+		copy_worker = mysql_source()
+		copy_worker.source = self.source
+		copy_worker.sources = self.sources
+		copy_worker.source_config = self.source_config
+		copy_worker.logger = self.logger
+		copy_worker.type_override = self.type_override
+		copy_worker.schema_loading = self.schema_loading
+		copy_worker.out_dir = self.out_dir
+		copy_worker.copy_mode = self.copy_mode
+		copy_worker.copy_max_memory = self.copy_max_memory
+		copy_worker.hexify = self.hexify
+		copy_worker.chunk_status = self.chunk_status
+		copy_worker.pg_engine = self.pg_engine.clone_engine()
+		copy_worker.pg_engine.idx_sequence = (worker_id+1)*1000000
+		return copy_worker
+	
+	def start_copy_snapshot(self, master_status):
+		"""
+			The method opens the unbuffered connection and starts a transaction with consistent snapshot.
+			The snapshot is used by copy_data until the method stop_copy_snapshot is called.
+			The method should be called while the global read lock is held, so the snapshot matches master_status.
+			
+			:param master_status: the master's coordinates at the moment of the snapshot
+		"""
+		self.connect_db_unbuffered()
+		self.cursor_unbuffered.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+		self.cursor_unbuffered.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT;")
+		self.copy_snapshot = master_status
+	
+	def stop_copy_snapshot(self):
+		"""
+			The method ends the consistent snapshot and disconnects the worker's connections.
+		"""
+		self.copy_snapshot = None
+		self.disconnect_db_unbuffered()
+		self.pg_engine.disconnect_db()
+	
+	def copy_queued_tables(self, table_queue, snapshot_queue, master_status):
+		"""
+			The method runs in the copy worker's process. The method connects to the destination database and 
+			starts the consistent snapshot, then reports the snapshot's start in the snapshot queue. 
+			The report is flushed before copying, so it reaches the main process even if the worker dies during the copy.
+			The tables are pulled from the queue and copied until the worker's end marker None is found.
+			
+			:param table_queue: the queue with the tuples of schema, table and copy chunk
+			:param snapshot_queue: the queue where the snapshot's start or error is reported
+			:param master_status: the master's coordinates at the moment of the snapshot
+		"""
+		try:
+			self.pg_engine.connect_db()
+			self.start_copy_snapshot(master_status)
+		except:
+			snapshot_queue.put(str(sys.exc_info()[1]))
+			return
+		snapshot_queue.put(None)
+		snapshot_queue.close()
+		snapshot_queue.join_thread()
+		try:
+			while True:
+				table_item = table_queue.get()
+				if table_item is None:
+					break
+				schema, table, copy_chunk = table_item
+				if copy_chunk:
+					self.__copy_table_chunk(schema, table, copy_chunk, self.chunk_status[(schema, table)])
+				else:
+					self.__copy_table(schema, table)
+		finally:
+			self.stop_copy_snapshot()
+	
+	def __copy_table_chunk(self, schema, table, copy_chunk, table_chunks):
+		"""
+			The method copies a chunk of a table split by primary key ranges. 
+			A failed chunk is retried up to the source's copy_chunk_retries times, after removing the chunk's rows 
+			already copied into the loading table. The retry is possible only while the snapshot connection is open.
+			The worker completing the table's last chunk creates the indices and stores the table in the replica catalogue, 
+			unless any chunk failed. In that case the table is not replicated.
+			
+			:param schema: the origin's schema
+			:param table: the table name 
+			:param copy_chunk: the dictionary with the chunk's primary key range
+			:param table_chunks: the dictionary with the shared values of the table's pending chunks and failed flag
+		"""
+		loading_schema = self.schema_loading[schema]["loading"]
+		destination_schema = self.schema_loading[schema]["destination"]
+		try:
+			copy_retries = int(self.source_config["copy_chunk_retries"])
+		except KeyError:
+			copy_retries = 3
+		self.logger.info("Copying the chunk %s of %s of the source table %s into %s.%s" %(copy_chunk["number"], copy_chunk["total"], table, loading_schema, table) )
+		chunk_copied = False
+		master_status = None
+		copy_try = 0
+		while not table_chunks["failed"].value:
+			try:
+				if copy_try > 0:
+					self.logger.warning("Retrying the chunk %s of the table %s.%s. Attempt %s of %s" % (copy_chunk["number"], schema, table, copy_try, copy_retries))
+					self.pg_engine.disconnect_db()
+					self.pg_engine.connect_db()
+					self.pg_engine.delete_copy_chunk(loading_schema, table, copy_chunk)
+					self.cursor_unbuffered = self.conn_unbuffered.cursor()
+				master_status = self.copy_data(schema, table, copy_chunk)
+				chunk_copied = True
+				break
+			except:
+				self.logger.error("An error occurred when copying the chunk %s of the table %s.%s: %s" % (copy_chunk["number"], schema, table, sys.exc_info()[1]))
+				if not self.conn_unbuffered.open:
+					self.logger.error("The snapshot connection is lost, the chunk cannot be retried.")
+					break
+				copy_try += 1
+				if copy_try > copy_retries:
+					break
+		with table_chunks["pending"].get_lock():
+			table_chunks["pending"].value -= 1
+			if not chunk_copied:
+				table_chunks["failed"].value = 1
+			last_chunk = table_chunks["pending"].value == 0
+		if not last_chunk:
+			return
+		if table_chunks["failed"].value:
+			self.logger.info("An error occurred when copying the table %s.%s. The table will not be replicated." %(destination_schema, table) )
+			return
+		try:
+			table_pkey = self.create_indices(schema, table)
+			self.pg_engine.store_table(destination_schema, table, table_pkey, master_status or self.copy_snapshot)
+			self.logger.info("Stored the table %s.%s in the replica schema" %(destination_schema, table, ) )
+		except:
+			self.logger.info("An error occurred when copying the table %s.%s. The table will not be replicated." %(destination_schema, table) )
+	
+	def __get_copy_chunks(self, schema, table):
+		"""
+			The method splits the table in ranges of the primary key, each one with about copy_chunk_rows rows.
+			The split is possible only for the tables with a single column integer primary key. 
+			The ranges are computed from the key's minimum and maximum, the first and the last range are open 
+			in order to include any row added before the snapshot is taken.
+			
+			:param schema: the origin's schema
+			:param table: the table name 
+			:return: the list of dictionaries with the chunks' column, start, end, estimated rows, number and total, None if the table can't be split
+			:rtype: list
+		"""
+		try:
+			chunk_rows = max(int(self.source_config["copy_chunk_rows"]), 1)
+		except KeyError:
+			chunk_rows = 1000000
+		self.connect_db_buffered()
+		index_data = self.__get_index_data(schema, table)
+		pkey_columns = [index["index_columns"] for index in index_data if index["index_name"] == 'PRIMARY']
+		if not pkey_columns or ',' in pkey_columns[0]:
+			self.logger.debug("The table %s.%s has no single column primary key and will be copied in a single chunk" % (schema, table))
+			self.disconnect_db_buffered()
+			return None
+		pkey_column = pkey_columns[0]
+		sql_type = """
+			SELECT 
+				data_type
+			FROM 
+				information_schema.COLUMNS 
+			WHERE 
+					table_schema=%s 
+				AND	table_name=%s 
+				AND	column_name=%s
+			;
+		"""
+		self.cursor_buffered.execute(sql_type, (schema, table, pkey_column))
+		column_type = self.cursor_buffered.fetchone()
+		if not column_type or column_type["data_type"] not in ['tinyint', 'smallint', 'mediumint', 'int', 'bigint']:
+			self.logger.debug("The table %s.%s has no integer primary key and will be copied in a single chunk" % (schema, table))
+			self.disconnect_db_buffered()
+			return None
+		sql_range = """
+			SELECT 
+				MIN(`%s`) as range_start,
+				MAX(`%s`) as range_end,
+				(
+					SELECT 
+						table_rows 
+					FROM 
+						information_schema.TABLES 
+					WHERE 
+							table_schema=%%s 
+						AND	table_name=%%s
+				) as table_rows
+			FROM 
+				`%s`.`%s`
+			;
+		""" % (pkey_column, pkey_column, schema, table)
+		self.cursor_buffered.execute(sql_range, (schema, table))
+		table_range = self.cursor_buffered.fetchone()
+		self.disconnect_db_buffered()
+		if table_range["range_start"] is None:
+			return None
+		total_chunks = -(-int(table_range["table_rows"] or 0) // chunk_rows)
+		if total_chunks < 2:
+			return None
+		range_step = -(-(int(table_range["range_end"]) - int(table_range["range_start"]) + 1) // total_chunks)
+		chunk_bounds = [int(table_range["range_start"]) + range_step*chunk_number for chunk_number in range(1, total_chunks)]
+		chunk_starts = [None] + chunk_bounds
+		chunk_ends = chunk_bounds + [None]
+		copy_chunks = []
+		for chunk_number in range(total_chunks):
+			copy_chunk = {
+				"column": pkey_column, 
+				"start": chunk_starts[chunk_number], 
+				"end": chunk_ends[chunk_number], 
+				"rows": chunk_rows, 
+				"number": chunk_number+1, 
+				"total": total_chunks
+			}
+			copy_chunks.append(copy_chunk)
+		self.logger.info("The table %s.%s will be copied in %s chunks of the primary key %s" % (schema, table, total_chunks, pkey_column))
+		return copy_chunks
+	
+	def __get_chunk_filter(self, copy_chunk):
+		"""
+			The method returns the WHERE condition selecting the copy chunk's primary key range. 
+			If there is no chunk the method returns an empty string.
+			
+			:param copy_chunk: the dictionary with the chunk's primary key range or None
+			:return: the WHERE condition for the chunk
+			:rtype: string
+		"""
+		if not copy_chunk:
+			return ""
+		chunk_filter = []
+		if copy_chunk["start"] is not None:
+			chunk_filter.append("`%s`>=%d" % (copy_chunk["column"], copy_chunk["start"]))
+		if copy_chunk["end"] is not None:
+			chunk_filter.append("`%s`<%d" % (copy_chunk["column"], copy_chunk["end"]))
+		return " WHERE %s" % (" AND ".join(chunk_filter), )
+	
+	
+	def __get_size_setting(self, setting_name, setting_value):
+		"""
+			The method returns the size in bytes of a source setting expressed in bytes or with the suffixes 
+			(k)ilobytes, (M)egabytes or (G)igabytes. 
+			If the value is not valid the error is logged and the process exits.
+			
+			:param setting_name: the setting's name, used in the error message
+			:param setting_value: the setting's value
+			:return: the size in bytes or None if the value is empty
+			:rtype: integer
+		"""
+		size_value = str(setting_value or '')
+		size_scale = size_value[-1:]
+		scale_factor = {'k': 1024, 'M': 1024*1024, 'G': 1024*1024*1024}
+		if not size_value:
+			return None
+		try:
+			if size_scale.isdigit():
+				return int(size_value)
+			return int(size_value[:-1])*scale_factor[size_scale]
+		except (KeyError, ValueError):
+			self.logger.error("Invalid value %s for the parameter %s. The accepted values are bytes or the suffixes (k)ilobytes, (M)egabytes, (G)igabytes." % (setting_value, setting_name))
+			sys.exit(3)
 	
 	def set_copy_max_memory(self):
 		"""
@@ -670,22 +1397,32 @@ class mysql_source(object):
 			source setting.
 
 		"""
-		copy_max_memory = str(self.source_config["copy_max_memory"])[:-1]
-		copy_scale = str(self.source_config["copy_max_memory"])[-1]
+		self.copy_max_memory = self.__get_size_setting("copy_max_memory", self.source_config["copy_max_memory"])
+	
+	def set_copy_split_size(self):
+		"""
+			The method sets the class variable self.copy_split_size using the value stored in the 
+			source setting copy_split_size. The value accepts the same suffixes of copy_max_memory.
+			The tables with data size greater than copy_split_size are copied in primary key ranges by the parallel copy.
+			If the setting is missing or empty the tables are not split.
+		"""
 		try:
-			int(copy_scale)
-			copy_max_memory = self.source_config["copy_max_memory"]
-		except:
-			if copy_scale =='k':
-				copy_max_memory = str(int(copy_max_memory)*1024)
-			elif copy_scale =='M':
-				copy_max_memory = str(int(copy_max_memory)*1024*1024)
-			elif copy_scale =='G':
-				copy_max_memory = str(int(copy_max_memory)*1024*1024*1024)
-			else:
-				print("**FATAL - invalid suffix in parameter copy_max_memory  (accepted values are (k)ilobytes, (M)egabytes, (G)igabytes.")
-				sys.exit(3)
-		self.copy_max_memory = copy_max_memory
+			split_size = self.source_config["copy_split_size"]
+		except KeyError:
+			split_size = None
+		self.copy_split_size = self.__get_size_setting("copy_split_size", split_size)
+	
+	def set_replica_batch_bytes(self):
+		"""
+			The method sets the class variable self.replica_batch_bytes using the value stored in the 
+			source setting replica_batch_bytes. The value accepts the same suffixes of copy_max_memory.
+			If the setting is missing or empty the batches are limited only by replica_batch_size.
+		"""
+		try:
+			batch_bytes = self.source_config["replica_batch_bytes"]
+		except KeyError:
+			batch_bytes = None
+		self.replica_batch_bytes = self.__get_size_setting("replica_batch_bytes", batch_bytes)
 	
 	def __init_read_replica(self):
 		"""
@@ -702,7 +1439,28 @@ class mysql_source(object):
 		self.limit_tables = self.source_config["limit_tables"]
 		self.skip_tables = self.source_config["skip_tables"]
 		self.replica_batch_size = self.source_config["replica_batch_size"]
+		self.set_replica_batch_bytes()
 		self.sleep_loop = self.source_config["sleep_loop"]
+		try:
+			self.keep_stream_open = self.source_config["keep_stream_open"]
+		except KeyError:
+			self.keep_stream_open = False
+		try:
+			self.replica_batch_seconds = self.source_config["replica_batch_seconds"]
+		except KeyError:
+			self.replica_batch_seconds = 0
+		try:
+			self.replica_compaction = self.source_config["replica_compaction"]
+		except KeyError:
+			self.replica_compaction = False
+		try:
+			self.replica_changed_columns = self.source_config["replica_changed_columns"]
+		except KeyError:
+			self.replica_changed_columns = False
+		try:
+			self.pg_engine.copy_min_rows = max(int(self.source_config["replica_copy_min_rows"]), 1)
+		except KeyError:
+			self.pg_engine.copy_min_rows = 10
 		self.hexify = [] + self.hexify_always
 		try:
 			self.connect_db_buffered()
@@ -712,6 +1470,7 @@ class mysql_source(object):
 			else: 
 				return "skip"
 		self.pg_engine.connect_db()
+		self.pg_engine.set_synchronous_commit()
 		self.schema_mappings = self.pg_engine.get_schema_mappings()
 		self.schema_replica = [schema for schema in self.schema_mappings]
 		db_conn = self.source_config["db_conn"]
@@ -720,10 +1479,8 @@ class mysql_source(object):
 		self.replica_conn["passwd"] = str(db_conn["password"])
 		self.replica_conn["port"] = int(db_conn["port"])
 		self.build_table_exceptions()
+		self.__build_stream_filters()
 		self.__check_mysql_config()
-		if self.gtid_mode:
-			master_data = self.get_master_coordinates()
-			self.start_xid = master_data[0]["Executed_Gtid_Set"].split(':')[1].split('-')[0]
 
 	
 	def init_sync(self):
@@ -738,6 +1495,10 @@ class mysql_source(object):
 			sys.exit()
 		self.out_dir = self.source_config["out_dir"]
 		self.copy_mode = self.source_config["copy_mode"]
+		try:
+			self.copy_lock = self.source_config["copy_lock"]
+		except KeyError:
+			self.copy_lock = 'table'
 		self.pg_engine.lock_timeout = self.source_config["lock_timeout"]
 		self.pg_engine.grant_select_to = self.source_config["grant_select_to"]
 		self.set_copy_max_memory()
@@ -780,6 +1541,7 @@ class mysql_source(object):
 			self.disconnect_db_buffered()
 			self.pg_engine.set_source_highwatermark(master_end, consistent=False)
 			self.pg_engine.cleanup_table_events()
+			self.pg_engine.clean_table_type_map()
 			notifier_message = "refresh schema %s for source %s is complete" % (self.schema, self.source)
 			self.notifier.send_message(notifier_message, 'info')
 			self.logger.info(notifier_message)
@@ -834,6 +1596,7 @@ class mysql_source(object):
 			self.disconnect_db_buffered()
 			self.pg_engine.set_source_highwatermark(master_end, consistent=False)
 			self.pg_engine.cleanup_table_events()
+			self.pg_engine.clean_table_type_map()
 			notifier_message = "the sync for tables %s in source %s is complete" % (self.tables, self.source)
 			self.notifier.send_message(notifier_message, 'info')
 			self.logger.info(notifier_message)
@@ -850,49 +1613,486 @@ class mysql_source(object):
 			The method builds a dictionary with a key per each schema replicated.
 			Each key maps a dictionary with the schema's tables stored as keys and the column/type mappings.
 			The dictionary is used in the read_replica method, to determine whether a field requires hexadecimal conversion.
+
+			The map is built only once and is kept in the class attribute table_type_map.
+			When the map is empty the method tries to load it from the replica catalogue.
+			The schemas not present in the map are collected from the information_schema and saved in the replica catalogue.
+			The DDL captured by the read replica keeps the map up to date using the method refresh_table_type.
+			If the map's version stored in the replica catalogue changes, because the map was removed by a sync or an init_replica, 
+			the map and the row plans kept in memory are discarded and built again.
+			When the compaction is enabled the tables linked by foreign keys in the target database are loaded 
+			together with the map, in order to exclude them from the compaction.
+
+			:return: the table type map
+			:rtype: dictionary
 		"""
-		table_type_map = {}
-		table_map = {}
-		self.logger.debug("collecting table type map")
-		for schema in self.schema_replica:
-			sql_tables = """	
-				SELECT 
-					table_schema,
-					table_name
-				FROM 
-					information_schema.TABLES 
-				WHERE 
-						table_type='BASE TABLE' 
-					AND	table_schema=%s
-				;
-			"""
-			self.cursor_buffered.execute(sql_tables, (schema, ))
-			table_list = self.cursor_buffered.fetchall()
-			
-			for table in table_list:
-				column_type = {}
-				sql_columns = """
-					SELECT 
-						column_name,
-						data_type
-					FROM 
-						information_schema.COLUMNS 
-					WHERE 
-							table_schema=%s
-						AND table_name=%s
-					ORDER BY 
-						ordinal_position
+		type_map_version = self.pg_engine.get_type_map_version()
+		if type_map_version != self.type_map_version:
+			if self.type_map_version is not None:
+				self.logger.info("The table type map for source %s changed. Discarding the type map and the row plans." % (self.source, ))
+			self.table_type_map = {}
+			self.row_plans = {}
+			self.type_map_version = type_map_version
+			if self.replica_compaction:
+				self.fk_tables = self.pg_engine.get_table_groups()
+		if not self.table_type_map:
+			self.table_type_map = self.pg_engine.get_table_type_map()
+		schema_missing = [schema for schema in self.schema_replica if schema not in self.table_type_map]
+		if schema_missing:
+			schema_map = {}
+			self.logger.debug("collecting table type map for the schemas %s" % (', '.join(schema_missing), ))
+			for schema in schema_missing:
+				sql_tables = """
+					SELECT
+						table_schema,
+						table_name
+					FROM
+						information_schema.TABLES
+					WHERE
+							table_type='BASE TABLE'
+						AND	table_schema=%s
 					;
 				"""
-				self.cursor_buffered.execute(sql_columns, (table["table_schema"], table["table_name"]))
-				column_data = self.cursor_buffered.fetchall()
-				for column in column_data:
-					column_type[column["column_name"]] = column["data_type"]
-				table_map[table["table_name"]] = column_type
-			table_type_map[schema] = table_map
-			table_map = {}
-		return table_type_map
+				self.cursor_buffered.execute(sql_tables, (schema, ))
+				table_list = self.cursor_buffered.fetchall()
+				table_map = {}
+				for table in table_list:
+					table_map[table["table_name"]] = self.__get_column_types(table["table_schema"], table["table_name"])
+				schema_map[schema] = table_map
+			self.pg_engine.save_table_type_map(schema_map)
+			self.table_type_map.update(schema_map)
+		return self.table_type_map
+
+	def __get_column_types(self, schema, table):
+		"""
+			The method collects the column/type mappings for the given table from the information_schema.
+
+			:param schema: the table's schema
+			:param table: the table's name
+			:return: the dictionary with the column names as keys and the data types as values
+			:rtype: dictionary
+		"""
+		column_type = {}
+		sql_columns = """
+			SELECT
+				column_name,
+				data_type
+			FROM
+				information_schema.COLUMNS
+			WHERE
+					table_schema=%s
+				AND table_name=%s
+			ORDER BY
+				ordinal_position
+			;
+		"""
+		self.cursor_buffered.execute(sql_columns, (schema, table))
+		column_data = self.cursor_buffered.fetchall()
+		for column in column_data:
+			column_type[column["column_name"]] = column["data_type"]
+		return column_type
+
+	def refresh_table_type(self, schema, token):
+		"""
+			The method updates the table type map for the table affected by the tokenised DDL.
+			CREATE TABLE and ALTER TABLE reload the table's column types from the information_schema,
+			DROP TABLE removes the table from the map and RENAME TABLE moves the column types under the new table's name.
+			Any change is saved in the replica catalogue.
+
+			:param schema: the origin's schema where the DDL was executed
+			:param token: the tokenised DDL
+		"""
+		if schema not in self.table_type_map:
+			return
+		schema_map = self.table_type_map[schema]
+		command = token["command"]
+		table_refresh = None
+		if command in ["CREATE TABLE", "ALTER TABLE"]:
+			table_refresh = token["name"]
+		elif command == "RENAME TABLE":
+			schema_map.pop(token["name"], None)
+			self.row_plans.pop((schema, token["name"]), None)
+			self.pg_engine.delete_table_type(schema, token["name"])
+			table_refresh = token["new_name"]
+		elif command == "DROP TABLE":
+			schema_map.pop(token["name"], None)
+			self.row_plans.pop((schema, token["name"]), None)
+			self.pg_engine.delete_table_type(schema, token["name"])
+
+		if table_refresh:
+			self.__load_table_type(schema, table_refresh)
+
+	def __load_table_type(self, schema, table):
+		"""
+			The method reloads the column types for a single table from the information_schema and 
+			stores them in the table type map and in the replica catalogue.
+			If the table no longer exists then it's removed from the map.
+
+			:param schema: the origin's schema name
+			:param table: the table's name
+			:return: the dictionary with the column names as keys and the data types as values
+			:rtype: dictionary
+		"""
+		schema_map = self.table_type_map.setdefault(schema, {})
+		self.row_plans.pop((schema, table), None)
+		column_type = self.__get_column_types(schema, table)
+		if column_type:
+			self.logger.debug("refreshing the table type map for the table %s.%s" % (schema, table))
+			schema_map[table] = column_type
+			self.pg_engine.save_table_type(schema, table, column_type)
+		else:
+			schema_map.pop(table, None)
+			self.pg_engine.delete_table_type(schema, table)
+		return column_type
+
+	
+	def __get_stream_events(self, my_stream):
+		"""
+			The method yields the events read from the replica stream.
+			If the previous call left an event not processed in the class attribute stream_pending, 
+			the event is returned before reading the stream.
+			
+			:param my_stream: the BinLogStreamReader object
+			:return: the binlog events
+			:rtype: generator
+		"""
+		if self.stream_pending:
+			binlogevent = self.stream_pending
+			self.stream_pending = None
+			yield binlogevent
+		for binlogevent in my_stream:
+			yield binlogevent
+	
+	def close_stream(self):
+		"""
+			The method closes the replica stream kept open when the source's parameter keep_stream_open is set.
+			The next read_replica call connects the stream again using the coordinates of the current batch.
+		"""
+		if self.my_stream:
+			try:
+				self.my_stream.close()
+			except:
+				pass
+		self.my_stream = None
+		self.stream_pending = None
+	
+	def __reset_stream(self, stream_error):
+		"""
+			The method discards the stream kept open after a failure.
+			The rows already stored for the current batch are removed from the log tables and the in memory 
+			list of consistent tables is cleared, so the next read_replica call reads again the batch 
+			from its starting coordinates.
+			If the batch writer failed as well its error is raised chained to the stream's error.
+			
+			:param stream_error: the exception raised by the replica stream
+		"""
+		self.close_stream()
+		try:
+			self.__wait_batch_writer()
+		except Exception as writer_error:
+			raise writer_error from stream_error
+		self.tables_consistent = []
+		self.pg_engine.clean_not_processed_batches()
+	
+	def __start_batch_writer(self):
+		"""
+			The method starts the batch writer thread, if not already running.
+			The read replica stream puts the row events in the bounded queue batch_queue and the writer thread 
+			stores them in PostgreSQL using a dedicated connection. This way the binlog decoding and the write
+			of the previous group of rows run at the same time.
+		"""
+		if self.batch_writer and self.batch_writer.is_alive():
+			return
+		self.writer_engine = self.pg_engine.clone_engine()
+		self.writer_engine.connect_db()
+		self.writer_engine.set_synchronous_commit()
+		self.batch_queue = queue.Queue(maxsize=2)
+		self.writer_error = None
+		self.batch_writer = threading.Thread(target=self.__write_batches, name="batch_writer")
+		self.batch_writer.daemon = True
+		self.batch_writer.start()
+	
+	def __write_batches(self):
+		"""
+			The method runs in the batch writer thread. The groups of rows are pulled from the queue batch_queue
+			and stored in the log tables using the writer's connection.
+			Should any error happen the exception is saved in the class attribute writer_error and the 
+			following groups are discarded until the error is raised by the method __wait_batch_writer.
+		"""
+		while True:
+			group_insert = self.batch_queue.get()
+			try:
+				if self.writer_error is None:
+					self.writer_engine.write_batch(group_insert)
+			except Exception as e:
+				self.writer_error = e
+			finally:
+				self.batch_queue.task_done()
+	
+	def __queue_batch(self, group_insert):
+		"""
+			The method puts the group of rows in the writer queue. If the queue is full the method waits 
+			for the writer to complete the oldest group.
+			
+			If the compaction is enabled for the batch the row events are compacted with the method __compact_rows before 
+			they are queued.
+			
+			:param group_insert: the list with the row events to store
+		"""
+		if self.writer_error:
+			self.__wait_batch_writer()
+		if self.batch_compaction:
+			self.read_stats["events_read"] += len(group_insert)
+			group_insert = self.__compact_rows(group_insert)
+			self.read_stats["events_written"] += len(group_insert)
+		self.batch_queue.put(group_insert)
+	
+	def __compact_rows(self, group_insert):
+		"""
+			The method collapses the row events changing the same primary key into the minimal net event.
+			The events are compacted only for the tables with a primary key, the key is stored in the event's key row_key 
+			as a tuple with the key before and after the event. Each key is built with the destination schema, 
+			the table name and the primary key values.
+			
+			An insert followed by updates becomes an insert with the final image. 
+			An update followed by updates becomes a single update with the first before image and the after images merged, 
+			so the primary key changes are replayed using the original key and the updates storing only the changed columns 
+			keep all the changes.
+			An insert followed by a delete is removed. An update followed by a delete becomes a delete of the first before image.
+			
+			An event is merged only if no event for another key of the same table sits between the event and the previous 
+			event of its chain, so the compaction never reorders the rows of a table and can't break the unique constraints.
+			The compacted event takes the place and the binlog coordinates of the first event in the chain. 
+			If the batch is read again from a binlog position within the chain, the following events of the chain are 
+			replayed again and lead to the same final image.
+			The events of other tables may be moved across the chain, therefore the row plan excludes from the compaction 
+			the tables linked by foreign keys in the target database.
+			
+			:param group_insert: the list with the row events to compact
+			:return: the list with the compacted row events
+			:rtype: list
+		"""
+		compacted_rows = []
+		row_index = {}
+		table_last = {}
+		for row_event in group_insert:
+			row_key = row_event.get("row_key")
+			if not row_key:
+				compacted_rows.append(row_event)
+				continue
+			key_before, key_after = row_key
+			table_key = key_before[:2]
+			action = row_event["global_data"]["action"]
+			position = None
+			if action != "insert" and table_last.get(table_key) == key_before:
+				position = row_index.pop(key_before, None)
+			table_last[table_key] = key_after
+			if position is None:
+				if action != "delete":
+					row_index[key_after] = len(compacted_rows)
+				compacted_rows.append(row_event)
+				continue
+			previous_event = compacted_rows[position]
+			previous_global = previous_event["global_data"]
+			previous_key = previous_event["row_key"][0]
+			if action == "delete":
+				if previous_global["action"] == "insert":
+					compacted_rows[position] = None
+					continue
+				global_delete = dict(previous_global.items())
+				global_delete["action"] = "delete"
+				compacted_rows[position] = {"global_data": global_delete, "event_after": previous_event["event_before"], "event_before": {}, "row_key": (previous_key, previous_key)}
+			else:
+				event_after = dict(previous_event["event_after"].items())
+				event_after.update(row_event["event_after"])
+				compacted_rows[position] = {"global_data": previous_global, "event_after": event_after, "event_before": previous_event["event_before"], "row_key": (previous_key, key_after)}
+				row_index[key_after] = position
+		return [row_event for row_event in compacted_rows if row_event is not None]
+	
+	def __get_changed_columns(self, event_after, event_before, pkey):
+		"""
+			The method reduces the update's row images to the columns required by the replay.
+			The after image keeps the primary key and the changed columns, the before image keeps only the primary key.
+			The replay functions build the SET list from the after image's keys and the WHERE condition from the primary key.
+			
+			:param event_after: the row image after the update
+			:param event_before: the row image before the update
+			:param pkey: the list of the primary key columns
+			:return: the reduced after and before images
+			:rtype: tuple
+		"""
+		changed_after = {column_name: column_value for column_name, column_value in event_after.items() if column_name in pkey or column_name not in event_before or event_before[column_name] != column_value}
+		changed_before = {column_name: event_before[column_name] for column_name in pkey if column_name in event_before}
+		return (changed_after, changed_before)
+	
+	def __get_row_key(self, schema, table, pkey, row_image):
+		"""
+			The method returns the key used by the compaction for the row image.
+			
+			:param schema: the destination schema
+			:param table: the table's name
+			:param pkey: the list of the primary key columns
+			:param row_image: the row image dictionary
+			:return: the tuple with schema, table and the primary key values
+			:rtype: tuple
+		"""
+		return (schema, table, tuple([row_image.get(column_name) for column_name in pkey]))
+	
+	def __wait_batch_writer(self):
+		"""
+			The method waits for the writer thread to store all the queued rows. 
+			The method is used before writing a DDL and before closing the batch, in order to keep the events 
+			and the batch's coordinates consistent. Any error happened in the writer thread is raised.
+		"""
+		if not self.batch_writer:
+			return
+		self.batch_queue.join()
+		if self.writer_error:
+			writer_error = self.writer_error
+			self.writer_error = None
+			raise writer_error
+	
+	def __check_consistent_point(self, destination_schema, obfuscated_schema, table, binlog_coordinates):
+		"""
+			The method checks whether the table's consistent point is reached using the in memory index consistent_points.
+			The index is keyed by destination schema and table name and stores the consistent point
+			as a tuple with the binlog sequence and the binlog position.
+			When the consistent point is reached the table is removed from the index and added to the list tables_consistent,
+			which is saved in the replica catalogue when the batch is closed.
+			
+			:param destination_schema: the table's destination schema in clear
+			:param obfuscated_schema: the table's obfuscated schema 
+			:param table: the table's name
+			:param binlog_coordinates: the event's coordinates as a tuple with the binlog sequence and the binlog position
+			:return: true if the table is consistent, false otherwise
+			:rtype: boolean
+		"""
+		try:
+			consistent_point = self.consistent_points[(destination_schema, table)]
+		except KeyError:
+			return True
+		if binlog_coordinates >= consistent_point:
+			self.logger.info("CONSISTENT POINT FOR TABLE %s.%s REACHED  - binlog sequence %s, position %s" % (destination_schema, table, binlog_coordinates[0], binlog_coordinates[1]))
+			del self.consistent_points[(destination_schema, table)]
+			self.tables_consistent.append((destination_schema, table))
+			self.tables_consistent.append((obfuscated_schema, table))
+			return True
+		return False
 	
+	def __get_row_plan(self, schema, table):
+		"""
+			The method returns the row plan for the given table, building it if not already present in the class attribute row_plans.
+			The row plan lists only the columns requiring the conversion to hexadecimal string and the columns 
+			requiring obfuscation, so the rows without those columns don't need any per column processing.
+			When the compaction or the changed columns mode are enabled the plan stores also the table's primary key. 
+			The key is not set if any of the primary key columns is obfuscated, as the obfuscated copies could not be matched by key.
+			The flag compact is set if the table's events can be compacted, the tables linked by foreign keys are excluded.
+			The plan is built from the table type map and the obfuscation settings and is discarded when a DDL changes the table, 
+			or together with the type map when the map's version changes.
+			
+			:param schema: the origin's schema name
+			:param table: the table's name
+			:return: the dictionary with the keys columns, hexify, obfuscate, pkey and compact
+			:rtype: dictionary
+		"""
+		try:
+			return self.row_plans[(schema, table)]
+		except KeyError:
+			pass
+		try:
+			column_map = self.table_type_map[schema][table]
+		except KeyError:
+			column_map = self.__load_table_type(schema, table)
+		try:
+			table_obfuscation = self.obfuscation[schema][table]
+		except:
+			table_obfuscation = None
+		row_plan = {}
+		row_plan["columns"] = set(column_map)
+		row_plan["size"] = sum([len(column_name) + 6 for column_name in column_map])
+		row_plan["hexify"] = [column_name for column_name in column_map if column_map[column_name] in self.hexify]
+		if table_obfuscation:
+			row_plan["obfuscate"] = [(column_name, table_obfuscation[column_name]) for column_name in table_obfuscation]
+		else:
+			row_plan["obfuscate"] = []
+		row_plan["pkey"] = None
+		row_plan["compact"] = False
+		if self.replica_compaction or self.replica_changed_columns:
+			table_pkey = self.pg_engine.get_table_pkey(self.schema_mappings[schema]["clear"], table)
+			obfuscated_columns = [column_name for column_name, obf_mode in row_plan["obfuscate"]]
+			if table_pkey and not set(table_pkey).intersection(obfuscated_columns):
+				row_plan["pkey"] = table_pkey
+				fk_linked = (self.schema_mappings[schema]["clear"], table) in self.fk_tables or (self.schema_mappings[schema]["obfuscate"], table) in self.fk_tables
+				row_plan["compact"] = self.replica_compaction and not fk_linked
+		self.row_plans[(schema, table)] = row_plan
+		return row_plan
+	
+	def __get_image_size(self, row_image, row_plan):
+		"""
+			The method returns the estimated size in bytes of the row image once serialised as json.
+			The size of the keys and of the json punctuation is taken from the row plan, the strings and the bytes
+			are measured with their length and any other value is counted as 8 bytes.
+			
+			:param row_image: the row image dictionary
+			:param row_plan: the table's row plan
+			:return: the estimated size in bytes
+			:rtype: integer
+		"""
+		image_size = row_plan["size"]
+		for column_value in row_image.values():
+			if isinstance(column_value, (str, bytes)):
+				image_size += len(column_value)
+			else:
+				image_size += 8
+		return image_size
+	
+	def __hexify_row(self, row_image, hexify_columns):
+		"""
+			The method converts in place the values of the columns listed in hexify_columns to hexadecimal strings.
+			
+			:param row_image: the row image dictionary
+			:param hexify_columns: the list of columns requiring the conversion
+		"""
+		for column_name in hexify_columns:
+			column_value = row_image.get(column_name)
+			if column_value:
+				row_image[column_name] = binascii.hexlify(column_value).decode()
+			elif isinstance(column_value, bytes):
+				row_image[column_name] = ''
+	
+	def __build_stream_filters(self):
+		"""
+			The method builds the table filters passed to the BinLogStreamReader, in order to skip the events for the tables
+			excluded by limit_tables and skip_tables before the rows are decoded.
+			As the reader's filters apply to the table name only, regardless of the schema, the lists are built in order
+			to never exclude a table which is replicated in any of the replicated schemas. 
+			The method __store_binlog_event remains the exact filter for the schema and table pairs.
+			
+			The list stream_only_tables is set only if all the replicated schemas have a limit_tables list.
+			The list stream_ignored_tables contains the tables listed in skip_tables which are not stored in any replicated schema.
+		"""
+		self.stream_only_tables = None
+		self.stream_ignored_tables = None
+		if self.schema_replica and all([self.limit_tables.get(schema) for schema in self.schema_replica]):
+			self.stream_only_tables = sorted({table for schema in self.schema_replica for table in self.limit_tables[schema]})
+		skip_list = {table for schema in self.skip_tables for table in self.skip_tables[schema]}
+		ignored_tables = [table for table in skip_list if not any([self.__store_binlog_event(table, schema) for schema in self.schema_replica])]
+		if ignored_tables:
+			self.stream_ignored_tables = sorted(ignored_tables)
+		self.logger.debug("Stream filters - only tables: %s, ignored tables: %s" % (self.stream_only_tables, self.stream_ignored_tables))
+	
+	def __log_read_stats(self):
+		"""
+			The method logs the number of rows read from the replica stream and stored in the log tables, with the rate 
+			in rows per second, and the number of row events discarded because of the tables filters or consistency.
+		"""
+		read_time = time.time() - self.read_stats["start"]
+		if self.read_stats["rows"] or self.read_stats["events_skipped"]:
+			rows_second = self.read_stats["rows"] / read_time if read_time > 0 else self.read_stats["rows"]
+			self.logger.info("Read %s rows in %.3f seconds (%.1f rows/s). Row events skipped: %s. Unchanged updates skipped: %s" % (self.read_stats["rows"], read_time, rows_second, self.read_stats["events_skipped"], self.read_stats["updates_skipped"]))
+		if self.read_stats["events_read"]:
+			compaction_ratio = self.read_stats["events_written"] / self.read_stats["events_read"]
+			self.logger.info("Compacted %s row events into %s (ratio %.2f)" % (self.read_stats["events_read"], self.read_stats["events_written"], compaction_ratio))
 	
 	def __store_binlog_event(self, table, schema):
 		"""
@@ -915,26 +2115,6 @@ class mysql_source(object):
 
 		return True
 	
-	def __build_gtid_set(self, gtid):
-		"""
-			The method builds a gtid set using the current gtid and
-		"""
-		new_set = None
-		gtid_pack = []
-		master_data= self.get_master_coordinates()
-		if "Executed_Gtid_Set" in master_data[0]:
-			gtid_set = master_data[0]["Executed_Gtid_Set"]
-			gtid_list = gtid_set.split(",\n")
-			for gtid_item in gtid_list:
-				if gtid_item.split(':')[0] in gtid:
-					gtid_old = gtid_item.split(':')
-					gtid_new = "%s:%s-%s" % (gtid_old[0],gtid_old[1].split('-')[0],gtid[gtid_old[0]])
-					gtid_pack.append(gtid_new)
-				else:
-					gtid_pack.append(gtid_item)
-			new_set = ",\n".join(gtid_pack)
-		return new_set
-		
 	def __read_replica_stream(self, batch_data):
 		"""
 		Stream the replica using the batch data. This method evaluates the different events streamed from MySQL 
@@ -950,15 +2130,34 @@ class mysql_source(object):
 		
 		The for loop reads the row events, builds the dictionary carrying informations like the destination schema,
 		the 	binlog coordinates and store them into the group_insert list.
-		When the number of events exceeds the replica_batch_size the group_insert is written into PostgreSQL.
-		The batch is not closed in that case and the method exits only if there are no more rows available in the stream.
-		Therefore the replica_batch_size is just the maximum size of the single insert and the size of replayed batch on PostgreSQL.
-		The binlog switch or a captured DDL determines whether a batch is closed and processed.
+		When the number of events exceeds the replica_batch_size or the estimated size of the events exceeds the optional
+		replica_batch_bytes the group_insert is written into PostgreSQL and the batch is closed on the next transaction boundary.
+		The binlog switch, a captured DDL or the end of the stream close the batch as well.
+		
+		The write is performed by the batch writer thread, while the stream keeps decoding the following events.
+		The method waits for the writer before writing a DDL and before returning, so the batch's coordinates 
+		are saved only when all the batch's rows are stored.
+		
+		When the source's parameter keep_stream_open is set the BinLogStreamReader is not closed when the method returns
+		and the next call continues to read from the same connection. In that case the method returns on the heartbeat events, 
+		allowing the read daemon to check the pause requests.
+		When the stream is blocking (keep_stream_open or GTID) and replica_batch_seconds is greater than zero the batch 
+		is also closed when replica_batch_seconds are elapsed since the method started and the batch contains rows.
+		
+		The size and the time limits close the batch only on a transaction boundary. With GTID the boundary is 
+		the next GtidEvent, otherwise the transaction's commit (XidEvent or COMMIT query), whose position is saved 
+		as the batch's end. A batch ending in the middle of a transaction would restart the stream after the transaction's 
+		TableMapEvent, and the reader would discard the transaction's remaining rows.
+		The rows read while waiting for the boundary are still written in groups of replica_batch_size.
+		
+		When the compaction is enabled for the batch the size and time limits close the batch without writing the rows, 
+		which are compacted and written all together when the batch ends. This way the compaction covers the whole batch.
 		
 		The update row event stores in a separate key event_before the row image before the update. This is required
 		to allow updates where the primary key is updated as well.
 		
-		Each row event is scanned for data types requiring conversion to hex string.
+		Each row event is processed using the table's row plan, which lists the columns requiring conversion to hex string
+		and the columns requiring obfuscation. The plans are built once and discarded only when a DDL changes the table.
 		
 		:param batch_data: The list with the master's batch data.
 		:return: the batch's data composed by binlog name, binlog position and last event timestamp read from the mysql replica stream.
@@ -967,59 +2166,74 @@ class mysql_source(object):
 		size_insert=0
 		sql_tokeniser = sql_token()
 		
-		table_type_map = self.get_table_type_map()	
-		inc_tables = self.pg_engine.get_inconsistent_tables()
+		self.get_table_type_map()
+		self.__start_batch_writer()
+		self.consistent_points = self.pg_engine.get_inconsistent_tables()
+		self.tables_consistent = []
 		close_batch = False
 		master_data = {}
 		group_insert = []
-		next_gtid = {}
 		
 		id_batch = batch_data[0][0]
 		log_file = batch_data[0][1]
 		log_position = batch_data[0][2]
 		log_table = batch_data[0][3]
+		batch_deadline = time.time() + self.replica_batch_seconds
+		self.read_stats = {"rows": 0, "events_skipped": 0, "updates_skipped": 0, "events_read": 0, "events_written": 0, "start": time.time()}
+		self.batch_compaction = self.replica_compaction and batch_data[0][5] is None
+		gtid_position = None
 		if self.gtid_mode:
-			gtid_position = batch_data[0][4]
-			gtid_pack = gtid_position.split(",\n")
 			blocking = True
-			for gtid in gtid_pack:
-				gtid  = gtid.split(':')
-				next_gtid[gtid [0]]  = gtid [1].split("-")[-1]
-				gtid_set = self.__build_gtid_set(next_gtid)
 		else:
-			blocking = False
-			gtid_set = None
-		stream_connected = False
-		my_stream = BinLogStreamReader(
-			connection_settings = self.replica_conn, 
-			server_id = self.my_server_id, 
-			only_events = [RotateEvent, DeleteRowsEvent, WriteRowsEvent, UpdateRowsEvent, QueryEvent, GtidEvent, HeartbeatLogEvent], 
-			log_file = log_file, 
-			log_pos = log_position, 
-			auto_position = gtid_set, 
-			resume_stream = True, 
-			only_schemas = self.schema_replica, 
-			slave_heartbeat = self.sleep_loop, 
-			blocking = blocking,
-			
-		)
+			blocking = self.keep_stream_open
 		
-		if gtid_set:
-			self.logger.debug("GTID ENABLED - gtid: %s. id_batch: %s " % (gtid_set, id_batch))
+		if self.my_stream:
+			my_stream = self.my_stream
+			binlogfile = self.stream_binlogfile
+			binlog_seq = self.stream_binlog_seq
+			stream_connected = True
 		else:
-			self.logger.debug("GTID DISABLED - log_file %s, log_position %s. id_batch: %s " % (log_file, log_position, id_batch))
+			if self.gtid_mode:
+				self.gtid_executed = gtid_set(batch_data[0][4])
+				gtid_position = str(self.gtid_executed) or None
+			stream_connected = False
+			my_stream = BinLogStreamReader(
+				connection_settings = self.replica_conn, 
+				server_id = self.my_server_id, 
+				only_events = [RotateEvent, DeleteRowsEvent, WriteRowsEvent, UpdateRowsEvent, QueryEvent, GtidEvent, HeartbeatLogEvent, XidEvent], 
+				log_file = log_file, 
+				log_pos = log_position, 
+				auto_position = gtid_position, 
+				resume_stream = True, 
+				only_schemas = self.schema_replica, 
+				only_tables = self.stream_only_tables, 
+				ignored_tables = self.stream_ignored_tables, 
+				slave_heartbeat = self.sleep_loop, 
+				blocking = blocking,
+				
+			)
+			if self.keep_stream_open:
+				self.my_stream = my_stream
 		
-		for binlogevent in my_stream:
+			if gtid_position:
+				self.logger.debug("GTID ENABLED - gtid: %s. id_batch: %s " % (gtid_position, id_batch))
+			else:
+				self.logger.debug("GTID DISABLED - log_file %s, log_position %s. id_batch: %s " % (log_file, log_position, id_batch))
+		
+		for binlogevent in self.__get_stream_events(my_stream):
 			if isinstance(binlogevent, GtidEvent):
 				if close_batch:
+					if self.keep_stream_open:
+						self.stream_pending = binlogevent
 					break
-				gtid  = binlogevent.gtid.split(':')
-				next_gtid[gtid [0]]  = gtid [1]
-				master_data["gtid"] = next_gtid
+				self.gtid_executed.add_gtid(binlogevent.gtid)
 			
 			elif isinstance(binlogevent, RotateEvent):
 				event_time = binlogevent.timestamp
 				binlogfile = binlogevent.next_binlog
+				binlog_seq = int(binlogfile.split('.')[-1])
+				self.stream_binlogfile = binlogfile
+				self.stream_binlog_seq = binlog_seq
 				position = binlogevent.position
 				self.logger.debug("ROTATE EVENT - binlogfile %s, position %s. " % (binlogfile, position))
 				if (log_file != binlogfile and stream_connected) or len(group_insert)>0:
@@ -1027,18 +2241,26 @@ class mysql_source(object):
 				master_data["File"]=binlogfile
 				master_data["Position"]=position
 				master_data["Time"]=event_time
-				master_data["gtid"] = next_gtid
 				stream_connected = True
 				if close_batch:
 					break
 				
 			elif isinstance(binlogevent, HeartbeatLogEvent):
 				self.logger.debug("HEARTBEAT EVENT - binlogfile %s " % (binlogevent.ident,))
-				if len(group_insert)>0 or log_file != binlogevent.ident:
+				if len(group_insert)>0 or close_batch or log_file != binlogevent.ident:
 					self.logger.debug("WRITING ROWS - binlogfile %s " % (binlogevent.ident,))
 					master_data["File"] = binlogevent.ident
 					close_batch = True
 					break
+				elif self.keep_stream_open:
+					break
+			
+			elif isinstance(binlogevent, XidEvent):
+				master_data["File"] = binlogfile
+				master_data["Position"] = binlogevent.packet.log_pos
+				master_data["Time"] = binlogevent.timestamp
+				if close_batch and not self.gtid_mode:
+					break
 			
 			elif isinstance(binlogevent, QueryEvent):
 				event_time = binlogevent.timestamp
@@ -1047,7 +2269,13 @@ class mysql_source(object):
 				except:
 					schema_query = binlogevent.schema
 				
-				if binlogevent.query.strip().upper() not in self.statement_skip and schema_query in self.schema_mappings: 
+				if binlogevent.query.strip().upper() == 'COMMIT':
+					master_data["File"] = binlogfile
+					master_data["Position"] = binlogevent.packet.log_pos
+					master_data["Time"] = event_time
+					if close_batch and not self.gtid_mode:
+						break
+				elif binlogevent.query.strip().upper() not in self.statement_skip and schema_query in self.schema_mappings: 
 					close_batch=True
 					destination_schema = self.schema_mappings[schema_query]["clear"]
 					obfuscated_schema = self.schema_mappings[schema_query]["obfuscate"]
@@ -1055,30 +2283,21 @@ class mysql_source(object):
 					master_data["File"] = binlogfile
 					master_data["Position"] = log_position
 					master_data["Time"] = event_time
-					master_data["gtid"] = next_gtid
 					if len(group_insert)>0:
-						self.pg_engine.write_batch(group_insert)
+						self.__queue_batch(group_insert)
 						group_insert=[]
+						size_insert=0
+					self.__wait_batch_writer()
 					self.logger.info("QUERY EVENT - binlogfile %s, position %s.\n--------\n%s\n-------- " % (binlogfile, log_position, binlogevent.query))
 					sql_tokeniser.parse_sql(binlogevent.query)
 					for token in sql_tokeniser.tokenised:
+						self.refresh_table_type(schema_query, token)
 						write_ddl = True
 						table_name = token["name"] 
 						store_query = self.__store_binlog_event(table_name, schema_query)
 						if store_query:
-							if table_name in inc_tables:
-								write_ddl = False
-								log_seq = int(log_file.split('.')[1])
-								log_pos = int(log_position)
-								table_dic = inc_tables[table_name]
-								if log_seq > table_dic["log_seq"]:
-									write_ddl = True
-								elif log_seq == table_dic["log_seq"] and log_pos >= table_dic["log_pos"]:
-									write_ddl = True
-								if write_ddl:
-									self.logger.info("CONSISTENT POINT FOR TABLE %s.%s REACHED  - binlogfile %s, position %s" % (schema_query, table_name, binlogfile, log_position))
-									self.pg_engine.set_consistent_table(table_name, destination_schema)
-									inc_tables = self.pg_engine.get_inconsistent_tables()
+							if self.consistent_points:
+								write_ddl = self.__check_consistent_point(destination_schema, obfuscated_schema, table_name, (binlog_seq, log_position))
 							if write_ddl:
 								event_time = binlogevent.timestamp
 								self.logger.debug("TOKEN: %s" % (token))
@@ -1096,58 +2315,30 @@ class mysql_source(object):
 							
 						
 					sql_tokeniser.reset_lists()
-				if close_batch:
-					my_stream.close()
+					if not self.keep_stream_open:
+						my_stream.close()
+					self.__wait_batch_writer()
+					self.__log_read_stats()
 					return [master_data, close_batch]
 				
 			else:
-				table_obfuscation = None
-				size_insert=0
-				for row in binlogevent.rows:
-					event_after={}
-					event_before={}
-					event_insert = {}
-					event_obf = {}
+				table_name = binlogevent.table
+				schema_row = binlogevent.schema
+				store_row = self.__store_binlog_event(table_name, schema_row)
+				if store_row:
 					add_row = True
-					log_file=binlogfile
-					log_position=binlogevent.packet.log_pos
-					table_name=binlogevent.table
-					event_time=binlogevent.timestamp
-					schema_row = binlogevent.schema
+					log_file = binlogfile
+					log_position = binlogevent.packet.log_pos
+					event_time = binlogevent.timestamp
 					destination_schema = self.schema_mappings[schema_row]["clear"]
 					obfuscated_schema = self.schema_mappings[schema_row]["obfuscate"]
-					table_consistent_dict = "%s.%s" % (destination_schema, table_name)
-					store_row = self.__store_binlog_event(table_name, schema_row)
-					if store_row :
-						try:
-							
-							if schema_row in self.obfuscation:
-								try:
-									table_obfuscation = self.obfuscation[schema_row][table_name]
-								except:
-									table_obfuscation = None
-						except:
-							table_obfuscation = None
-
-						if table_consistent_dict in inc_tables:
-							
-							table_consistent = False
-							log_seq = int(log_file.split('.')[1])
-							log_pos = int(log_position)
-							table_dic = inc_tables[table_consistent_dict]
-							if log_seq > table_dic["log_seq"]:
-								table_consistent = True
-							elif log_seq == table_dic["log_seq"] and log_pos >= table_dic["log_pos"]:
-								table_consistent = True
-								self.logger.debug("CONSISTENT POINT FOR TABLE %s REACHED  - binlogfile %s, position %s" % (table_name, binlogfile, log_position))
-							if table_consistent:
-								add_row = True
-								self.pg_engine.set_consistent_table(table_name, [destination_schema, obfuscated_schema])
-								inc_tables = self.pg_engine.get_inconsistent_tables()
-							else:
-								add_row = False
-						
-						column_map=table_type_map[schema_row][table_name]
+					if self.consistent_points:
+						add_row = self.__check_consistent_point(destination_schema, obfuscated_schema, table_name, (binlog_seq, log_position))
+					
+					if add_row:
+						row_plan = self.__get_row_plan(schema_row, table_name)
+						hexify_columns = row_plan["hexify"]
+						obfuscate_columns = row_plan["obfuscate"]
 						global_data={
 											"binlog":log_file, 
 											"logpos":log_position, 
@@ -1157,78 +2348,97 @@ class mysql_source(object):
 											"log_table":log_table, 
 											"event_time":event_time
 										}
-						
-						if add_row:
-							
-							if isinstance(binlogevent, DeleteRowsEvent):
-								global_data["action"] = "delete"
-								event_after=row["values"]
-							elif isinstance(binlogevent, UpdateRowsEvent):
-								global_data["action"] = "update"
+						if isinstance(binlogevent, DeleteRowsEvent):
+							global_data["action"] = "delete"
+						elif isinstance(binlogevent, UpdateRowsEvent):
+							global_data["action"] = "update"
+						elif isinstance(binlogevent, WriteRowsEvent):
+							global_data["action"] = "insert"
+						if obfuscate_columns:
+							global_obf = dict(global_data.items())
+							global_obf["schema"] = obfuscated_schema
+						table_pkey = row_plan["pkey"] if self.batch_compaction and row_plan["compact"] else None
+						changed_pkey = row_plan["pkey"] if self.replica_changed_columns else None
+						check_structure = True
+						for row in binlogevent.rows:
+							self.read_stats["rows"] += 1
+							event_before={}
+							if global_data["action"] == "update":
 								event_after=row["after_values"]
 								event_before=row["before_values"]
-							elif isinstance(binlogevent, WriteRowsEvent):
-								global_data["action"] = "insert"
+								if event_after == event_before:
+									self.read_stats["updates_skipped"] += 1
+									continue
+								if changed_pkey:
+									event_after, event_before = self.__get_changed_columns(event_after, event_before, changed_pkey)
+							else:
 								event_after=row["values"]
-							for column_name in event_after:
-								try:
-									column_type=column_map[column_name]
-								except KeyError:
+							if check_structure:
+								check_structure = False
+								if not row_plan["columns"].issuperset(event_after):
 									self.logger.info("Detected inconsistent structure for the table  %s. The replay may fail. " % (table_name))
-									column_type = 'text'
-								if column_type in self.hexify and event_after[column_name]:
-									event_after[column_name]=binascii.hexlify(event_after[column_name]).decode()
-								elif column_type in self.hexify and isinstance(event_after[column_name], bytes):
-									event_after[column_name] = ''
-							for column_name in event_before:
-								try:
-									column_type=column_map[column_name]
-								except KeyError:
-									self.logger.info("Detected inconsistent structure for the table  %s. The replay may fail. " % (table_name))
-									column_type = 'text'
-								if column_type in self.hexify and event_before[column_name]:
-									event_before[column_name]=binascii.hexlify(event_before[column_name]).decode()
-								elif column_type in self.hexify and isinstance(event_before[column_name], bytes):
-									event_before[column_name] = ''
+							if hexify_columns:
+								self.__hexify_row(event_after, hexify_columns)
+								self.__hexify_row(event_before, hexify_columns)
 							event_insert={"global_data":global_data,"event_after":event_after,  "event_before":event_before}
-							size_insert += len(str(event_insert))
+							if table_pkey:
+								key_after = self.__get_row_key(destination_schema, table_name, table_pkey, event_after)
+								key_before = self.__get_row_key(destination_schema, table_name, table_pkey, event_before) if event_before else key_after
+								event_insert["row_key"] = (key_before, key_after)
+							event_size = self.__get_image_size(event_after, row_plan)
+							if event_before:
+								event_size += self.__get_image_size(event_before, row_plan)
+							size_insert += event_size
 							group_insert.append(event_insert)
 						
-							if table_obfuscation:
+							if obfuscate_columns:
 								event_after_obf = dict(event_after.items())
-								global_obf = dict(global_data.items())
-								global_obf["schema"] = obfuscated_schema
-								for column_name in table_obfuscation:
-									try:
-										obf_mode = table_obfuscation[column_name]
-										event_after_obf[column_name]=self.obfuscate_value(event_after_obf[column_name], obf_mode)
-									except:
-										self.logger.error("discarded row in obfuscation process.\n global_data:%s \n event_data:%s \n" % (global_data,event_after ))
+								for column_name, obf_mode in obfuscate_columns:
+									if column_name in event_after_obf:
+										try:
+											event_after_obf[column_name]=self.obfuscate_value(event_after_obf[column_name], obf_mode)
+										except:
+											self.logger.error("discarded row in obfuscation process.\n global_data:%s \n event_data:%s \n" % (global_data,event_after ))
 								event_obf={"global_data":global_obf,"event_after":event_after_obf,  "event_before":event_before}
+								if table_pkey:
+									event_obf["row_key"] = ((obfuscated_schema, ) + key_before[1:], (obfuscated_schema, ) + key_after[1:])
+								size_insert += event_size
 								group_insert.append(event_obf)
 							
+							if (len(group_insert)>=self.replica_batch_size or (self.replica_batch_bytes and size_insert>=self.replica_batch_bytes)) and not (self.batch_compaction and close_batch):
+								self.logger.info("Max rows or bytes per batch reached. Writing %s. rows. Estimated size in bytes: %s " % (len(group_insert), size_insert))
+								self.logger.debug("Master coordinates: %s" % (master_data, ))
+								if not self.batch_compaction:
+									self.__queue_batch(group_insert)
+									size_insert=0
+									group_insert=[]
+								close_batch=True
 						
-						master_data["File"]=log_file
-						master_data["Position"]=log_position
-						master_data["Time"]=event_time
-						master_data["gtid"] = next_gtid
-						
-						if len(group_insert)>=self.replica_batch_size:
-							self.logger.info("Max rows per batch reached. Writing %s. rows. Size in bytes: %s " % (len(group_insert), size_insert))
-							self.logger.debug("Master coordinates: %s" % (master_data, ))
-							self.pg_engine.write_batch(group_insert)
-							size_insert=0
-							group_insert=[]
+						if blocking and self.replica_batch_seconds and len(group_insert)>0 and not close_batch and time.time()>=batch_deadline:
+							self.logger.info("Max time per batch reached. Writing %s. rows. Estimated size in bytes: %s " % (len(group_insert), size_insert))
+							if not self.batch_compaction:
+								self.__queue_batch(group_insert)
+								size_insert=0
+								group_insert=[]
 							close_batch=True
 						
+					else:
+						self.read_stats["events_skipped"] += 1
+					master_data["File"]=log_file
+					master_data["Position"]=log_position
+					master_data["Time"]=event_time
+				else:
+					self.read_stats["events_skipped"] += 1
 						
-						
-		my_stream.close()
+							
+		if not self.keep_stream_open:
+			my_stream.close()
 		if len(group_insert)>0:
 			self.logger.info("Replica stream consumed. Writing the last %s events" % (len(group_insert), ))
-			self.pg_engine.write_batch(group_insert)
+			self.__queue_batch(group_insert)
 			close_batch=True
-		
+		self.__wait_batch_writer()
+		self.__log_read_stats()
 		return [master_data, close_batch]
 
 	def obfuscate_value(self, column_value, obf_mode):
@@ -1272,20 +2482,34 @@ class mysql_source(object):
 		replica_paused = self.pg_engine.get_replica_paused()
 		if replica_paused:
 			self.logger.info("Read replica is paused")
+			self.close_stream()
 			self.pg_engine.set_read_paused(True)
 		else:
 			
 			batch_data = self.pg_engine.get_batch_data()
 			if len(batch_data)>0:
 				id_batch=batch_data[0][0]
-				replica_data=self.__read_replica_stream(batch_data)
+				stream_error = None
+				try:
+					replica_data=self.__read_replica_stream(batch_data)
+				except (pymysql.err.MySQLError, ConnectionError) as e:
+					if not self.keep_stream_open:
+						raise
+					stream_error = e
+				if stream_error:
+					self.logger.warning("The replica stream for the batch %s failed with error: %s. The stream will be connected again." % (id_batch, stream_error))
+					self.__reset_stream(stream_error)
+					replica_data = [{}, False]
 				master_data=replica_data[0]
 				close_batch=replica_data[1]
-				if "gtid" in master_data:
-					master_data["Executed_Gtid_Set"] = self.__build_gtid_set(master_data["gtid"])
+				if self.gtid_mode:
+					master_data["Executed_Gtid_Set"] = str(self.gtid_executed)
 				else:
 					master_data["Executed_Gtid_Set"] = ""
 				if close_batch:
+					if self.tables_consistent:
+						self.pg_engine.set_consistent_tables(self.tables_consistent, id_batch)
+						self.tables_consistent = []
 					self.master_status=[]
 					self.master_status.append(master_data)
 					self.logger.debug("trying to save the master data...")
@@ -1418,6 +2642,7 @@ class mysql_source(object):
 			self.pg_engine.grant_select()
 			self.pg_engine.swap_schemas()
 			self.pg_engine.clean_batch_data()
+			self.pg_engine.clean_table_type_map()
 			self.pg_engine.save_master_status(master_start)
 			self.drop_loading_schemas()
 			self.pg_engine.set_source_status("initialised")
@@ -1,16 +1,23 @@
 import io
 import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import sys
 import json
 import datetime
 import decimal
 import time
 import binascii
+import struct
 import os
+import select
 from distutils.sysconfig import get_python_lib
 import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, wait
+try:
+	import simplejson
+except ImportError:
+	simplejson = None
 
 
 class pg_encoder(json.JSONEncoder):
@@ -25,6 +32,126 @@ class pg_encoder(json.JSONEncoder):
 					
 			return str(obj)
 		return json.JSONEncoder.default(self, obj)
+
+class row_encoder(object):
+	"""
+		The class encodes the row images in json producing the same text of json.dumps with pg_encoder.
+		The values not supported by json are converted to string looking up their type in the dictionary type_map, 
+		the isinstance checks of pg_encoder are used only for the subclasses of the mapped types.
+		A single encoder instance is reused for all the rows. If simplejson is installed and its output matches 
+		the standard library's output for a golden sample, simplejson is used instead.
+	"""
+	def __init__(self):
+		"""
+			Class constructor, the method builds the type dispatch dictionary and the json encoder.
+		"""
+		self.type_map = {
+			datetime.datetime: str, 
+			datetime.date: str, 
+			datetime.time: str, 
+			datetime.timedelta: str, 
+			decimal.Decimal: str, 
+			set: str, 
+			bytes: str, 
+		}
+		self.fallback_encoder = pg_encoder()
+		self.dumps = json.JSONEncoder(check_circular=False, default=self.encode_value).encode
+		self.backend = "json"
+		if simplejson:
+			simple_dumps = simplejson.JSONEncoder(check_circular=False, use_decimal=False, default=self.encode_value).encode
+			golden_sample = self.get_golden_sample()
+			try:
+				if simple_dumps(golden_sample) == self.dumps(golden_sample):
+					self.dumps = simple_dumps
+					self.backend = "simplejson"
+			except (TypeError, ValueError):
+				pass
+	
+	def encode_value(self, value):
+		"""
+			The method is the json default function, which returns the string representation of the values not supported by json.
+			
+			:param value: the value to encode
+			:return: the string representation of the value
+			:rtype: str
+		"""
+		try:
+			return self.type_map[type(value)](value)
+		except KeyError:
+			return self.fallback_encoder.default(value)
+	
+	@staticmethod
+	def get_golden_sample():
+		"""
+			The method returns a row image with all the types managed by the class. 
+			The sample is used to check that an alternative json backend produces the same text of pg_encoder.
+			
+			:return: the sample row image
+			:rtype: dictionary
+		"""
+		return {
+			"id": 1, 
+			"bigint": 9223372036854775807, 
+			"float": 0.1, 
+			"bool": True, 
+			"null": None, 
+			"text": "text with \"quotes\", \\ backslash, \t tab and \n newline", 
+			"unicode": "\u00e8\u00e0 \u4e2d\u6587 \U0001f600", 
+			"datetime": datetime.datetime(2018, 1, 2, 3, 4, 5, 6), 
+			"date": datetime.date(2018, 1, 2), 
+			"time": datetime.time(3, 4, 5), 
+			"timedelta": datetime.timedelta(days=1, seconds=5), 
+			"decimal": decimal.Decimal("12345678901234567890.123456789"), 
+			"set": {"a"}, 
+			"bytes": b"\x00\xff\\", 
+		}
+
+COPY_BINARY_HEADER = b"PGCOPY\n\377\r\n\0" + struct.pack("!ii", 0, 0)
+COPY_BINARY_TRAILER = struct.pack("!h", -1)
+COPY_NULL_FIELD = struct.pack("!i", -1)
+COPY_LOG_FIELDS = struct.pack("!h", 9)
+COPY_BIGINT = struct.Struct("!iq")
+COPY_LENGTH = struct.Struct("!i")
+
+def copy_bigint(value):
+	"""
+		The function returns a bigint field in the COPY BINARY format.
+		
+		:param value: the integer value, None is stored as NULL
+		:return: the field length followed by the value in network byte order
+		:rtype: bytes
+	"""
+	if value is None:
+		return COPY_NULL_FIELD
+	return COPY_BIGINT.pack(8, value)
+
+def copy_text(value, encoding):
+	"""
+		The function returns a text field in the COPY BINARY format. The same format is used for 
+		the character varying and the enum fields.
+		
+		:param value: the string value, None is stored as NULL
+		:param encoding: the python encoding matching the connection's client_encoding
+		:return: the field length followed by the encoded string
+		:rtype: bytes
+	"""
+	if value is None:
+		return COPY_NULL_FIELD
+	value = value.encode(encoding)
+	return COPY_LENGTH.pack(len(value)) + value
+
+def copy_jsonb(value, encoding):
+	"""
+		The function returns a jsonb field in the COPY BINARY format, which is the jsonb version number (1) 
+		followed by the json text.
+		
+		:param value: the json text
+		:param encoding: the python encoding matching the connection's client_encoding
+		:return: the field length followed by the version number and the encoded json
+		:rtype: bytes
+	"""
+	value = value.encode(encoding)
+	return COPY_LENGTH.pack(len(value)+1) + b"\x01" + value
 		
 class pgsql_source(object):
 	def __init__(self):
@@ -605,11 +732,18 @@ class pg_engine(object):
 		self.logger = None
 		self.idx_sequence = 0
 		self.lock_timeout = 0
+		self.copy_buffer = io.BytesIO()
+		self.copy_min_rows = 10
+		self.row_encoder = row_encoder()
+		self.replay_engines = []
+		self.replay_pool = None
+		self.replay_rows = None
 		
 		self.migrations = [
 			{'version': '2.0.1',  'script': '200_to_201.sql'}, 
 			{'version': '2.0.2',  'script': '201_to_202.sql'}, 
 			{'version': '2.0.3',  'script': '202_to_203.sql'}, 
+			{'version': '2.0.4',  'script': '203_to_204.sql'}, 
 		]
 		
 	def __del__(self):
@@ -618,6 +752,30 @@ class pg_engine(object):
 		"""
 		self.disconnect_db()
 	
+	def clone_engine(self):
+		"""
+			The method returns a new pg_engine instance with the same configuration of the current one.
+			The new instance doesn't share the database connection, which should be opened with connect_db.
+			The method is used when a process requires an additional connection to the replica database.
+			
+			:return: the new pg_engine instance
+			:rtype: pg_engine
+		"""
+		engine = pg_engine()
+		engine.dest_conn = self.dest_conn
+		engine.logger = self.logger
+		engine.source = self.source
+		engine.sources = self.sources
+		engine.type_override = self.type_override
+		engine.notifier = self.notifier
+		engine.lock_timeout = self.lock_timeout
+		engine.copy_min_rows = self.copy_min_rows
+		try:
+			engine.i_id_source = self.i_id_source
+		except AttributeError:
+			pass
+		return engine
+	
 	def set_autocommit_db(self, auto_commit):
 		"""
 			The method sets the auto_commit flag for the class connection self.pgsql_conn.
@@ -759,7 +917,8 @@ class pg_engine(object):
 	def get_inconsistent_tables(self):
 		"""
 			The method collects the tables in not consistent state.
-			The informations are stored in a dictionary which key is the table's name.
+			The informations are stored in a dictionary which key is a tuple with the table's schema and name.
+			The value is the table's consistent point as a tuple with the binlog sequence and the binlog position.
 			The dictionary is used in the read replica loop to determine wheter the table's modifications
 			should be ignored because in not consistent state.
 			
@@ -784,15 +943,164 @@ class pg_engine(object):
 		self.pgsql_cur.execute(sql_get, (self.i_id_source, ))
 		inc_results = self.pgsql_cur.fetchall()
 		for table  in inc_results:
-			tab_dic = {}
-			dic_key = "%s.%s" % (table[0], table[1])
-			tab_dic["schema"]  = table[0]
-			tab_dic["table"]  = table[1]
-			tab_dic["log_seq"]  = int(table[2].split('.')[1])
-			tab_dic["log_pos"]  = int(table[3])
-			inc_dic[dic_key] = tab_dic
+			inc_dic[(table[0], table[1])] = (int(table[2].split('.')[-1]), int(table[3]))
 		return inc_dic
+
+	def get_table_type_map(self):
+		"""
+			The method loads the table type map stored in the replica catalogue for the source.
+			The map is saved by the read replica process in order to avoid the scan of the
+			information_schema each time the process starts.
+
+			:return: a dictionary with the schema names as keys and the tables' column/type mappings as values.
+			:rtype: dictionary
+		"""
+		sql_get = """
+			SELECT
+				v_schema_name,
+				v_table_name,
+				jsb_column_types
+			FROM
+				sch_ninja.t_table_type_map
+			WHERE
+				i_id_source = %s
+		;
+		"""
+		table_type_map = {}
+		self.pgsql_cur.execute(sql_get, (self.i_id_source, ))
+		type_results = self.pgsql_cur.fetchall()
+		for table in type_results:
+			table_type_map.setdefault(table[0], {})[table[1]] = table[2]
+		return table_type_map
+
+	def save_table_type_map(self, table_type_map):
+		"""
+			The method stores the table type map for the schemas listed in the dictionary table_type_map.
+			Any previous mapping for those schemas is replaced.
+
+			:param table_type_map: the dictionary with the schema names as keys and the tables' column/type mappings as values.
+		"""
+		sql_delete = """
+			DELETE FROM sch_ninja.t_table_type_map
+			WHERE
+					i_id_source = %s
+				AND	v_schema_name = ANY(%s)
+			;
+		"""
+		sql_insert = """
+			INSERT INTO sch_ninja.t_table_type_map
+				(
+					i_id_source,
+					v_schema_name,
+					v_table_name,
+					jsb_column_types
+				)
+			SELECT
+				%s,
+				sch.key,
+				tab.key,
+				tab.value
+			FROM
+				jsonb_each(%s::jsonb) sch,
+				jsonb_each(sch.value) tab
+			;
+		"""
+		self.pgsql_cur.execute(sql_delete, (self.i_id_source, list(table_type_map)))
+		self.pgsql_cur.execute(sql_insert, (self.i_id_source, json.dumps(table_type_map)))
+
+	def save_table_type(self, schema, table, column_types):
+		"""
+			The method stores the column/type mappings for a single table in the table type map.
+			The method is used by the read replica process when a DDL changes the table's structure.
+
+			:param schema: the origin's schema name
+			:param table: the table name
+			:param column_types: the dictionary with the column/type mappings
+		"""
+		sql_upsert = """
+			INSERT INTO sch_ninja.t_table_type_map
+				(
+					i_id_source,
+					v_schema_name,
+					v_table_name,
+					jsb_column_types
+				)
+			VALUES
+				(
+					%s,
+					%s,
+					%s,
+					%s
+				)
+			ON CONFLICT (i_id_source,v_schema_name,v_table_name)
+				DO UPDATE
+					SET
+						jsb_column_types=EXCLUDED.jsb_column_types
+			;
+		"""
+		self.pgsql_cur.execute(sql_upsert, (self.i_id_source, schema, table, json.dumps(column_types)))
+
+	def delete_table_type(self, schema, table):
+		"""
+			The method removes a single table from the table type map.
+
+			:param schema: the origin's schema name
+			:param table: the table name
+		"""
+		sql_delete = """
+			DELETE FROM sch_ninja.t_table_type_map
+			WHERE
+					i_id_source = %s
+				AND	v_schema_name = %s
+				AND	v_table_name = %s
+			;
+		"""
+		self.pgsql_cur.execute(sql_delete, (self.i_id_source, schema, table))
+
+	def clean_table_type_map(self):
+		"""
+			The method removes the table type map stored for the source and increments the source's type map version.
+			The read replica process checks the version with get_type_map_version, and when it changes the process 
+			discards the map and the row plans kept in memory and builds them again.
+		"""
+		sql_delete = """
+			DELETE FROM sch_ninja.t_table_type_map
+			WHERE
+				i_id_source = %s
+			;
+		"""
+		sql_version = """
+			UPDATE sch_ninja.t_sources
+				SET
+					i_type_map_version=i_type_map_version+1
+			WHERE
+				i_id_source = %s
+			;
+		"""
+		self.pgsql_cur.execute(sql_delete, (self.i_id_source, ))
+		self.pgsql_cur.execute(sql_version, (self.i_id_source, ))
 	
+	def get_type_map_version(self):
+		"""
+			The method returns the version of the table type map stored for the source.
+			The version is incremented by clean_table_type_map each time the map is removed by init_replica, 
+			sync_tables or refresh_schema.
+			
+			:return: the type map version
+			:rtype: integer
+		"""
+		sql_get = """
+			SELECT
+				i_type_map_version
+			FROM
+				sch_ninja.t_sources
+			WHERE
+				i_id_source = %s
+			;
+		"""
+		self.pgsql_cur.execute(sql_get, (self.i_id_source, ))
+		return self.pgsql_cur.fetchone()[0]
+
 	def __grant_select(self, role_list, schema_loading):
 		"""
 		"""
@@ -856,6 +1164,12 @@ class pg_engine(object):
 		"""
 			The method replays the row images in the target database using the function 
 			fn_replay_mysql. The function returns a composite type.
+			If the source's replay_mode is grouped the function replays the runs of consecutive events with the same table and action 
+			using a single statement per run, otherwise each event is replayed with its own statement.
+			If the source's replay_workers is greater than one the batch chunks are replayed by the method __replay_chunk_parallel instead.
+			The number of events replayed in each chunk is adapted by the method __adapt_replay_rows after each chunk, 
+			towards the source's replay_target_time and within replay_min_rows and replay_max_rows.
+			The replayed events are not deleted, the log tables are truncated when all their batches are replayed.
 			The first element is a boolean flag which
 			is true if the batch still require replay. it's false if it doesn't.
 			In that case the while loop ends.
@@ -874,25 +1188,457 @@ class pg_engine(object):
 			self.logger.info("Replay replica is paused")
 			self.set_replay_paused(True)
 		else:
+			self.pgsql_cur.execute("""SELECT clock_timestamp();""")
+			replay_start = self.pgsql_cur.fetchone()[0]
 			continue_loop = True
 			self.source_config = self.sources[self.source]
+			self.lock_timeout = self.source_config["lock_timeout"]
 			replay_max_rows = self.source_config["replay_max_rows"]
+			try:
+				replay_min_rows = min(max(int(self.source_config["replay_min_rows"]), 1), replay_max_rows)
+			except KeyError:
+				replay_min_rows = replay_max_rows
+			try:
+				replay_target_time = float(self.source_config["replay_target_time"])
+			except KeyError:
+				replay_target_time = 1.0
+			if self.replay_rows is None:
+				self.replay_rows = self.get_replay_rows(replay_max_rows)
+			self.replay_rows = min(max(self.replay_rows, replay_min_rows), replay_max_rows)
+			replay_time = None
 			exit_on_error = True if self.source_config["on_error_replay"]=='exit' else False
+			try:
+				replay_grouped = True if self.source_config["replay_mode"]=='grouped' else False
+			except KeyError:
+				replay_grouped = False
+			try:
+				replay_workers = int(self.source_config["replay_workers"])
+			except KeyError:
+				replay_workers = 1
+			if replay_workers > 1:
+				table_groups = self.get_table_groups()
+				if table_groups:
+					self.logger.info("The tables linked by foreign keys are replayed by the same worker: %s" % (", ".join(sorted(["%s.%s" % table for table in table_groups])), ))
 			while continue_loop:
-				sql_replay = """SELECT * FROM sch_ninja.fn_replay_mysql(%s,%s,%s)""";
-				self.pgsql_cur.execute(sql_replay, (replay_max_rows, self.i_id_source, exit_on_error))
-				replay_status = self.pgsql_cur.fetchone()
+				replay_rows = self.replay_rows
+				chunk_start = time.time()
+				if replay_workers > 1:
+					replay_status = self.__replay_chunk_parallel(replay_rows, exit_on_error, replay_grouped, replay_workers, table_groups)
+				else:
+					sql_replay = """SELECT * FROM sch_ninja.fn_replay_mysql(%s,%s,%s,%s)""";
+					self.pgsql_cur.execute(sql_replay, (replay_rows, self.i_id_source, exit_on_error, replay_grouped))
+					replay_status = self.pgsql_cur.fetchone()
+				chunk_time = time.time() - chunk_start
 				if replay_status[0]:
-					self.logger.debug("Replayed %s rows for source %s" % (replay_max_rows, self.source) )
+					self.logger.debug("Replayed %s rows for source %s in %.3f seconds" % (replay_rows, self.source, chunk_time) )
+					replay_time = chunk_time
+					self.__adapt_replay_rows(chunk_time, replay_target_time, replay_min_rows, replay_max_rows)
 				continue_loop = replay_status[0]
 				function_error = replay_status[1]
 				if function_error:
 					raise Exception('The replay process crashed')
 				if replay_status[2]:
 					tables_error.append(replay_status[2])
+			self.__log_replay_latency(replay_start)
+			self.__save_replay_rows(replay_time)
+			self.truncate_replayed_log_tables()
 			self. __cleanup_replayed_batches()		
 		return tables_error
+	
+	def __adapt_replay_rows(self, chunk_time, replay_target_time, replay_min_rows, replay_max_rows):
+		"""
+			The method adapts the number of events replayed in a chunk towards the target transaction duration.
+			The new size is proportional to the ratio between the target time and the chunk time, limited to 
+			half and double of the current size in order to smooth the changes, and kept within the min and max rows.
+			Only the full chunks are used as the partial chunks do not measure the replay speed.
+			
+			:param chunk_time: the seconds spent replaying the last full chunk
+			:param replay_target_time: the target duration in seconds of a chunk
+			:param replay_min_rows: the minimum number of events in a chunk
+			:param replay_max_rows: the maximum number of events in a chunk
+		"""
+		if chunk_time > 0:
+			ratio = min(max(replay_target_time/chunk_time, 0.5), 2.0)
+		else:
+			ratio = 2.0
+		replay_rows = min(max(int(self.replay_rows*ratio), replay_min_rows), replay_max_rows)
+		if replay_rows != self.replay_rows:
+			self.logger.info("Replay chunk for source %s took %.3f seconds, target %.3f. Changing the chunk size from %s to %s rows." % (self.source, chunk_time, replay_target_time, self.replay_rows, replay_rows))
+			self.replay_rows = replay_rows
+	
+	def get_replay_rows(self, replay_max_rows):
+		"""
+			The method returns the chunk size saved by the last replay run for the source, or replay_max_rows if 
+			there is no chunk size saved.
+			
+			:param replay_max_rows: the default chunk size
+			:return: the number of events to replay in a chunk
+			:rtype: integer
+		"""
+		sql_get = """
+			SELECT 
+				i_replay_rows
+			FROM 
+				sch_ninja.t_last_replayed
+			WHERE
+				i_id_source=%s
+			;
+		"""
+		self.pgsql_cur.execute(sql_get, (self.i_id_source, ))
+		replay_rows = self.pgsql_cur.fetchone()
+		if replay_rows and replay_rows[0]:
+			return replay_rows[0]
+		return replay_max_rows
+	
+	def __save_replay_rows(self, replay_time):
+		"""
+			The method saves the current chunk size and the duration of the last full chunk in the table t_last_replayed. 
+			The values are shown by show_status.
 			
+			:param replay_time: the seconds spent replaying the last full chunk, None if the run had no full chunk
+		"""
+		if replay_time is not None:
+			replay_ms = int(replay_time*1000)
+		else:
+			replay_ms = None
+		sql_save = """
+			UPDATE sch_ninja.t_last_replayed
+				SET
+					i_replay_rows=%s,
+					i_replay_ms=coalesce(%s,i_replay_ms)
+			WHERE
+				i_id_source=%s
+			;
+		"""
+		self.pgsql_cur.execute(sql_save, (self.replay_rows, replay_ms, self.i_id_source))
+	
+	def __log_replay_latency(self, replay_start):
+		"""
+			The method logs the latency between the batch processed by the read replica and the batch replayed, 
+			for the batches of the source replayed since replay_start.
+			
+			:param replay_start: the database timestamp when the replay run started
+		"""
+		sql_latency = """
+			SELECT 
+				count(*),
+				extract(epoch FROM avg(ts_replayed-ts_processed)),
+				extract(epoch FROM max(ts_replayed-ts_processed))
+			FROM 
+				sch_ninja.t_replica_batch
+			WHERE
+					i_id_source=%s
+				AND	b_replayed
+				AND	ts_replayed>=%s
+			;
+		"""
+		self.pgsql_cur.execute(sql_latency, (self.i_id_source, replay_start))
+		latency = self.pgsql_cur.fetchone()
+		if latency[0] > 0:
+			self.logger.info("Replayed %s batches for source %s. Replay latency avg: %.3f s, max: %.3f s" % (latency[0], self.source, latency[1], latency[2]))
+	
+	def get_replay_channel(self):
+		"""
+			The method returns the name of the notification channel used by the read replica to wake up 
+			the replay daemon when a batch is processed.
+			
+			:return: the channel name for the source
+			:rtype: string
+		"""
+		return "sch_ninja_replay_%s" % (self.i_id_source, )
+	
+	def listen_replay(self):
+		"""
+			The method starts listening on the source's replay channel. 
+			The method assumes there is a database connection active in autocommit and the source id is set.
+		"""
+		sql_listen = sql.SQL("""LISTEN {};""").format(sql.Identifier(self.get_replay_channel()))
+		self.pgsql_cur.execute(sql_listen)
+	
+	def wait_replay(self, timeout):
+		"""
+			The method waits for a notification on the source's replay channel for timeout seconds at most.
+			If any notification was received while the replay was running the method returns immediately.
+			
+			:param timeout: the maximum wait in seconds
+			:return: the list of batch ids notified
+			:rtype: list
+		"""
+		if not self.pgsql_conn.notifies:
+			if select.select([self.pgsql_conn], [], [], timeout) != ([], [], []):
+				self.pgsql_conn.poll()
+		notified_batches = [notify.payload for notify in self.pgsql_conn.notifies]
+		del self.pgsql_conn.notifies[:]
+		if notified_batches:
+			self.logger.debug("Replay woken up by the batches %s" % (", ".join(notified_batches), ))
+		return notified_batches
+	
+	def __start_replay_workers(self, replay_workers):
+		"""
+			The method starts the thread pool and the database connections used by the parallel replay.
+			Each worker has a dedicated pg_engine instance, connections and threads are kept between the replay runs.
+			The workers' connections are not in autocommit, as the transactions are committed by __replay_partitions.
+			
+			:param replay_workers: the number of replay workers
+		"""
+		if len(self.replay_engines) == replay_workers:
+			return
+		self.stop_replay_workers()
+		self.logger.info("starting %s replay workers for source %s" % (replay_workers, self.source))
+		for worker_id in range(replay_workers):
+			replay_engine = self.clone_engine()
+			replay_engine.connect_db()
+			replay_engine.set_synchronous_commit()
+			replay_engine.set_autocommit_db(False)
+			self.replay_engines.append(replay_engine)
+		self.replay_pool = ThreadPoolExecutor(max_workers=replay_workers)
+	
+	def stop_replay_workers(self):
+		"""
+			The method stops the thread pool and disconnects the replay workers' connections.
+		"""
+		if self.replay_pool:
+			self.replay_pool.shutdown()
+			self.replay_pool = None
+		for replay_engine in self.replay_engines:
+			replay_engine.disconnect_db()
+		self.replay_engines = []
+	
+	def __replay_events(self, replay_engine, id_batch, event_list, exit_on_error, replay_grouped):
+		"""
+			The method replays a list of events of the batch using the connection of the given pg_engine and 
+			the function fn_replay_events or fn_replay_events_grouped.
+			If the replay succeeds the events are saved in the table t_replay_partitions within the same transaction, 
+			so the events committed are never replayed again if the chunk is interrupted. 
+			The partition saves also the schema, table and binlog coordinates of its events, so set_batch_processed 
+			can find the events again if the batch is read again by rewind_lost_batches.
+			The transaction is committed or rolled back by the method __replay_partitions.
+			
+			:param replay_engine: the pg_engine instance which runs the replay
+			:param id_batch: the batch id
+			:param event_list: the list of event ids to replay
+			:param exit_on_error: if true the function stops at the first error
+			:param replay_grouped: if true the events are replayed with fn_replay_events_grouped
+			:return: the replay result with the error flag, the tables in error, the replayed rows and the replayed ddl
+			:rtype: tuple
+		"""
+		if replay_grouped:
+			sql_replay = """SELECT * FROM sch_ninja.fn_replay_events_grouped(%s,%s,%s,%s);"""
+		else:
+			sql_replay = """SELECT * FROM sch_ninja.fn_replay_events(%s,%s,%s,%s);"""
+		replay_engine.pgsql_cur.execute(sql_replay, (self.i_id_source, id_batch, event_list, exit_on_error))
+		replay_result = replay_engine.pgsql_cur.fetchone()
+		if not replay_result[0]:
+			sql_partition = """
+				INSERT INTO sch_ninja.t_replay_partitions
+					(
+						i_id_batch,
+						i_id_events,
+						i_replayed,
+						i_ddl,
+						jsb_binlog_events
+					)
+				SELECT
+					%s,
+					%s,
+					%s,
+					%s,
+					jsonb_agg(DISTINCT jsonb_build_array(log.v_schema_name, log.v_table_name, log.t_binlog_name, log.i_binlog_position))
+				FROM 
+					sch_ninja.t_log_replica log
+				WHERE
+						log.i_id_batch=%s
+					AND	log.i_id_event=ANY(%s)
+				;
+			"""
+			replay_engine.pgsql_cur.execute(sql_partition, (id_batch, event_list, replay_result[2], replay_result[3], id_batch, event_list))
+		return replay_result
+	
+	def get_table_groups(self):
+		"""
+			The method returns the groups of the source's tables linked by foreign keys in the target database.
+			The tables in the same group are replayed by the same worker, so the order of their events is kept like 
+			for a single table. The read replica doesn't compact the events of the tables in any group.
+			The foreign keys are not replicated from MySQL, therefore the groups exist only if the keys are created in the target.
+			
+			:return: the dictionary with the schema and table name as key and the group's name as value
+			:rtype: dictionary
+		"""
+		sql_fkeys = """
+			SELECT 
+				sch_src.nspname,
+				tab_src.relname,
+				sch_ref.nspname,
+				tab_ref.relname
+			FROM 
+				pg_constraint con
+				INNER JOIN pg_class tab_src
+					ON tab_src.oid=con.conrelid
+				INNER JOIN pg_namespace sch_src
+					ON sch_src.oid=tab_src.relnamespace
+				INNER JOIN pg_class tab_ref
+					ON tab_ref.oid=con.confrelid
+				INNER JOIN pg_namespace sch_ref
+					ON sch_ref.oid=tab_ref.relnamespace
+				INNER JOIN sch_ninja.t_replica_tables rep
+					ON
+							rep.v_schema_name=sch_src.nspname
+						AND	rep.v_table_name=tab_src.relname
+			WHERE
+					con.contype='f'
+				AND	rep.i_id_source=%s
+			;
+		"""
+		self.pgsql_cur.execute(sql_fkeys, (self.i_id_source, ))
+		table_groups = {}
+		for fkey in self.pgsql_cur.fetchall():
+			table_src = (fkey[0], fkey[1])
+			table_ref = (fkey[2], fkey[3])
+			table_group = table_groups.get(table_src, {table_src}) | table_groups.get(table_ref, {table_ref})
+			for table in table_group:
+				table_groups[table] = table_group
+		return {table: min(table_group) for table, table_group in table_groups.items()}
+	
+	def __replay_chunk_parallel(self, replay_max_rows, exit_on_error, replay_grouped, replay_workers, table_groups):
+		"""
+			The method replays the next chunk of replay_max_rows events using replay_workers connections.
+			The events are partitioned by schema and table, so each table is replayed by the same worker 
+			and keeps the events order. The tables linked by foreign keys, listed in table_groups, share the same partition. 
+			The DDL events are barriers, the events before the DDL are replayed by the workers, 
+			then the DDL is replayed alone and the process continues with the following events.
+			The workers' transactions are committed together only when all the partitions between two barriers succeed, 
+			and each transaction saves its events in t_replay_partitions. The events already saved are excluded from the 
+			chunk by fn_get_replay_chunk, so a chunk interrupted by a crash or by an error is resumed without replaying 
+			twice the committed partitions.
+			The chunk is marked as replayed by the function fn_set_chunk_replayed only when all the partitions are finished, 
+			in the same statement which removes the chunk's partitions and sums their replayed rows.
+			
+			:param replay_max_rows: the maximum number of events in the chunk
+			:param exit_on_error: if true the replay stops at the first error
+			:param replay_grouped: if true the events are replayed with the grouped replay
+			:param replay_workers: the number of replay workers
+			:param table_groups: the dictionary with the tables linked by foreign keys, returned by get_table_groups
+			:return: the replay status with the continue flag, the error flag and the tables in error, like fn_replay_mysql
+			:rtype: tuple
+		"""
+		self.__start_replay_workers(replay_workers)
+		sql_chunk = """SELECT * FROM sch_ninja.fn_get_replay_chunk(%s,%s);"""
+		self.pgsql_cur.execute(sql_chunk, (replay_max_rows, self.i_id_source))
+		replay_chunk = self.pgsql_cur.fetchone()
+		id_batch = replay_chunk[0]
+		if id_batch is None:
+			return (False, False, None)
+		sql_events = """
+			SELECT 
+				log.i_id_event,
+				log.enm_binlog_event='ddl',
+				log.v_schema_name,
+				log.v_table_name
+			FROM 
+				sch_ninja.t_log_replica  log
+			WHERE
+					log.i_id_batch=%s
+				AND	log.i_id_event=ANY(%s)
+			ORDER BY 
+				log.i_id_event
+			;
+		"""
+		self.pgsql_cur.execute(sql_events, (id_batch, replay_chunk[1]))
+		event_list = self.pgsql_cur.fetchall()
+		replay_results = []
+		partitions = [[] for worker_id in range(replay_workers)]
+		partition_map = {}
+		for id_event, is_ddl, schema_name, table_name in event_list:
+			if is_ddl:
+				replay_results += self.__replay_partitions(id_batch, partitions, exit_on_error, replay_grouped)
+				partitions = [[] for worker_id in range(replay_workers)]
+				if [replay_result for replay_result in replay_results if replay_result[0]]:
+					break
+				replay_results += self.__replay_partitions(id_batch, [[id_event]], exit_on_error, False)
+			else:
+				table_group = table_groups.get((schema_name, table_name), (schema_name, table_name))
+				if table_group not in partition_map:
+					partition_map[table_group] = len(partition_map) % replay_workers
+				partitions[partition_map[table_group]].append(id_event)
+		replay_results += self.__replay_partitions(id_batch, partitions, exit_on_error, replay_grouped)
+		
+		tables_error = []
+		replay_failed = False
+		for replay_result in replay_results:
+			if replay_result[1]:
+				tables_error += replay_result[1]
+			if replay_result[0]:
+				replay_failed = True
+		if replay_failed:
+			self.logger.error("The replay of the batch %s failed. The partitions in error were rolled back. Errors: %s" % (id_batch, tables_error))
+			return (False, True, tables_error)
+		if replay_chunk[1]:
+			last_event = replay_chunk[1][-1]
+		else:
+			last_event = None
+		sql_replayed = """
+			WITH 
+				t_partitions AS
+				(
+					DELETE FROM sch_ninja.t_replay_partitions
+					WHERE
+							i_id_batch=%s
+						AND	(
+								i_id_events[array_upper(i_id_events,1)]<=%s
+							OR	%s IS NULL
+						)
+					RETURNING 
+						i_replayed,
+						i_ddl
+				)
+			SELECT 
+				* 
+			FROM 
+				sch_ninja.fn_set_chunk_replayed(
+					%s,
+					ROW(%s,%s::bigint[],%s)::sch_ninja.ty_replay_chunk,
+					(SELECT coalesce(sum(i_replayed),0) FROM t_partitions)::integer,
+					(SELECT coalesce(sum(i_ddl),0) FROM t_partitions)::integer
+				);
+		"""
+		self.pgsql_cur.execute(sql_replayed, (id_batch, last_event, last_event, self.i_id_source, id_batch, replay_chunk[1], replay_chunk[2]))
+		replay_status = self.pgsql_cur.fetchone()
+		return (replay_status[0], replay_status[1], tables_error or None)
+	
+	def __replay_partitions(self, id_batch, partitions, exit_on_error, replay_grouped):
+		"""
+			The method replays the partitions of events in parallel, using one replay worker for each partition.
+			The method waits for all the partitions, then commits the workers' transactions if all the partitions succeed, 
+			otherwise all the transactions are rolled back.
+			
+			:param id_batch: the batch id
+			:param partitions: the list of event id lists, one for each replay worker
+			:param exit_on_error: if true the replay stops at the first error
+			:param replay_grouped: if true the events are replayed with the grouped replay
+			:return: the list of the replay results
+			:rtype: list
+		"""
+		replay_futures = []
+		replay_engines = []
+		for worker_id, event_list in enumerate(partitions):
+			if event_list:
+				replay_engines.append(self.replay_engines[worker_id])
+				replay_futures.append(self.replay_pool.submit(self.__replay_events, self.replay_engines[worker_id], id_batch, event_list, exit_on_error, replay_grouped))
+		wait(replay_futures)
+		try:
+			replay_results = [replay_future.result() for replay_future in replay_futures]
+		except:
+			for replay_engine in replay_engines:
+				replay_engine.pgsql_conn.rollback()
+			raise
+		if [replay_result for replay_result in replay_results if replay_result[0]]:
+			for replay_engine in replay_engines:
+				replay_engine.pgsql_conn.rollback()
+		else:
+			for replay_engine in replay_engines:
+				replay_engine.pgsql_conn.commit()
+		return replay_results
+		
 	
 	def set_consistent_table(self, table, schema):
 		"""
@@ -914,6 +1660,65 @@ class pg_engine(object):
 		"""
 		self.pgsql_cur.execute(sql_set, (self.i_id_source, table, schema))
 	
+	def set_consistent_tables(self, table_list, id_batch):
+		"""
+			The method set to NULL the  binlog name and position for the tables in table_list with a single update.
+			The method is used by the read replica when the batch is closed in order to save the tables 
+			which reached the consistent point during the batch.
+			The previous binlog name and position are saved in the batch's field jsb_tables_consistent, 
+			so the method rewind_lost_batches can restore them if the batch is read again.
+			
+			:param table_list: the list of tuples with the schema and the table name
+			:param id_batch: the id of the batch being closed
+		"""
+		sql_set = """
+			WITH 
+				t_consistent AS
+				(
+					SELECT 
+						tab.i_id_table,
+						tab.v_schema_name,
+						tab.v_table_name,
+						tab.t_binlog_name,
+						tab.i_binlog_position
+					FROM 
+						sch_ninja.t_replica_tables tab
+						INNER JOIN unnest(%s::text[],%s::text[]) AS con(v_schema_name,v_table_name)
+						ON
+								tab.v_schema_name = con.v_schema_name
+							AND	tab.v_table_name = con.v_table_name
+					WHERE
+							tab.i_id_source = %s
+						AND	tab.t_binlog_name IS NOT NULL
+				),
+				t_batch AS
+				(
+					UPDATE sch_ninja.t_replica_batch
+						SET
+							jsb_tables_consistent = coalesce(jsb_tables_consistent,'[]'::jsonb)||
+							(
+								SELECT 
+									coalesce(jsonb_agg(jsonb_build_array(v_schema_name, v_table_name, t_binlog_name, i_binlog_position)),'[]'::jsonb)
+								FROM 
+									t_consistent
+							)
+					WHERE
+						i_id_batch = %s
+				)
+			UPDATE sch_ninja.t_replica_tables tab
+				SET 
+					t_binlog_name = NULL,
+					i_binlog_position = NULL
+			FROM 
+				t_consistent con
+			WHERE
+				tab.i_id_table = con.i_id_table
+			;
+		"""
+		schema_list = [table[0] for table in table_list]
+		table_names = [table[1] for table in table_list]
+		self.pgsql_cur.execute(sql_set, (schema_list, table_names, self.i_id_source, id_batch))
+	
 	def get_table_pkey(self, schema, table):
 		"""
 			The method queries the table sch_ninja.t_replica_tables and gets the primary key 
@@ -938,7 +1743,9 @@ class pg_engine(object):
 		"""
 		self.pgsql_cur.execute(sql_pkey, (schema, table, ))
 		table_pkey = self.pgsql_cur.fetchone()
-		return table_pkey[0]
+		if table_pkey:
+			return table_pkey[0]
+		return None
 		
 	def get_tables_disabled(self):
 		"""
@@ -1408,6 +2215,9 @@ class pg_engine(object):
 		"""
 			The method updates the batch status to started for the given source_id and returns the 
 			batch informations.
+			The log table where the batch's events are written is stored in the batch, so the replay can truncate 
+			the log tables when all their batches are replayed.
+			The replayed binlog name is set only if the batch is read again by rewind_lost_batches.
 			
 			:return: psycopg2 fetchall results without any manipulation
 			:rtype: psycopg2 tuple
@@ -1427,7 +2237,8 @@ class pg_engine(object):
 				)
 			UPDATE sch_ninja.t_replica_batch
 			SET 
-				b_started=True
+				b_started=True,
+				v_log_table=(SELECT v_log_table[1] from sch_ninja.t_sources WHERE i_id_source=%s)
 			FROM 
 				t_created
 			WHERE
@@ -1437,8 +2248,9 @@ class pg_engine(object):
 				i_id_batch,
 				t_binlog_name,
 				i_binlog_position,
-				(SELECT v_log_table[1] from sch_ninja.t_sources WHERE i_id_source=%s) as v_log_table,
-				t_gtid_set
+				t_replica_batch.v_log_table,
+				t_gtid_set,
+				t_replayed_binlog_name
 				
 			;
 		"""
@@ -1595,8 +2407,7 @@ class pg_engine(object):
 			else:
 				self.logger.debug("Adding source %s " % self.source)
 				schema_mappings = json.dumps(self.sources[self.source]["schema_mappings"])
-				log_table_1 = "t_log_replica_%s_1" % self.source
-				log_table_2 = "t_log_replica_%s_2" % self.source
+				log_tables = ["t_log_replica_%s_%s" % (self.source, log_id) for log_id in range(1, self.get_log_tables_number()+1)]
 				sql_add = """
 					INSERT INTO sch_ninja.t_sources 
 						( 
@@ -1608,11 +2419,11 @@ class pg_engine(object):
 						(
 							%s,
 							%s,
-							ARRAY[%s,%s]
+							%s
 						)
 					; 
 				"""
-				self.pgsql_cur.execute(sql_add, (self.source, schema_mappings, log_table_1, log_table_2))
+				self.pgsql_cur.execute(sql_add, (self.source, schema_mappings, log_tables))
 				
 				sql_parts = """SELECT sch_ninja.fn_refresh_parts() ;"""
 				self.pgsql_cur.execute(sql_parts)
@@ -1875,14 +2686,30 @@ class pg_engine(object):
 				SELECT 
 					sum(i_replayed) as total_replayed, 
 					sum(i_skipped) as total_skipped, 
-					sum(i_ddl) as total_ddl 
+					sum(i_ddl) as total_ddl,
+					(
+						SELECT 
+							i_replay_rows 
+						FROM 
+							sch_ninja.t_last_replayed 
+						WHERE 
+							i_id_source=%s
+					) as replay_rows,
+					(
+						SELECT 
+							i_replay_ms 
+						FROM 
+							sch_ninja.t_last_replayed 
+						WHERE 
+							i_id_source=%s
+					) as replay_ms
 				FROM 
 					sch_ninja.t_replica_batch 
 				WHERE 
 					i_id_source=%s;
 
 			"""
-			self.pgsql_cur.execute(sql_counters, (self.i_id_source, ))
+			self.pgsql_cur.execute(sql_counters, (self.i_id_source, self.i_id_source, self.i_id_source))
 			replica_counters = self.pgsql_cur.fetchone()
 			
 			
@@ -2163,69 +2990,103 @@ class pg_engine(object):
 	def write_batch(self, group_insert):
 		"""
 			Main method for adding the batch data in the log tables. 
-			The row data from group_insert are mogrified in CSV format and stored in
-			the string like object csv_file.
-			
-			psycopg2's copy expert is used to store the event data in PostgreSQL.
+			The batch is stored with a single COPY using the method __copy_batch.
 			
-			Should any error occur the procedure fallsback to insert_batch.
+			Should the COPY fail (e.g. for a row with NUL characters) the batch is split in two halves, and each half is 
+			stored again with COPY. The split is repeated until the failing chunk is smaller or equal to the class attribute 
+			copy_min_rows, then the procedure fallsback to insert_batch for the chunk. 
+			This way the problematic rows are isolated with a number of COPY proportional to the logarithm of the batch size, 
+			and only a small chunk is processed row by row.
 			
 			:param group_insert: the event data built in mysql_engine
 		"""
-		csv_file=io.StringIO()
+		if not group_insert:
+			return
 		self.set_application_name("writing batch")
-		insert_list=[]
-		for row_data in group_insert:
-			global_data=row_data["global_data"]
-			event_after=row_data["event_after"]
-			event_before=row_data["event_before"]
-			log_table=global_data["log_table"]
-			insert_list.append(self.pgsql_cur.mogrify("%s,%s,%s,%s,%s,%s,%s,%s,%s" ,  (
-						global_data["batch_id"], 
-						global_data["table"],  
-						global_data["schema"], 
-						global_data["action"], 
-						global_data["binlog"], 
-						global_data["logpos"], 
-						json.dumps(event_after, cls=pg_encoder), 
-						json.dumps(event_before, cls=pg_encoder), 
-						global_data["event_time"], 
-						
-					)
-				)
-			)
-											
-		csv_data=b"\n".join(insert_list ).decode()
-		csv_file.write(csv_data)
-		csv_file.seek(0)
+		self.__write_batch_chunk(group_insert)
+		self.set_application_name("idle")
+	
+	def __write_batch_chunk(self, group_insert):
+		"""
+			The method stores a chunk of the batch with COPY. If the COPY fails the chunk is split in two halves which 
+			are stored recursively. The chunks with size smaller or equal to copy_min_rows are stored with insert_batch.
+			
+			:param group_insert: the chunk of event data to store
+		"""
 		try:
-			sql_copy=sql.SQL("""
-				COPY "sch_ninja".{}
-					(
-						i_id_batch, 
-						v_table_name, 
-						v_schema_name, 
-						enm_binlog_event, 
-						t_binlog_name, 
-						i_binlog_position, 
-						jsb_event_after,
-						jsb_event_before,
-						i_my_event_time
-					) 
-				FROM 
-					STDIN 
-					WITH NULL 'NULL' 
-					CSV QUOTE '''' 
-					DELIMITER ',' 
-					ESCAPE '''' 
-				;
-			""").format(sql.Identifier(log_table))
-			self.pgsql_cur.copy_expert(sql_copy,csv_file)
+			self.__copy_batch(group_insert)
 		except psycopg2.Error as e:
 			self.logger.error("SQLCODE: %s SQLERROR: %s" % (e.pgcode, e.pgerror))
-			self.logger.error("fallback to inserts")
+		except (UnicodeEncodeError, struct.error, TypeError) as e:
+			self.logger.error("error while encoding the batch: %s" % (e, ))
+		else:
+			return
+		if len(group_insert) <= self.copy_min_rows:
+			self.logger.error("fallback to inserts for %s rows" % (len(group_insert), ))
 			self.insert_batch(group_insert)
-		self.set_application_name("idle")
+		else:
+			split_index = len(group_insert)//2
+			self.logger.warning("splitting the batch of %s rows and retrying the copy" % (len(group_insert), ))
+			self.__write_batch_chunk(group_insert[:split_index])
+			self.__write_batch_chunk(group_insert[split_index:])
+	
+	def __copy_batch(self, group_insert):
+		"""
+			The method stores the event data in the log table with COPY. 
+			The row data from group_insert are encoded in the COPY BINARY format and written in 
+			the reusable buffer self.copy_buffer. The strings are encoded using the connection's client_encoding 
+			and the json documents are sent with the jsonb binary format, so the data is not escaped and 
+			parsed again by PostgreSQL.
+			
+			psycopg2's copy expert is used to store the event data in PostgreSQL.
+			Any encoding or database error is raised to the caller.
+			
+			:param group_insert: the event data built in mysql_engine
+		"""
+		pg_encoding = self.get_client_encoding()
+		copy_buffer = self.copy_buffer
+		copy_buffer.seek(0)
+		copy_buffer.truncate()
+		copy_buffer.write(COPY_BINARY_HEADER)
+		dumps = self.row_encoder.dumps
+		log_table = None
+		for row_data in group_insert:
+			global_data=row_data["global_data"]
+			log_table=global_data["log_table"]
+			copy_buffer.write(b"".join((
+					COPY_LOG_FIELDS, 
+					copy_bigint(global_data["batch_id"]), 
+					copy_text(global_data["table"], pg_encoding), 
+					copy_text(global_data["schema"], pg_encoding), 
+					copy_text(global_data["action"], pg_encoding), 
+					copy_text(global_data["binlog"], pg_encoding), 
+					copy_bigint(global_data["logpos"]), 
+					copy_jsonb(dumps(row_data["event_after"]), pg_encoding), 
+					copy_jsonb(dumps(row_data["event_before"]), pg_encoding), 
+					copy_bigint(global_data["event_time"]), 
+				))
+			)
+		copy_buffer.write(COPY_BINARY_TRAILER)
+		copy_buffer.seek(0)
+		sql_copy=sql.SQL("""
+			COPY "sch_ninja".{}
+				(
+					i_id_batch, 
+					v_table_name, 
+					v_schema_name, 
+					enm_binlog_event, 
+					t_binlog_name, 
+					i_binlog_position, 
+					jsb_event_after,
+					jsb_event_before,
+					i_my_event_time
+				) 
+			FROM 
+				STDIN 
+				WITH (FORMAT BINARY)
+			;
+		""").format(sql.Identifier(log_table))
+		self.pgsql_cur.copy_expert(sql_copy,copy_buffer)
 	
 	def insert_batch(self,group_insert):
 		"""
@@ -2278,8 +3139,8 @@ class pg_engine(object):
 						global_data["action"], 
 						global_data["binlog"], 
 						global_data["logpos"], 
-						json.dumps(event_after, cls=pg_encoder), 
-						json.dumps(event_before, cls=pg_encoder), 
+						self.row_encoder.dumps(event_after), 
+						self.row_encoder.dumps(event_before), 
 						event_time
 					)
 				)
@@ -2301,8 +3162,8 @@ class pg_engine(object):
 								global_data["action"], 
 								global_data["binlog"], 
 								global_data["logpos"], 
-								json.dumps(event_after, cls=pg_encoder), 
-								json.dumps(event_before, cls=pg_encoder), 
+								self.row_encoder.dumps(event_after), 
+								self.row_encoder.dumps(event_before), 
 								event_time
 							)
 						)
@@ -2320,7 +3181,8 @@ class pg_engine(object):
 	def save_discarded_row(self,row_data):
 		"""
 			The method saves the discarded row in the table t_discarded_row along with the id_batch.
-			The row is encoded in base64 as the t_row_data is a text field.
+			The row is encoded in json with the row encoder and then hexlified as the t_row_data is a text field.
+			If the row cannot be encoded in json its string representation is used instead.
 			
 			:param row_data: the row data dictionary
 			
@@ -2329,7 +3191,10 @@ class pg_engine(object):
 		schema = global_data["schema"]
 		table  = global_data["table"]
 		batch_id = global_data["batch_id"]
-		str_data = '%s' %(row_data, )
+		try:
+			str_data = self.row_encoder.dumps(row_data)
+		except (TypeError, ValueError):
+			str_data = '%s' %(row_data, )
 		hex_row = binascii.hexlify(str_data.encode())
 		sql_save="""
 			INSERT INTO sch_ninja.t_discarded_rows
@@ -2968,6 +3833,334 @@ class pg_engine(object):
 			""").format(sql.Identifier(log_table[0]))
 			self.logger.debug("Cleaning table %s" % log_table[0])
 			self.pgsql_cur.execute(sql_cleanup, (self.i_id_source, ))
+	
+	def get_log_tables_durability(self):
+		"""
+			The method returns the durability of the log tables set with the source's parameter log_tables_durability.
+			The accepted values are logged (default), async and unlogged. 
+			With async the read and replay sessions run with synchronous_commit off.
+			With unlogged the log tables are unlogged as well. 
+			
+			:return: the log tables durability
+			:rtype: string
+		"""
+		try:
+			durability = self.sources[self.source]["log_tables_durability"]
+		except KeyError:
+			durability = 'logged'
+		if durability not in ['logged', 'async', 'unlogged']:
+			self.logger.warning("Invalid log_tables_durability %s for source %s, using logged." % (durability, self.source))
+			durability = 'logged'
+		return durability
+	
+	def set_synchronous_commit(self):
+		"""
+			The method disables the synchronous_commit for the session if the source's log_tables_durability is async or unlogged.
+			A crash of the PostgreSQL server can lose the last transactions, in that case the replica restarts from the last 
+			batch saved in t_replica_batch.
+		"""
+		if self.get_log_tables_durability() in ['async', 'unlogged']:
+			self.logger.debug("Disabling the synchronous_commit for the session.")
+			self.pgsql_cur.execute("SET synchronous_commit TO off;")
+	
+	def rewind_lost_batches(self):
+		"""
+			The method restarts the replica from the first processed and not replayed batch with lost events.
+			The events are lost if the log tables are unlogged and the PostgreSQL server crashes, as the unlogged tables 
+			are truncated by the crash recovery.
+			A batch has lost events when the batch's last event is missing and the batch is not entirely replayed.
+			
+			The consistent points of the tables saved by the batch and the following batches are restored, the following 
+			batches are removed and the batch is set as not processed, so the read replica reads the batch again from its 
+			binlog coordinates. If the batch was partially replayed the binlog position of the last replayed event is saved 
+			in the batch, and set_batch_processed skips the events already replayed.
+			The partitions committed by the parallel replay after the last replayed event are kept, as their events 
+			are already applied to the target tables. Their event ids are lost with the log events, so set_batch_processed 
+			maps them to the events read again using the binlog coordinates saved in the partitions.
+			The method should be executed only before starting a replica process.
+			The method assumes there is a database connection active.
+		"""
+		self.set_source_id()
+		sql_lost = """
+			SELECT 
+				bat.i_id_batch,
+				evt.i_id_last_event,
+				evt.t_binlog_name,
+				evt.i_binlog_position
+			FROM 
+				sch_ninja.t_replica_batch bat
+				INNER JOIN sch_ninja.t_batch_events evt
+				ON
+					evt.i_id_batch=bat.i_id_batch
+			WHERE 
+					bat.i_id_source=%s
+				AND	bat.b_processed
+				AND	NOT bat.b_replayed
+				AND	evt.i_id_last_event<evt.i_id_max_event
+				AND	NOT EXISTS 
+					(
+						SELECT 
+							1
+						FROM 
+							sch_ninja.t_log_replica log
+						WHERE
+								log.i_id_batch=bat.i_id_batch
+							AND	log.i_id_event=evt.i_id_max_event
+					)
+			ORDER BY 
+				bat.ts_created
+			LIMIT 1
+			;
+		"""
+		self.pgsql_cur.execute(sql_lost, (self.i_id_source, ))
+		lost_batch = self.pgsql_cur.fetchone()
+		if not lost_batch:
+			return
+		id_batch = lost_batch[0]
+		if lost_batch[1] > 0:
+			replayed_binlog_name = lost_batch[2]
+			replayed_binlog_position = lost_batch[3]
+		else:
+			replayed_binlog_name = None
+			replayed_binlog_position = None
+		self.logger.warning("The log events for the batch %s are lost. Restarting the replica from the batch %s." % (id_batch, id_batch))
+		sql_restore = """
+			UPDATE sch_ninja.t_replica_tables tab
+				SET
+					t_binlog_name=con.jsb_table->>2,
+					i_binlog_position=(con.jsb_table->>3)::bigint
+			FROM 
+				(
+					SELECT 
+						jsonb_array_elements(bat.jsb_tables_consistent) AS jsb_table
+					FROM 
+						sch_ninja.t_replica_batch bat
+					WHERE
+							bat.i_id_source=%s
+						AND	bat.i_id_batch>=%s
+						AND	bat.jsb_tables_consistent IS NOT NULL
+				) con
+			WHERE
+					tab.i_id_source=%s
+				AND	tab.v_schema_name=con.jsb_table->>0
+				AND	tab.v_table_name=con.jsb_table->>1
+			;
+		"""
+		sql_delete = """
+			DELETE FROM sch_ninja.t_replica_batch
+			WHERE
+					i_id_source=%s
+				AND	i_id_batch>%s
+			;
+		"""
+		sql_clean_events = """
+			DELETE FROM sch_ninja.t_log_replica
+			WHERE
+				i_id_batch=%s
+			;
+		"""
+		sql_clean_cursor = """
+			DELETE FROM sch_ninja.t_batch_events
+			WHERE
+				i_id_batch=%s
+			;
+		"""
+		sql_reset = """
+			UPDATE sch_ninja.t_replica_batch
+				SET
+					b_started=False,
+					b_processed=False,
+					ts_processed=NULL,
+					jsb_tables_consistent=NULL,
+					t_replayed_binlog_name=%s,
+					i_replayed_binlog_position=%s
+			WHERE
+				i_id_batch=%s
+			;
+		"""
+		self.set_autocommit_db(False)
+		self.pgsql_cur.execute(sql_restore, (self.i_id_source, id_batch, self.i_id_source))
+		self.pgsql_cur.execute(sql_delete, (self.i_id_source, id_batch))
+		self.pgsql_cur.execute(sql_clean_events, (id_batch, ))
+		self.pgsql_cur.execute(sql_clean_cursor, (id_batch, ))
+		self.pgsql_cur.execute(sql_reset, (replayed_binlog_name, replayed_binlog_position, id_batch))
+		self.pgsql_conn.commit()
+		self.set_autocommit_db(True)
+	
+	def get_log_tables_number(self):
+		"""
+			The method returns the number of log tables in the source's ring, set with the source's parameter log_tables.
+			The minimum and default value is 2.
+			
+			:return: the number of log tables
+			:rtype: integer
+		"""
+		try:
+			log_tables = int(self.sources[self.source]["log_tables"])
+		except KeyError:
+			log_tables = 2
+		return max(log_tables, 2)
+	
+	def set_log_tables(self):
+		"""
+			The method adds the missing log tables to the source's ring when the parameter log_tables is 
+			greater than the number of log tables registered for the source. The new tables are created with 
+			the function fn_refresh_parts.
+			Reducing the number of log tables is not supported, the existing tables are kept in the ring.
+			The log tables are then set as logged or unlogged according with the parameter log_tables_durability.
+			The method assumes there is a database connection active.
+		"""
+		self.set_source_id()
+		log_tables_number = self.get_log_tables_number()
+		sql_log_tables = """
+			SELECT 
+				v_log_table
+			FROM 
+				sch_ninja.t_sources  
+			WHERE 
+				i_id_source=%s
+			;
+		"""
+		self.pgsql_cur.execute(sql_log_tables, (self.i_id_source, ))
+		log_tables = self.pgsql_cur.fetchone()[0]
+		if len(log_tables) > log_tables_number:
+			self.logger.warning("The source %s has %s log tables, reducing the log tables to %s is not supported." % (self.source, len(log_tables), log_tables_number))
+		elif len(log_tables) < log_tables_number:
+			new_tables = []
+			log_id = 0
+			while len(log_tables) + len(new_tables) < log_tables_number:
+				log_id += 1
+				log_table = "t_log_replica_%s_%s" % (self.source, log_id)
+				if log_table not in log_tables:
+					new_tables.append(log_table)
+			self.logger.info("Adding the log tables %s to the source %s" % (', '.join(new_tables), self.source))
+			sql_add = """
+				UPDATE sch_ninja.t_sources 
+				SET 
+					v_log_table=v_log_table||%s::character varying[]
+				WHERE 
+					i_id_source=%s
+				;
+			"""
+			self.pgsql_cur.execute(sql_add, (new_tables, self.i_id_source))
+			sql_parts = """SELECT sch_ninja.fn_refresh_parts() ;"""
+			self.pgsql_cur.execute(sql_parts)
+		
+		if self.get_log_tables_durability() == 'unlogged':
+			log_persistence = 'u'
+		else:
+			log_persistence = 'p'
+		sql_persistence = """
+			SELECT 
+				tab.relname
+			FROM 
+				pg_class tab
+				INNER JOIN pg_namespace sch
+				ON
+					tab.relnamespace=sch.oid
+				INNER JOIN 
+				(
+					SELECT 
+						unnest(v_log_table) AS v_log_table
+					FROM 
+						sch_ninja.t_sources  
+					WHERE 
+						i_id_source=%s
+				) log
+				ON
+					tab.relname=log.v_log_table
+			WHERE
+					sch.nspname='sch_ninja'
+				AND	tab.relpersistence<>%s
+			;
+		"""
+		self.pgsql_cur.execute(sql_persistence, (self.i_id_source, log_persistence))
+		log_tables = self.pgsql_cur.fetchall()
+		for log_table in log_tables:
+			if log_persistence == 'u':
+				self.logger.info("Setting the log table %s as unlogged" % (log_table[0], ))
+				sql_alter = sql.SQL("""ALTER TABLE sch_ninja.{} SET UNLOGGED;""").format(sql.Identifier(log_table[0]))
+			else:
+				self.logger.info("Setting the log table %s as logged" % (log_table[0], ))
+				sql_alter = sql.SQL("""ALTER TABLE sch_ninja.{} SET LOGGED;""").format(sql.Identifier(log_table[0]))
+			self.pgsql_cur.execute(sql_alter)
+	
+	def truncate_replayed_log_tables(self):
+		"""
+			The method truncates the source's log tables where all the batches are replayed. 
+			The replay doesn't delete the replayed events, which are removed only by this method.
+			Each table is locked in access exclusive mode using the lock_timeout, then the batches are checked again 
+			in order to make sure no batch wrote new events in the meanwhile. If the lock is not acquired the table is 
+			skipped and truncated in the next run.
+			The batches without log table, created by the previous catalogue versions, prevent the truncate only of the 
+			log tables where they have events, until they are replayed.
+			The method assumes there is a database connection active.
+		"""
+		sql_log_tables = """
+			SELECT 
+				unnest(v_log_table)
+			FROM 
+				sch_ninja.t_sources  
+			WHERE 
+				i_id_source=%s
+			;
+		"""
+		sql_replayed = """
+			SELECT 
+				NOT EXISTS 
+				(
+					SELECT 
+						1 
+					FROM 
+						sch_ninja.t_replica_batch bat
+					WHERE 
+							bat.i_id_source=%s
+						AND	NOT bat.b_replayed
+						AND	(
+								bat.v_log_table=%s
+							OR	(
+										bat.v_log_table IS NULL
+									AND	EXISTS 
+									(
+										SELECT 
+											1 
+										FROM 
+											sch_ninja.{} log
+										WHERE
+											log.i_id_batch=bat.i_id_batch
+									)
+								)
+						)
+				)
+			;
+		"""
+		self.pgsql_cur.execute(sql_log_tables, (self.i_id_source, ))
+		log_tables = self.pgsql_cur.fetchall()
+		for log_table in log_tables:
+			sql_empty = sql.SQL("""SELECT NOT EXISTS (SELECT 1 FROM sch_ninja.{});""").format(sql.Identifier(log_table[0]))
+			sql_table_replayed = sql.SQL(sql_replayed).format(sql.Identifier(log_table[0]))
+			self.pgsql_cur.execute(sql_empty)
+			if self.pgsql_cur.fetchone()[0]:
+				continue
+			self.pgsql_cur.execute(sql_table_replayed, (self.i_id_source, log_table[0]))
+			if not self.pgsql_cur.fetchone()[0]:
+				continue
+			self.set_autocommit_db(False)
+			try:
+				self.set_lock_timeout()
+				sql_lock = sql.SQL("""LOCK TABLE sch_ninja.{} IN ACCESS EXCLUSIVE MODE;""").format(sql.Identifier(log_table[0]))
+				self.pgsql_cur.execute(sql_lock)
+				self.pgsql_cur.execute(sql_table_replayed, (self.i_id_source, log_table[0]))
+				if self.pgsql_cur.fetchone()[0]:
+					self.logger.debug("Truncating the replayed log table %s" % (log_table[0], ))
+					sql_truncate = sql.SQL("""TRUNCATE TABLE sch_ninja.{};""").format(sql.Identifier(log_table[0]))
+					self.pgsql_cur.execute(sql_truncate)
+				self.pgsql_conn.commit()
+			except psycopg2.Error as e:
+				self.pgsql_conn.rollback()
+				self.logger.debug("Could not truncate the log table %s. SQLCODE: %s SQLERROR: %s" % (log_table[0], e.pgcode, e.pgerror))
+			self.set_autocommit_db(True)
+			self.unset_lock_timeout()
 			
 	
 
@@ -3126,7 +4319,7 @@ class pg_engine(object):
 		sql_log_table="""
 			UPDATE sch_ninja.t_sources 
 			SET 
-				v_log_table=ARRAY[v_log_table[2],v_log_table[1]]
+				v_log_table=v_log_table[2:array_length(v_log_table,1)]||v_log_table[1:1]
 				
 			WHERE 
 				i_id_source=%s
@@ -3252,10 +4445,62 @@ class pg_engine(object):
 		sql_copy='COPY "%s"."%s" (%s) FROM STDIN WITH NULL \'NULL\' CSV QUOTE \'"\' DELIMITER \',\' ESCAPE \'"\' ; ' % (schema, table, column_list)		
 		self.pgsql_cur.copy_expert(sql_copy,csv_file)
 		
+	def get_client_encoding(self):
+		"""
+			The method returns the python codec matching the connection's client_encoding.
+			The codec is used to encode the data sent as bytes with COPY.
+			The method assumes there is a database connection active.
+			
+			:return: the python codec name
+			:rtype: string
+		"""
+		return psycopg2.extensions.encodings[self.pgsql_conn.encoding]
+	
+	def delete_copy_chunk(self, schema, table, copy_chunk):
+		"""
+			The method deletes the rows of a copy chunk from the loading table, before the chunk is copied again.
+			The chunk's start and end are the primary key's range, the start is included and the end excluded. 
+			A missing start or end means the range is open on that side.
+			
+			:param schema: the loading schema
+			:param table: the table name
+			:param copy_chunk: the dictionary with the chunk's column, start and end
+		"""
+		chunk_filter = [sql.SQL("TRUE")]
+		chunk_values = []
+		if copy_chunk["start"] is not None:
+			chunk_filter.append(sql.SQL("{}>=%s").format(sql.Identifier(copy_chunk["column"])))
+			chunk_values.append(copy_chunk["start"])
+		if copy_chunk["end"] is not None:
+			chunk_filter.append(sql.SQL("{}<%s").format(sql.Identifier(copy_chunk["column"])))
+			chunk_values.append(copy_chunk["end"])
+		sql_delete = sql.SQL("""DELETE FROM {}.{} WHERE {};""").format(sql.Identifier(schema), sql.Identifier(table), sql.SQL(" AND ").join(chunk_filter))
+		self.pgsql_cur.execute(sql_delete, chunk_values)
+	
 	def insert_data(self, schema, table, insert_data , column_list):
 		"""
 			The method is a fallback procedure for when the copy method fails.
-			The procedure performs a row by row insert, very slow but capable to skip the rows with problematic data (e.g. encoding issues).
+			The rows are inserted with a single multi row insert built by psycopg2's execute_values.
+			If the insert fails the rows are inserted one by one with the method __insert_rows, 
+			which skips only the rows with problematic data (e.g. encoding issues).
+			
+			:param schema: the schema name where table belongs
+			:param table: the table name where the data should be inserted
+			:param insert_data: a list of records extracted from the database using the unbuffered cursor
+			:param column_list: the list of column names quoted  for the inserts
+		"""
+		if len(insert_data) == 0:
+			return
+		sql_head='INSERT INTO "%s"."%s"(%s) VALUES %%s;' % (schema, table, column_list)
+		try:
+			execute_values(self.pgsql_cur, sql_head, insert_data, page_size=len(insert_data))
+		except (psycopg2.Error, ValueError) as e:
+			self.logger.warning("The multi row insert in %s.%s failed, inserting the %s rows one by one. Error: %s" % (schema, table, len(insert_data), e))
+			self.__insert_rows(schema, table, insert_data , column_list)
+	
+	def __insert_rows(self, schema, table, insert_data , column_list):
+		"""
+			The method performs a row by row insert, very slow but capable to skip the rows with problematic data (e.g. encoding issues).
 			
 			:param schema: the schema name where table belongs
 			:param table: the table name where the data should be inserted
@@ -3378,7 +4623,14 @@ class pg_engine(object):
 	def set_batch_processed(self, id_batch):
 		"""
 			The method updates the flag b_processed and sets the processed timestamp for the given batch id.
-			The event ids are aggregated into the table t_batch_events used by the replay function.
+			If the batch has any event a row is added to the table t_batch_events. The row stores the replay cursor, 
+			which is the last replayed event id of the batch, used by the replay function to read the events in chunks, 
+			and the batch's last event id.
+			If the batch was read again by rewind_lost_batches the cursor starts after the events already replayed, 
+			which are the events with binlog position up to the batch's replayed binlog position, and the partitions 
+			already replayed by the parallel replay get the ids of the events with the same binlog coordinates. 
+			Only a batch read again can have partitions when it's set as processed.
+			Finally the replay daemon is woken up with a notification on the source's replay channel.
 			
 			:param id_batch: the id batch to set as processed
 		"""
@@ -3393,33 +4645,68 @@ class pg_engine(object):
 			;
 		"""
 		self.pgsql_cur.execute(sql_update, (id_batch, ))
-		self.logger.debug("collecting events id for batch %s " % (id_batch, ))
+		self.logger.debug("adding the replay cursor for batch %s " % (id_batch, ))
 		sql_collect_events = """
 			INSERT INTO
 				sch_ninja.t_batch_events
 				(
 					i_id_batch,
-					i_id_event
+					i_id_last_event,
+					i_id_max_event
 				)
 			SELECT
-				i_id_batch,
-				array_agg(i_id_event)
-			FROM
-			(
-				SELECT 
-					i_id_batch,
-					i_id_event,
-					ts_event_datetime
-				FROM 
-					sch_ninja.t_log_replica 
-				WHERE i_id_batch=%s
-				ORDER BY ts_event_datetime
-			) t_event
-			GROUP BY
-					i_id_batch
+				bat.i_id_batch,
+				coalesce(
+					(
+						SELECT 
+							max(log.i_id_event)
+						FROM 
+							sch_ninja.t_log_replica log
+						WHERE
+								log.i_id_batch=bat.i_id_batch
+							AND	(substring(log.t_binlog_name from '[0-9]+$')::bigint,log.i_binlog_position)<=
+								(substring(bat.t_replayed_binlog_name from '[0-9]+$')::bigint,bat.i_replayed_binlog_position)
+					),
+					0
+				),
+				evt.i_id_max_event
+			FROM 
+				sch_ninja.t_replica_batch bat,
+				(
+					SELECT 
+						max(i_id_event) AS i_id_max_event
+					FROM 
+						sch_ninja.t_log_replica 
+					WHERE i_id_batch=%s
+				) evt
+			WHERE 
+					bat.i_id_batch=%s
+				AND	evt.i_id_max_event IS NOT NULL
+			;
+		"""
+		self.pgsql_cur.execute(sql_collect_events, (id_batch, id_batch))
+		sql_map_partitions = """
+			UPDATE sch_ninja.t_replay_partitions par
+				SET
+					i_id_events=ARRAY(
+						SELECT 
+							log.i_id_event
+						FROM 
+							sch_ninja.t_log_replica log
+						WHERE
+								log.i_id_batch=par.i_id_batch
+							AND	par.jsb_binlog_events @> jsonb_build_array(jsonb_build_array(log.v_schema_name, log.v_table_name, log.t_binlog_name, log.i_binlog_position))
+						ORDER BY 
+							log.i_id_event
+					)
+			WHERE
+					par.i_id_batch=%s
+				AND	par.jsb_binlog_events IS NOT NULL
 			;
 		"""
-		self.pgsql_cur.execute(sql_collect_events, (id_batch, ))
+		self.pgsql_cur.execute(sql_map_partitions, (id_batch, ))
+		sql_notify = """SELECT pg_notify(%s, %s);"""
+		self.pgsql_cur.execute(sql_notify, (self.get_replay_channel(), str(id_batch)))
 	
 	def __swap_enums(self):
 		"""
@@ -4021,96 +5308,6 @@ class pg_engine(object):
 			wait_result = self.pgsql_cur.fetchone()[0]
 			time.sleep(5)
 	
-	def __wait_for_self_pause(self):
-		"""
-			The method returns the status of the replica. This value is used in both read/replay replica methods for updating the corresponding flags.
-			:return: the b_paused flag for the current source
-			:rtype: boolean
-		"""
-		sql_wait = """
-			SELECT 
-				CASE
-					WHEN src.enm_status IN ('stopped','initialised','synced')
-						THEN 'proceed'
-					WHEN src.enm_status = 'running'
-						THEN 
-							CASE
-								WHEN 
-										src.b_paused 
-									AND	rcv.b_paused
-									AND	rep.b_paused
-								THEN
-									'proceed'
-								WHEN 
-										src.b_paused 
-								THEN
-									'wait'
-								ELSE
-									'abort'
-							END
-					ELSE
-						'abort'
-				END AS t_action,
-				src.enm_status,
-				rcv.b_paused,
-				rep.b_paused,
-				src.b_paused
-				
-			FROM 
-				sch_ninja.t_sources src
-				INNER JOIN sch_ninja.t_last_received rcv
-				ON
-					src.i_id_source=rcv.i_id_source
-				INNER JOIN sch_ninja.t_last_replayed rep
-				ON
-					src.i_id_source=rep.i_id_source
-				
-			WHERE 
-					src.i_id_source=%s
-			;
-		"""
-		self.logger.info("Waiting for the replica daemons to pause")
-		wait_result = 'wait'
-		while wait_result == 'wait':
-			self.pgsql_cur.execute(sql_wait, (self.i_id_source, ))
-			wait_result = self.pgsql_cur.fetchone()[0]
-			time.sleep(10)
-		
-		return wait_result
-		
-
-	def __vacuum_full_log_tables(self):
-		"""
-			The method runs a VACUUM FULL on the log tables for the given source 
-		"""
-		sql_vacuum = """
-			SELECT 
-				v_log_table,
-				format('VACUUM FULL sch_ninja.%%I ;',
-				v_log_table
-				)
-			FROM
-			(
-				SELECT 
-					unnest(v_log_table) AS v_log_table 
-				FROM 
-					sch_ninja.t_sources 
-				WHERE 
-					i_id_source=%s
-			) log
-			;
-		"""
-		self.pgsql_cur.execute(sql_vacuum, (self.i_id_source, ))
-		vacuum_sql = self.pgsql_cur.fetchall()
-		for sql_stat in vacuum_sql:
-			self.logger.info("Running VACUUM FULL on the table %s" % (sql_stat[0]))
-			try:
-				self.pgsql_cur.execute(sql_stat[1])
-			except:
-				self.logger.error("An error occurred when running VACUUM FULL on the table %s" % (sql_stat[0]))
-		
-		
-		
 	def __vacuum_log_tables(self):
 		"""
 			The method runs a VACUUM on the log tables for the given source 
@@ -4145,11 +5342,12 @@ class pg_engine(object):
 	def run_maintenance(self):
 		"""
 			The method runs the maintenance for the given source.
-			After the replica daemons are paused the procedure detach the log tables from the parent log table and performs a VACUUM FULL againts the tables.
-			If any error occurs the tables are attached to the parent table and the replica daemons resumed.
+			As the replayed log tables are truncated the maintenance doesn't require the replica daemons pause.
+			The method truncates the replayed log tables and runs a VACUUM on the log tables.
+			The truncate releases the space used by the log tables, therefore the full maintenance runs the same steps 
+			without the VACUUM FULL.
 			
 		"""
-		self.logger.info("Pausing the replica daemons")
 		self.connect_db()
 		self.set_source_id()
 		check_maintenance = self.__check_maintenance()
@@ -4157,18 +5355,11 @@ class pg_engine(object):
 			self.logger.info("The source is already in maintenance. Skipping the maintenance run.")
 		else:
 			self.__start_maintenance()
-			self.__pause_replica(others=False)
-			wait_result = self.__wait_for_self_pause()
-			if wait_result == 'abort':
-				self.logger.error("Cannot proceed with the maintenance")
-				return wait_result
 			if self.full:
-				self.__vacuum_full_log_tables()
-			else:
-				self.__vacuum_log_tables()
+				self.logger.info("The log tables are truncated after the replay, the VACUUM FULL is not required. Running the normal maintenance.")
+			self.truncate_replayed_log_tables()
+			self.__vacuum_log_tables()
 			self.__set_last_maintenance()
-			self.logger.info("Resuming the replica daemons")
-			self.__resume_replica(others=False)
 			self.__end_maintenance()
 			self.disconnect_db()
 			notifier_message = "maintenance for source %s is complete" % self.source
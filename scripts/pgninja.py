@@ -33,7 +33,7 @@ debug_help = """Forces the debug mode with logging on stdout and log level debug
 logid_help = """Specifies the log id entry for displaying the error details"""
 version_help = """Displays pg_ninja's installed  version."""
 rollbar_help = """Overrides the level for messages to be sent to rolllbar. One of: "critical", "error", "warning", "info". The Default is "info" """
-full_help = """When specified with run_maintenance the switch performs a vacuum full instead of a normal vacuum. """
+full_help = """Kept for compatibility. The log tables are truncated after the replay, therefore run_maintenance always performs a normal vacuum. """
 
 parser = argparse.ArgumentParser(description='Command line for pg_ninja.',  add_help=True)
 parser.add_argument('command', type=str, help=command_help)
@@ -0,0 +1,906 @@
+-- upgrade catalogue script 2.0.3 to 2.0.4
+
+
+CREATE TABLE sch_ninja.t_table_type_map
+(
+	i_id_source bigint NOT NULL,
+	v_schema_name character varying(100) NOT NULL,
+	v_table_name character varying(100) NOT NULL,
+	jsb_column_types jsonb NOT NULL,
+	CONSTRAINT pk_t_table_type_map PRIMARY KEY (i_id_source,v_schema_name,v_table_name),
+	CONSTRAINT fk_t_table_type_map_i_id_source FOREIGN KEY (i_id_source)
+	REFERENCES sch_ninja.t_sources (i_id_source)
+	ON UPDATE RESTRICT ON DELETE CASCADE
+)
+;
+
+CREATE TABLE sch_ninja.t_replay_partitions
+(
+	i_id_batch	bigint NOT NULL,
+	i_id_events	bigint[] NOT NULL,
+	i_replayed	integer NOT NULL DEFAULT 0,
+	i_ddl	integer NOT NULL DEFAULT 0,
+	jsb_binlog_events	jsonb NULL,
+	CONSTRAINT fk_t_replay_partitions_i_id_batch FOREIGN KEY (i_id_batch)
+	REFERENCES sch_ninja.t_replica_batch(i_id_batch)
+	ON UPDATE RESTRICT ON DELETE CASCADE
+)
+;
+
+CREATE INDEX idx_t_replay_partitions_i_id_batch 
+	ON sch_ninja.t_replay_partitions (i_id_batch);
+
+CREATE TYPE sch_ninja.ty_replay_events 
+	AS
+	(
+		b_error  boolean,
+		v_table_error character varying[],
+		i_replayed integer,
+		i_ddl integer
+	);
+
+CREATE TYPE sch_ninja.ty_replay_chunk 
+	AS
+	(
+		i_id_batch bigint,
+		i_id_evt_replay bigint[],
+		ts_evt_source timestamp without time zone
+	);
+
+CREATE OR REPLACE FUNCTION sch_ninja.fn_refresh_parts() 
+RETURNS VOID as 
+$BODY$
+DECLARE
+    t_sql text;
+    r_tables record;
+BEGIN
+    FOR r_tables IN SELECT unnest(v_log_table) as v_log_table FROM sch_ninja.t_sources
+    LOOP
+        RAISE DEBUG 'CREATING TABLE %', r_tables.v_log_table;
+        t_sql:=format('
+			CREATE TABLE IF NOT EXISTS sch_ninja.%I
+			(
+			CONSTRAINT pk_%s PRIMARY KEY (i_id_event),
+			  CONSTRAINT fk_%s FOREIGN KEY (i_id_batch) 
+				REFERENCES  sch_ninja.t_replica_batch (i_id_batch)
+			ON UPDATE RESTRICT ON DELETE CASCADE
+			)
+			INHERITS (sch_ninja.t_log_replica)
+			;',
+                        r_tables.v_log_table,
+                        r_tables.v_log_table,
+                        r_tables.v_log_table
+                );
+        EXECUTE t_sql;
+	t_sql:=format('
+			CREATE INDEX IF NOT EXISTS idx_id_batch_event_%s 
+			ON sch_ninja.%I (i_id_batch,i_id_event)
+			;',
+			r_tables.v_log_table,
+                        r_tables.v_log_table
+		);
+	EXECUTE t_sql;
+	t_sql:=format('
+			DROP INDEX IF EXISTS sch_ninja.idx_id_batch_%s 
+			;',
+			r_tables.v_log_table
+		);
+	EXECUTE t_sql;
+    END LOOP;
+END
+$BODY$
+LANGUAGE plpgsql 
+;
+CREATE OR REPLACE FUNCTION sch_ninja.fn_replay_events(integer,bigint,bigint[],boolean)
+RETURNS sch_ninja.ty_replay_events AS
+$BODY$
+	DECLARE
+		p_i_id_source		ALIAS FOR $1;
+		p_i_id_batch		ALIAS FOR $2;
+		p_i_events		ALIAS FOR $3;
+		p_b_exit_on_error	ALIAS FOR $4;
+		v_ty_events		sch_ninja.ty_replay_events;
+		v_r_statements	record;
+		v_tab_enabled	boolean;
+		
+	BEGIN
+		v_tab_enabled:=TRUE;
+		v_ty_events.b_error:=FALSE;
+		v_ty_events.i_replayed:=0;
+		v_ty_events.i_ddl:=0;
+		
+		FOR v_r_statements IN 
+
+				WITH 
+					t_tables AS
+					(
+						SELECT i_id_source,
+							v_table_name,
+							v_schema_name,
+							unnest(v_table_pkey) as v_table_pkey
+						FROM
+							sch_ninja.t_replica_tables
+						WHERE
+								b_replica_enabled
+							AND 	i_id_source=p_i_id_source
+					),
+					t_events AS 
+					(
+						SELECT 
+							i_id_event
+						FROM
+							unnest(p_i_events) AS i_id_event
+					)
+				SELECT 
+					CASE
+						WHEN enm_binlog_event = 'ddl'
+						THEN 
+							t_query
+						WHEN enm_binlog_event = 'insert'
+						THEN
+							format(
+								'INSERT INTO %I.%I (%s) VALUES (%s);',
+								v_schema_name,
+								v_table_name,
+								array_to_string(t_colunm,','),
+								array_to_string(t_event_data,',')
+								
+							)
+						WHEN enm_binlog_event = 'update'
+						THEN
+							format(
+								'UPDATE %I.%I SET %s WHERE %s;',
+								v_schema_name,
+								v_table_name,
+								t_update,
+								t_pk_update
+							)
+						WHEN enm_binlog_event = 'delete'
+						THEN
+							format(
+								'DELETE FROM %I.%I WHERE %s;',
+								v_schema_name,
+								v_table_name,
+								t_pk_data
+							)
+						
+					END AS t_sql,
+					i_id_event,
+					i_id_batch,
+					enm_binlog_event,
+					v_schema_name,
+					v_table_name,
+					t_pk_data
+				FROM
+				(
+					SELECT
+						i_id_event,
+						i_id_batch,
+						v_table_name,
+						v_schema_name,
+						enm_binlog_event,
+						t_query,
+						ts_event_datetime,
+						t_pk_data,
+						t_pk_update,
+						array_agg(quote_ident(t_column)) AS t_colunm,
+						string_agg(distinct format('%I=%L',t_column,jsb_event_after->>t_column),',') as  t_update,
+						array_agg(quote_nullable(jsb_event_after->>t_column)) as t_event_data
+					FROM
+					(
+						SELECT
+							i_id_event,
+							i_id_batch,
+							v_table_name,
+							v_schema_name,
+							enm_binlog_event,
+							jsb_event_after,
+							jsb_event_before,
+							t_query,
+							ts_event_datetime,
+							string_agg(distinct format('%I=%L',v_pkey,jsb_event_after->>v_pkey),' AND ') as  t_pk_data,
+							string_agg(distinct format('%I=%L',v_pkey,jsb_event_before->>v_pkey),' AND ') as  t_pk_update,
+							(jsonb_each_text(coalesce(jsb_event_after,'{"foo":"bar"}'::jsonb))).key AS t_column
+						FROM
+						(
+							SELECT 
+								log.i_id_event,
+								log.i_id_batch,
+								log.v_table_name,
+								log.v_schema_name,
+								log.enm_binlog_event,
+								log.jsb_event_after,
+								log.jsb_event_before,
+								log.t_query,
+								ts_event_datetime,
+								v_table_pkey as v_pkey
+								
+								
+								
+							FROM 
+								sch_ninja.t_log_replica  log
+								INNER JOIN t_tables tab
+									ON
+											tab.v_table_name=log.v_table_name
+										AND	tab.v_schema_name=log.v_schema_name
+								INNER JOIN t_events evt
+									ON	log.i_id_event=evt.i_id_event
+						) t_pkey
+						GROUP BY
+							i_id_event,
+							i_id_batch,
+							v_table_name,
+							v_schema_name,
+							enm_binlog_event,
+							jsb_event_after,
+							jsb_event_before,
+							t_query,
+							ts_event_datetime
+					) t_columns
+					GROUP BY
+						i_id_event,
+						i_id_batch,
+						v_table_name,
+						v_schema_name,
+						enm_binlog_event,
+						t_query,
+						ts_event_datetime,
+						t_pk_data,
+						t_pk_update
+				) t_sql
+				ORDER BY i_id_event			
+		LOOP
+			BEGIN
+				EXECUTE v_r_statements.t_sql;
+				IF v_r_statements.enm_binlog_event='ddl'
+				THEN
+					v_ty_events.i_ddl:=v_ty_events.i_ddl+1;
+				ELSE
+					v_ty_events.i_replayed:=v_ty_events.i_replayed+1;
+				END IF;
+				
+			EXCEPTION
+				WHEN OTHERS THEN
+					v_tab_enabled:=(
+						SELECT 
+							b_replica_enabled
+						FROM 	
+							sch_ninja.t_replica_tables
+						WHERE
+								v_schema_name=v_r_statements.v_schema_name
+								AND	v_table_name=v_r_statements.v_table_name
+						)
+						;
+				
+					IF v_tab_enabled
+					THEN
+						RAISE NOTICE 'An error occurred when replaying data for the table %.%',v_r_statements.v_schema_name,v_r_statements.v_table_name;
+						RAISE NOTICE 'SQLSTATE: % - ERROR MESSAGE %',SQLSTATE, SQLERRM;
+						RAISE NOTICE 'The table %.% has been removed from the replica',v_r_statements.v_schema_name,v_r_statements.v_table_name;
+						v_ty_events.v_table_error:=array_append(v_ty_events.v_table_error, format('%I.%I SQLSTATE: %s - ERROR MESSAGE: %s',v_r_statements.v_schema_name,v_r_statements.v_table_name,SQLSTATE, SQLERRM)::character varying) ;
+						RAISE NOTICE 'Adding error log entry for table %.% ',v_r_statements.v_schema_name,v_r_statements.v_table_name;
+						INSERT INTO sch_ninja.t_error_log
+							(
+								i_id_batch, 
+								i_id_source,
+								v_schema_name, 
+								v_table_name, 
+								t_table_pkey, 
+								t_binlog_name, 
+								i_binlog_position, 
+								ts_error, 
+								t_sql,
+								t_error_message
+							)
+							SELECT 
+								i_id_batch, 
+								p_i_id_source,
+								v_schema_name, 
+								v_table_name, 
+								v_r_statements.t_pk_data as t_table_pkey, 
+								t_binlog_name, 
+								i_binlog_position, 
+								clock_timestamp(), 
+								quote_literal(v_r_statements.t_sql) as t_sql,
+								format('%s - %s',SQLSTATE, SQLERRM) as t_error_message
+							FROM
+								sch_ninja.t_log_replica  log
+							WHERE 
+								log.i_id_event=v_r_statements.i_id_event
+						;
+						IF p_b_exit_on_error
+						THEN
+							v_ty_events.b_error:=TRUE;
+							RETURN v_ty_events;
+						ELSE
+						
+							RAISE NOTICE 'Statement %', v_r_statements.t_sql;
+							UPDATE sch_ninja.t_replica_tables 
+								SET 
+									b_replica_enabled=FALSE
+							WHERE
+									v_schema_name=v_r_statements.v_schema_name
+								AND	v_table_name=v_r_statements.v_table_name
+							;
+						END IF;
+					END IF;
+					
+
+			END;
+		END LOOP;
+		RETURN v_ty_events;
+	END;
+	
+$BODY$
+LANGUAGE plpgsql;
+CREATE OR REPLACE FUNCTION sch_ninja.fn_replay_group(integer,bigint,bigint[],boolean)
+RETURNS sch_ninja.ty_replay_events AS
+$BODY$
+	DECLARE
+		p_i_id_source		ALIAS FOR $1;
+		p_i_id_batch		ALIAS FOR $2;
+		p_i_events		ALIAS FOR $3;
+		p_b_exit_on_error	ALIAS FOR $4;
+		v_ty_events		sch_ninja.ty_replay_events;
+		v_r_group		record;
+		v_jsb_rows		jsonb;
+		v_t_sql		text;
+		
+	BEGIN
+		IF array_length(p_i_events,1)=1
+		THEN
+			RETURN sch_ninja.fn_replay_events(p_i_id_source,p_i_id_batch,p_i_events,p_b_exit_on_error);
+		END IF;
+		
+		SELECT 
+			log.v_schema_name,
+			log.v_table_name,
+			log.enm_binlog_event,
+			(
+				SELECT 
+					string_agg(quote_ident(t_column),',') 
+				FROM 
+					jsonb_object_keys(log.jsb_event_after) t_column
+			) AS t_columns,
+			(
+				SELECT 
+					string_agg(format('%I=evt.%I',t_column,t_column),',') 
+				FROM 
+					jsonb_object_keys(log.jsb_event_after) t_column
+			) AS t_update,
+			(
+				SELECT 
+					string_agg(format('tab.%I=evt.%I',v_pkey,v_pkey),' AND ') 
+				FROM 
+					unnest(tab.v_table_pkey) v_pkey
+			) AS t_pk_join
+		INTO
+			v_r_group
+		FROM 
+			sch_ninja.t_log_replica  log
+			INNER JOIN sch_ninja.t_replica_tables tab
+				ON
+						tab.v_table_name=log.v_table_name
+					AND	tab.v_schema_name=log.v_schema_name
+		WHERE
+				tab.i_id_source=p_i_id_source
+			AND	log.i_id_batch=p_i_id_batch
+			AND	log.i_id_event=p_i_events[1]
+		;
+		
+		IF NOT FOUND OR v_r_group.enm_binlog_event='ddl'
+		THEN
+			RETURN sch_ninja.fn_replay_events(p_i_id_source,p_i_id_batch,p_i_events,p_b_exit_on_error);
+		END IF;
+		
+		v_jsb_rows:=(
+			SELECT 
+				jsonb_agg(log.jsb_event_after ORDER BY log.i_id_event)
+			FROM 
+				sch_ninja.t_log_replica  log
+			WHERE
+					log.i_id_batch=p_i_id_batch
+				AND	log.i_id_event=ANY(p_i_events)
+		);
+		
+		v_t_sql:=(
+			CASE
+				WHEN v_r_group.enm_binlog_event = 'insert'
+				THEN
+					format(
+						'INSERT INTO %I.%I (%s) SELECT %s FROM jsonb_populate_recordset(NULL::%I.%I,$1);',
+						v_r_group.v_schema_name,
+						v_r_group.v_table_name,
+						v_r_group.t_columns,
+						v_r_group.t_columns,
+						v_r_group.v_schema_name,
+						v_r_group.v_table_name
+					)
+				WHEN v_r_group.enm_binlog_event = 'update'
+				THEN
+					format(
+						'UPDATE %I.%I AS tab SET %s FROM jsonb_populate_recordset(NULL::%I.%I,$1) AS evt WHERE %s;',
+						v_r_group.v_schema_name,
+						v_r_group.v_table_name,
+						v_r_group.t_update,
+						v_r_group.v_schema_name,
+						v_r_group.v_table_name,
+						v_r_group.t_pk_join
+					)
+				WHEN v_r_group.enm_binlog_event = 'delete'
+				THEN
+					format(
+						'DELETE FROM %I.%I AS tab USING jsonb_populate_recordset(NULL::%I.%I,$1) AS evt WHERE %s;',
+						v_r_group.v_schema_name,
+						v_r_group.v_table_name,
+						v_r_group.v_schema_name,
+						v_r_group.v_table_name,
+						v_r_group.t_pk_join
+					)
+			END
+		);
+		
+		BEGIN
+			EXECUTE v_t_sql USING v_jsb_rows;
+			v_ty_events.b_error:=FALSE;
+			v_ty_events.i_replayed:=array_length(p_i_events,1);
+			v_ty_events.i_ddl:=0;
+		EXCEPTION
+			WHEN OTHERS THEN
+				RAISE NOTICE 'The grouped % failed for the table %.%, replaying % events one by one',v_r_group.enm_binlog_event,v_r_group.v_schema_name,v_r_group.v_table_name,array_length(p_i_events,1);
+				RAISE NOTICE 'SQLSTATE: % - ERROR MESSAGE %',SQLSTATE, SQLERRM;
+				v_ty_events:=sch_ninja.fn_replay_events(p_i_id_source,p_i_id_batch,p_i_events,p_b_exit_on_error);
+		END;
+		
+		RETURN v_ty_events;
+	END;
+	
+$BODY$
+LANGUAGE plpgsql;
+CREATE OR REPLACE FUNCTION sch_ninja.fn_replay_events_grouped(integer,bigint,bigint[],boolean)
+RETURNS sch_ninja.ty_replay_events AS
+$BODY$
+	DECLARE
+		p_i_id_source		ALIAS FOR $1;
+		p_i_id_batch		ALIAS FOR $2;
+		p_i_events		ALIAS FOR $3;
+		p_b_exit_on_error	ALIAS FOR $4;
+		v_ty_result		sch_ninja.ty_replay_events;
+		v_ty_events		sch_ninja.ty_replay_events;
+		v_r_events		record;
+		v_i_run_events	bigint[];
+		v_i_run_start	bigint;
+		v_t_run_schema	character varying;
+		v_t_run_table	character varying;
+		v_en_run_action	sch_ninja.en_binlog_event;
+		v_t_run_columns	text[];
+		v_b_run_single	boolean;
+		
+	BEGIN
+		v_ty_result.b_error:=FALSE;
+		v_ty_result.i_replayed:=0;
+		v_ty_result.i_ddl:=0;
+		
+		/*
+			The events are replayed in runs of consecutive events with the same table, action and column list. 
+			A run is closed when an event's primary key is already present in the run, 
+			while the DDL and the updates changing the primary key are replayed alone.
+		*/
+		FOR v_r_events IN 
+			WITH 
+				t_tables AS
+				(
+					SELECT 
+						v_table_name,
+						v_schema_name,
+						v_table_pkey
+					FROM
+						sch_ninja.t_replica_tables
+					WHERE
+							b_replica_enabled
+						AND 	i_id_source=p_i_id_source
+				),
+				t_events AS
+				(
+					SELECT 
+						log.i_id_event,
+						log.v_table_name,
+						log.v_schema_name,
+						log.enm_binlog_event,
+						ARRAY(SELECT jsonb_object_keys(log.jsb_event_after)) AS t_columns,
+						(
+							SELECT 
+								jsonb_object_agg(v_pkey,log.jsb_event_after->v_pkey) 
+							FROM 
+								unnest(tab.v_table_pkey) v_pkey
+						) AS jsb_pk_after,
+						(
+							SELECT 
+								jsonb_object_agg(v_pkey,log.jsb_event_before->v_pkey) 
+							FROM 
+								unnest(tab.v_table_pkey) v_pkey
+						) AS jsb_pk_before
+					FROM 
+						sch_ninja.t_log_replica  log
+						INNER JOIN t_tables tab
+							ON
+									tab.v_table_name=log.v_table_name
+								AND	tab.v_schema_name=log.v_schema_name
+						INNER JOIN unnest(p_i_events) AS evt(i_id_event)
+							ON	log.i_id_event=evt.i_id_event
+				)
+			SELECT
+				i_id_event,
+				v_table_name,
+				v_schema_name,
+				enm_binlog_event,
+				t_columns,
+				(
+						enm_binlog_event='ddl'
+					OR	(
+								enm_binlog_event='update'
+							AND	jsb_pk_before IS DISTINCT FROM jsb_pk_after
+						)
+				) AS b_single,
+				lag(i_id_event) OVER (
+					PARTITION BY 
+						v_schema_name,
+						v_table_name,
+						jsb_pk_after 
+					ORDER BY 
+						i_id_event
+				) AS i_id_pk_previous
+			FROM
+				t_events
+			ORDER BY i_id_event
+		LOOP
+			IF 	v_i_run_events IS NOT NULL
+				AND	(
+							v_b_run_single
+						OR	v_r_events.b_single
+						OR	v_r_events.v_schema_name<>v_t_run_schema
+						OR	v_r_events.v_table_name<>v_t_run_table
+						OR	v_r_events.enm_binlog_event<>v_en_run_action
+						OR	v_r_events.t_columns<>v_t_run_columns
+						OR	coalesce(v_r_events.i_id_pk_previous>=v_i_run_start,FALSE)
+					)
+			THEN
+				v_ty_events:=sch_ninja.fn_replay_group(p_i_id_source,p_i_id_batch,v_i_run_events,p_b_exit_on_error);
+				v_ty_result.i_replayed:=v_ty_result.i_replayed+v_ty_events.i_replayed;
+				v_ty_result.i_ddl:=v_ty_result.i_ddl+v_ty_events.i_ddl;
+				v_ty_result.v_table_error:=array_cat(v_ty_result.v_table_error,v_ty_events.v_table_error);
+				IF v_ty_events.b_error
+				THEN
+					v_ty_result.b_error:=TRUE;
+					RETURN v_ty_result;
+				END IF;
+				v_i_run_events:=NULL;
+			END IF;
+			
+			IF v_i_run_events IS NULL
+			THEN
+				v_i_run_start:=v_r_events.i_id_event;
+				v_t_run_schema:=v_r_events.v_schema_name;
+				v_t_run_table:=v_r_events.v_table_name;
+				v_en_run_action:=v_r_events.enm_binlog_event;
+				v_t_run_columns:=v_r_events.t_columns;
+				v_b_run_single:=v_r_events.b_single;
+			END IF;
+			v_i_run_events:=array_append(v_i_run_events,v_r_events.i_id_event);
+		END LOOP;
+		
+		IF v_i_run_events IS NOT NULL
+		THEN
+			v_ty_events:=sch_ninja.fn_replay_group(p_i_id_source,p_i_id_batch,v_i_run_events,p_b_exit_on_error);
+			v_ty_result.i_replayed:=v_ty_result.i_replayed+v_ty_events.i_replayed;
+			v_ty_result.i_ddl:=v_ty_result.i_ddl+v_ty_events.i_ddl;
+			v_ty_result.v_table_error:=array_cat(v_ty_result.v_table_error,v_ty_events.v_table_error);
+			IF v_ty_events.b_error
+			THEN
+				v_ty_result.b_error:=TRUE;
+				RETURN v_ty_result;
+			END IF;
+		END IF;
+		RETURN v_ty_result;
+	END;
+	
+$BODY$
+LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sch_ninja.fn_get_replay_chunk(integer,integer)
+RETURNS sch_ninja.ty_replay_chunk AS
+$BODY$
+	DECLARE
+		p_i_max_events	ALIAS FOR $1;
+		p_i_id_source		ALIAS FOR $2;
+		v_ty_chunk		sch_ninja.ty_replay_chunk;
+		v_i_last_event	bigint;
+		
+	BEGIN
+		v_ty_chunk.i_id_batch:= (
+			SELECT 
+				bat.i_id_batch 
+			FROM 
+				sch_ninja.t_replica_batch bat
+				INNER JOIN  sch_ninja.t_batch_events evt
+				ON
+					evt.i_id_batch=bat.i_id_batch
+			WHERE 
+					bat.b_started 
+				AND	bat.b_processed 
+				AND	NOT bat.b_replayed
+				AND	bat.i_id_source=p_i_id_source
+			ORDER BY 
+				bat.ts_created 
+			LIMIT 1
+			)
+		;
+
+		v_i_last_event:=(
+			SELECT 
+				i_id_last_event
+			FROM 
+				sch_ninja.t_batch_events 
+			WHERE 
+				i_id_batch=v_ty_chunk.i_id_batch
+		);
+		
+		/*
+			The events already committed by the parallel replay workers of an interrupted chunk are saved in 
+			t_replay_partitions and are excluded from the chunk.
+		*/
+		v_ty_chunk.i_id_evt_replay:=ARRAY(
+			SELECT 
+				log.i_id_event
+			FROM 
+				sch_ninja.t_log_replica log
+			WHERE 
+					log.i_id_batch=v_ty_chunk.i_id_batch
+				AND	log.i_id_event>v_i_last_event
+				AND	NOT EXISTS
+					(
+						SELECT 
+							1
+						FROM 
+							sch_ninja.t_replay_partitions par
+						WHERE
+								par.i_id_batch=log.i_id_batch
+							AND	log.i_id_event=ANY(par.i_id_events)
+					)
+			ORDER BY 
+				log.i_id_event
+			LIMIT p_i_max_events
+		);
+		
+		/*
+			The chunk is extended with the remaining rows of the last binlog event, so the replay cursor 
+			always stops at the end of a binlog event and the batch can be read again from the cursor's binlog position.
+		*/
+		IF array_length(v_ty_chunk.i_id_evt_replay,1)=p_i_max_events
+		THEN
+			v_ty_chunk.i_id_evt_replay:=v_ty_chunk.i_id_evt_replay||ARRAY(
+				SELECT 
+					log.i_id_event
+				FROM 
+					sch_ninja.t_log_replica log
+					INNER JOIN sch_ninja.t_log_replica lst
+						ON
+								lst.t_binlog_name=log.t_binlog_name
+							AND	lst.i_binlog_position=log.i_binlog_position
+				WHERE 
+						log.i_id_batch=v_ty_chunk.i_id_batch
+					AND	log.i_id_event>lst.i_id_event
+					AND	lst.i_id_batch=v_ty_chunk.i_id_batch
+					AND	lst.i_id_event=v_ty_chunk.i_id_evt_replay[p_i_max_events]
+					AND	NOT EXISTS
+						(
+							SELECT 
+								1
+							FROM 
+								sch_ninja.t_replay_partitions par
+							WHERE
+									par.i_id_batch=log.i_id_batch
+								AND	log.i_id_event=ANY(par.i_id_events)
+						)
+				ORDER BY 
+					log.i_id_event
+			);
+		END IF;
+
+		v_ty_chunk.ts_evt_source:=(
+			SELECT 
+				to_timestamp(i_my_event_time)
+			FROM	
+				sch_ninja.t_log_replica
+			WHERE
+					i_id_event=v_ty_chunk.i_id_evt_replay[array_length(v_ty_chunk.i_id_evt_replay,1)]
+				AND	i_id_batch=v_ty_chunk.i_id_batch
+		);
+		
+		RETURN v_ty_chunk;
+	END;
+	
+$BODY$
+LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sch_ninja.fn_set_chunk_replayed(integer,sch_ninja.ty_replay_chunk,integer,integer)
+RETURNS sch_ninja.ty_replay_status AS
+$BODY$
+	DECLARE
+		p_i_id_source		ALIAS FOR $1;
+		p_ty_chunk		ALIAS FOR $2;
+		p_i_replayed		ALIAS FOR $3;
+		p_i_ddl		ALIAS FOR $4;
+		v_ty_status		sch_ninja.ty_replay_status;
+		v_i_id_batch	bigint;
+		v_i_chunk_events	integer;
+		
+	BEGIN
+		v_ty_status.b_continue:=FALSE;
+		v_ty_status.b_error:=FALSE;
+		v_i_id_batch:=p_ty_chunk.i_id_batch;
+		v_i_chunk_events:=coalesce(array_length(p_ty_chunk.i_id_evt_replay,1),0);
+		
+		IF p_ty_chunk.ts_evt_source IS NOT NULL
+		THEN
+			UPDATE sch_ninja.t_last_replayed
+				SET
+					ts_last_replayed=p_ty_chunk.ts_evt_source
+			WHERE 	
+				i_id_source=p_i_id_source
+			;
+		END IF;
+		IF v_i_chunk_events=0
+		THEN
+			UPDATE ONLY sch_ninja.t_replica_batch  
+			SET 
+				b_replayed=True,
+				i_skipped=coalesce(i_skipped,0),
+				ts_replayed=clock_timestamp()
+				
+			WHERE
+				i_id_batch=v_i_id_batch
+			;
+
+			DELETE FROM sch_ninja.t_batch_events
+			WHERE
+				i_id_batch=v_i_id_batch
+			;
+
+			v_ty_status.b_continue:=FALSE;
+		ELSE
+			UPDATE ONLY sch_ninja.t_replica_batch  
+			SET 
+				i_ddl=coalesce(i_ddl,0)+p_i_ddl,
+				i_replayed=coalesce(i_replayed,0)+p_i_replayed,
+				i_skipped=coalesce(i_skipped,0)+v_i_chunk_events-p_i_replayed-p_i_ddl,
+				ts_replayed=clock_timestamp()
+				
+			WHERE
+				i_id_batch=v_i_id_batch
+			;
+
+			UPDATE sch_ninja.t_batch_events evt
+				SET
+					i_id_last_event = log.i_id_event,
+					t_binlog_name = log.t_binlog_name,
+					i_binlog_position = log.i_binlog_position
+			FROM 
+				sch_ninja.t_log_replica log
+			WHERE
+					evt.i_id_batch=v_i_id_batch
+				AND	log.i_id_batch=v_i_id_batch
+				AND	log.i_id_event=p_ty_chunk.i_id_evt_replay[v_i_chunk_events]
+			;
+			v_ty_status.b_continue:=TRUE;
+			RETURN v_ty_status;
+		END IF;
+		
+		v_i_id_batch:= (
+			SELECT 
+				bat.i_id_batch 
+			FROM 
+				sch_ninja.t_replica_batch bat
+				INNER JOIN  sch_ninja.t_batch_events evt
+				ON
+					evt.i_id_batch=bat.i_id_batch
+			WHERE 
+					bat.b_started 
+				AND	bat.b_processed 
+				AND	NOT bat.b_replayed
+				AND	bat.i_id_source=p_i_id_source
+			ORDER BY 
+				bat.ts_created 
+			LIMIT 1
+			)
+		;
+		
+		IF v_i_id_batch IS NOT NULL
+		THEN
+			v_ty_status.b_continue:=TRUE;
+		END IF;
+		
+		
+		RETURN v_ty_status;
+
+	END;
+	
+$BODY$
+LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sch_ninja.fn_replay_mysql(integer,integer,boolean,boolean)
+RETURNS sch_ninja.ty_replay_status AS
+$BODY$
+	DECLARE
+		p_i_max_events	ALIAS FOR $1;
+		p_i_id_source		ALIAS FOR $2;
+		p_b_exit_on_error	ALIAS FOR $3;
+		p_b_grouped		ALIAS FOR $4;
+		v_ty_status		sch_ninja.ty_replay_status;
+		v_ty_events		sch_ninja.ty_replay_events;
+		v_ty_chunk		sch_ninja.ty_replay_chunk;
+		
+	BEGIN
+		v_ty_status.b_continue:=FALSE;
+		v_ty_status.b_error:=FALSE;
+		
+		v_ty_chunk:=sch_ninja.fn_get_replay_chunk(p_i_max_events,p_i_id_source);
+		IF v_ty_chunk.i_id_batch IS NULL 
+		THEN
+			RETURN v_ty_status;
+		END IF;
+		RAISE DEBUG 'Found id_batch %', v_ty_chunk.i_id_batch;
+		IF p_b_grouped
+		THEN
+			v_ty_events:=sch_ninja.fn_replay_events_grouped(p_i_id_source,v_ty_chunk.i_id_batch,v_ty_chunk.i_id_evt_replay,p_b_exit_on_error);
+		ELSE
+			v_ty_events:=sch_ninja.fn_replay_events(p_i_id_source,v_ty_chunk.i_id_batch,v_ty_chunk.i_id_evt_replay,p_b_exit_on_error);
+		END IF;
+		
+		IF v_ty_events.b_error
+		THEN
+			v_ty_status.b_error:=TRUE;
+			v_ty_status.v_table_error:=v_ty_events.v_table_error;
+			RETURN v_ty_status;
+		END IF;
+		
+		v_ty_status:=sch_ninja.fn_set_chunk_replayed(p_i_id_source,v_ty_chunk,v_ty_events.i_replayed,v_ty_events.i_ddl);
+		v_ty_status.v_table_error:=v_ty_events.v_table_error;
+		RETURN v_ty_status;
+	END;
+	
+$BODY$
+LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sch_ninja.fn_replay_mysql(integer,integer,boolean)
+RETURNS sch_ninja.ty_replay_status AS
+$BODY$
+	SELECT * FROM sch_ninja.fn_replay_mysql($1,$2,$3,FALSE);
+$BODY$
+LANGUAGE sql;
+
+ALTER TABLE sch_ninja.t_batch_events
+	ADD COLUMN i_id_last_event bigint NOT NULL DEFAULT 0,
+	DROP COLUMN i_id_event;
+
+SELECT sch_ninja.fn_refresh_parts();
+
+ALTER TABLE sch_ninja.t_replica_batch
+	ADD COLUMN v_log_table character varying NULL;
+
+ALTER TABLE sch_ninja.t_replica_batch
+	ADD COLUMN jsb_tables_consistent jsonb NULL,
+	ADD COLUMN t_replayed_binlog_name text NULL,
+	ADD COLUMN i_replayed_binlog_position bigint NULL;
+
+ALTER TABLE sch_ninja.t_batch_events
+	ADD COLUMN i_id_max_event bigint NULL,
+	ADD COLUMN t_binlog_name text NULL,
+	ADD COLUMN i_binlog_position bigint NULL;
+
+ALTER TABLE sch_ninja.t_last_replayed
+	ADD COLUMN i_replay_rows integer NULL,
+	ADD COLUMN i_replay_ms integer NULL;
+
+ALTER TABLE sch_ninja.t_sources
+	ADD COLUMN i_type_map_version bigint NOT NULL DEFAULT 0;
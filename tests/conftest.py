@@ -0,0 +1,46 @@
+import logging
+import os
+import pytest
+
+PG_TEST_DSN = os.environ.get("PG_NINJA_TEST_DSN")
+
+@pytest.fixture
+def pg_engine():
+	"""
+		The fixture returns a pg_engine connected to the database set in the environment variable PG_NINJA_TEST_DSN,
+		with the replica schema created from scratch and the source test added with two log tables.
+		The schema sch_ninja is dropped, therefore the variable must point to a scratch database.
+		The tests using the fixture are skipped if the variable is not set.
+	"""
+	if not PG_TEST_DSN:
+		pytest.skip("PG_NINJA_TEST_DSN is not set")
+	psycopg2 = pytest.importorskip("psycopg2")
+	pg_lib = pytest.importorskip("pg_ninja.lib.pg_lib")
+	pgsql_conn = psycopg2.connect(PG_TEST_DSN)
+	pgsql_conn.set_session(autocommit=True)
+	pgsql_cur = pgsql_conn.cursor()
+	pgsql_cur.execute("DROP SCHEMA IF EXISTS sch_ninja CASCADE;")
+	schema_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql", "create_schema.sql")
+	with open(schema_file, 'rb') as file_schema:
+		pgsql_cur.execute(file_schema.read())
+
+	engine = pg_lib.pg_engine()
+	engine.logger = logging.getLogger("pg_ninja_tests")
+	engine.dest_conn = {"charset": "UTF8"}
+	engine.pgsql_conn = pgsql_conn
+	engine.pgsql_cur = pgsql_cur
+	engine.source = "test"
+	engine.sources = {
+		"test": {
+			"schema_mappings": {"test": {"clear": "test_clear", "obfuscate": "test"}},
+			"log_tables": 2,
+			"log_tables_durability": "logged",
+		}
+	}
+	engine.add_source()
+	engine.set_source_id()
+	yield engine
+	pgsql_conn.rollback()
+	pgsql_conn.set_session(autocommit=True)
+	pgsql_cur.execute("DROP SCHEMA IF EXISTS sch_ninja CASCADE;")
+	pgsql_conn.close()
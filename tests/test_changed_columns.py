@@ -0,0 +1,52 @@
+import datetime
+import decimal
+import pytest
+
+pytest.importorskip("pymysql")
+pytest.importorskip("pymysqlreplication")
+
+from pg_ninja.lib.mysql_lib import mysql_source
+
+def changed_columns(event_after, event_before, pkey):
+	return mysql_source()._mysql_source__get_changed_columns(event_after, event_before, pkey)
+
+def test_only_changed_columns_are_kept():
+	event_before = {"id": 1, "name": "a", "amount": decimal.Decimal("1.00"), "updated": datetime.date(2018, 1, 1)}
+	event_after = {"id": 1, "name": "a", "amount": decimal.Decimal("2.00"), "updated": datetime.date(2018, 1, 1)}
+	assert changed_columns(event_after, event_before, ["id"]) == ({"id": 1, "amount": decimal.Decimal("2.00")}, {"id": 1})
+
+def test_pkey_columns_are_always_kept():
+	event_before = {"id": 1, "region": "eu", "name": "a"}
+	event_after = {"id": 1, "region": "eu", "name": "b"}
+	assert changed_columns(event_after, event_before, ["region", "id"]) == ({"id": 1, "region": "eu", "name": "b"}, {"region": "eu", "id": 1})
+
+def test_pkey_change():
+	event_before = {"id": 1, "name": "a"}
+	event_after = {"id": 2, "name": "a"}
+	assert changed_columns(event_after, event_before, ["id"]) == ({"id": 2}, {"id": 1})
+
+def test_null_transitions():
+	event_before = {"id": 1, "set_null": "a", "set_value": None, "still_null": None}
+	event_after = {"id": 1, "set_null": None, "set_value": "b", "still_null": None}
+	assert changed_columns(event_after, event_before, ["id"]) == ({"id": 1, "set_null": None, "set_value": "b"}, {"id": 1})
+
+def test_falsy_values_are_changes():
+	event_before = {"id": 1, "number": 1, "text": "a", "flag": 1}
+	event_after = {"id": 1, "number": 0, "text": "", "flag": 1}
+	assert changed_columns(event_after, event_before, ["id"]) == ({"id": 1, "number": 0, "text": ""}, {"id": 1})
+
+def test_columns_missing_from_the_before_image_are_kept():
+	event_before = {"id": 1}
+	event_after = {"id": 1, "name": "a"}
+	assert changed_columns(event_after, event_before, ["id"]) == ({"id": 1, "name": "a"}, {"id": 1})
+
+def test_unchanged_row_keeps_the_pkey_only():
+	event_before = {"id": 1, "name": "a"}
+	assert changed_columns(dict(event_before), event_before, ["id"]) == ({"id": 1}, {"id": 1})
+
+def test_images_are_not_modified():
+	event_before = {"id": 1, "name": "a"}
+	event_after = {"id": 1, "name": "b"}
+	changed_columns(event_after, event_before, ["id"])
+	assert event_before == {"id": 1, "name": "a"}
+	assert event_after == {"id": 1, "name": "b"}
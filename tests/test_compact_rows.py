@@ -0,0 +1,92 @@
+import pytest
+
+pytest.importorskip("pymysql")
+pytest.importorskip("pymysqlreplication")
+
+from pg_ninja.lib.mysql_lib import mysql_source
+
+def row_event(action, table, key_before, key_after, event_after, event_before=None, position=0):
+	return {
+		"global_data": {"action": action, "schema": "dest_schema", "table": table, "logpos": position},
+		"event_after": event_after,
+		"event_before": event_before or {},
+		"row_key": (("dest_schema", table, (key_before, )), ("dest_schema", table, (key_after, ))),
+	}
+
+def compact(group_insert):
+	return mysql_source()._mysql_source__compact_rows(group_insert)
+
+def summary(group_insert):
+	return [(row_data["global_data"]["action"], row_data["global_data"]["table"], row_data["global_data"]["logpos"], row_data["event_after"], row_data["event_before"]) for row_data in group_insert]
+
+def test_insert_then_updates_becomes_insert():
+	rows = compact([
+		row_event("insert", "t1", 1, 1, {"id": 1, "v": "a"}, position=10),
+		row_event("update", "t1", 1, 1, {"id": 1, "v": "b"}, {"id": 1, "v": "a"}, position=20),
+		row_event("update", "t1", 1, 1, {"id": 1, "v": "c"}, {"id": 1, "v": "b"}, position=30),
+	])
+	assert summary(rows) == [("insert", "t1", 10, {"id": 1, "v": "c"}, {})]
+
+def test_insert_then_delete_is_dropped():
+	rows = compact([
+		row_event("insert", "t1", 1, 1, {"id": 1, "v": "a"}),
+		row_event("delete", "t1", 1, 1, {"id": 1, "v": "a"}),
+	])
+	assert rows == []
+
+def test_update_chain_changing_the_key():
+	rows = compact([
+		row_event("update", "t1", 1, 2, {"id": 2, "v": "a"}, {"id": 1, "v": "a"}, position=10),
+		row_event("update", "t1", 2, 3, {"id": 3}, {"id": 2}, position=20),
+		row_event("update", "t1", 3, 3, {"id": 3, "v": "b"}, {"id": 3, "v": "a"}, position=30),
+	])
+	assert summary(rows) == [("update", "t1", 10, {"id": 3, "v": "b"}, {"id": 1, "v": "a"})]
+	assert rows[0]["row_key"] == (("dest_schema", "t1", (1, )), ("dest_schema", "t1", (3, )))
+
+def test_update_then_delete_becomes_delete():
+	rows = compact([
+		row_event("update", "t1", 1, 2, {"id": 2, "v": "b"}, {"id": 1, "v": "a"}, position=10),
+		row_event("delete", "t1", 2, 2, {"id": 2, "v": "b"}, position=20),
+	])
+	assert summary(rows) == [("delete", "t1", 10, {"id": 1, "v": "a"}, {})]
+
+def test_key_swap_is_not_merged():
+	group_insert = [
+		row_event("update", "t1", 1, 3, {"id": 3}, {"id": 1}),
+		row_event("update", "t1", 2, 1, {"id": 1}, {"id": 2}),
+		row_event("update", "t1", 3, 2, {"id": 2}, {"id": 3}),
+	]
+	assert compact(group_insert) == group_insert
+
+def test_interleaved_keys_are_not_merged():
+	group_insert = [
+		row_event("update", "t1", 1, 1, {"id": 1, "v": "a"}, {"id": 1}),
+		row_event("update", "t1", 2, 2, {"id": 2, "v": "b"}, {"id": 2}),
+		row_event("update", "t1", 1, 1, {"id": 1, "v": "c"}, {"id": 1}),
+	]
+	assert compact(group_insert) == group_insert
+
+def test_other_tables_do_not_block_the_merge():
+	rows = compact([
+		row_event("update", "t1", 1, 1, {"id": 1, "v": "a"}, {"id": 1}, position=10),
+		row_event("insert", "t2", 1, 1, {"id": 1}, position=20),
+		row_event("update", "t1", 1, 1, {"id": 1, "w": "b"}, {"id": 1}, position=30),
+	])
+	assert summary(rows) == [
+		("update", "t1", 10, {"id": 1, "v": "a", "w": "b"}, {"id": 1}),
+		("insert", "t2", 20, {"id": 1}, {}),
+	]
+
+def test_insert_after_delete_is_not_merged():
+	group_insert = [
+		row_event("delete", "t1", 1, 1, {"id": 1}),
+		row_event("insert", "t1", 1, 1, {"id": 1, "v": "a"}),
+	]
+	assert compact(group_insert) == group_insert
+
+def test_events_without_key_are_kept():
+	group_insert = [
+		{"global_data": {"action": "insert", "table": "t3"}, "event_after": {"v": 1}, "event_before": {}},
+		{"global_data": {"action": "delete", "table": "t3"}, "event_after": {"v": 1}, "event_before": {}},
+	]
+	assert compact(group_insert) == group_insert
@@ -0,0 +1,141 @@
+import datetime
+import decimal
+import json
+import struct
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from pg_ninja.lib.pg_lib import COPY_BINARY_HEADER, COPY_BINARY_TRAILER, COPY_LOG_FIELDS
+from pg_ninja.lib.pg_lib import copy_bigint, copy_text, copy_jsonb, pg_encoder, row_encoder
+
+def read_copy_fields(copy_data):
+	"""
+		Decodes a COPY BINARY stream built with the copy helpers, returning the list of tuples.
+		Each field is returned as bytes or None for the NULL fields.
+	"""
+	assert copy_data.startswith(COPY_BINARY_HEADER)
+	assert copy_data.endswith(COPY_BINARY_TRAILER)
+	position = len(COPY_BINARY_HEADER)
+	tuples = []
+	while True:
+		field_count = struct.unpack_from("!h", copy_data, position)[0]
+		position += 2
+		if field_count == -1:
+			break
+		fields = []
+		for field_id in range(field_count):
+			field_length = struct.unpack_from("!i", copy_data, position)[0]
+			position += 4
+			if field_length == -1:
+				fields.append(None)
+			else:
+				fields.append(copy_data[position:position+field_length])
+				position += field_length
+		tuples.append(fields)
+	assert position == len(copy_data)
+	return tuples
+
+def build_row(batch_id, action, event_after, event_before):
+	return {
+		"global_data": {
+			"batch_id": batch_id,
+			"table": "t_test",
+			"schema": "sch_è",
+			"action": action,
+			"binlog": "mysql-bin.000001",
+			"logpos": 1234,
+			"event_time": 1514862245,
+			"log_table": "t_log_replica_test_1",
+		},
+		"event_after": event_after,
+		"event_before": event_before,
+	}
+
+ROW_IMAGES = [
+	({"id": 1, "value": "text 中文 \"quoted\"\n", "date": datetime.date(2018, 1, 2)}, {}),
+	({"id": 2, "amount": decimal.Decimal("10.50"), "null": None, "bytes": b"\x00\xff"}, {"id": 2}),
+	(row_encoder.get_golden_sample(), {"id": 1}),
+]
+
+def test_copy_bigint():
+	assert copy_bigint(None) == struct.pack("!i", -1)
+	assert copy_bigint(-1) == struct.pack("!iq", 8, -1)
+	assert struct.unpack("!iq", copy_bigint(9223372036854775807)) == (8, 9223372036854775807)
+
+def test_copy_text():
+	assert copy_text(None, "utf-8") == struct.pack("!i", -1)
+	assert copy_text("", "utf-8") == struct.pack("!i", 0)
+	value = "è \U0001f600"
+	assert copy_text(value, "utf-8") == struct.pack("!i", len(value.encode("utf-8"))) + value.encode("utf-8")
+
+def test_copy_jsonb():
+	json_text = json.dumps({"key": "è"})
+	field = copy_jsonb(json_text, "utf-8")
+	assert struct.unpack_from("!i", field)[0] == len(field) - 4
+	assert field[4:5] == b"\x01"
+	assert field[5:].decode("utf-8") == json_text
+
+def test_copy_tuple_round_trip():
+	encoder = row_encoder()
+	copy_data = [COPY_BINARY_HEADER]
+	for event_after, event_before in ROW_IMAGES:
+		copy_data.append(b"".join((
+			COPY_LOG_FIELDS,
+			copy_bigint(1),
+			copy_text("t_test", "utf-8"),
+			copy_text("sch_è", "utf-8"),
+			copy_text("update", "utf-8"),
+			copy_text(None, "utf-8"),
+			copy_bigint(1234),
+			copy_jsonb(encoder.dumps(event_after), "utf-8"),
+			copy_jsonb(encoder.dumps(event_before), "utf-8"),
+			copy_bigint(None),
+		)))
+	copy_data.append(COPY_BINARY_TRAILER)
+	tuples = read_copy_fields(b"".join(copy_data))
+	assert len(tuples) == len(ROW_IMAGES)
+	for fields, (event_after, event_before) in zip(tuples, ROW_IMAGES):
+		assert len(fields) == 9
+		assert struct.unpack("!q", fields[0])[0] == 1
+		assert fields[1:4] == [b"t_test", "sch_è".encode("utf-8"), b"update"]
+		assert fields[4] is None
+		assert struct.unpack("!q", fields[5])[0] == 1234
+		assert fields[6][:1] == b"\x01" and fields[7][:1] == b"\x01"
+		assert fields[6][1:].decode("utf-8") == json.dumps(event_after, cls=pg_encoder)
+		assert fields[7][1:].decode("utf-8") == json.dumps(event_before, cls=pg_encoder)
+		assert fields[8] is None
+
+def test_copy_batch_round_trip(pg_engine):
+	pg_engine.pgsql_cur.execute("""
+		INSERT INTO sch_ninja.t_replica_batch (i_id_source, t_binlog_name, i_binlog_position, v_log_table)
+		VALUES (%s, 'mysql-bin.000001', 4, 't_log_replica_test_1')
+		RETURNING i_id_batch;
+	""", (pg_engine.i_id_source, ))
+	id_batch = pg_engine.pgsql_cur.fetchone()[0]
+	group_insert = [build_row(id_batch, action, event_after, event_before) for action, (event_after, event_before) in zip(["insert", "update", "delete"], ROW_IMAGES)]
+	pg_engine._pg_engine__copy_batch(group_insert)
+	pg_engine.pgsql_cur.execute("""
+		SELECT
+			i_id_batch,
+			v_table_name,
+			v_schema_name,
+			enm_binlog_event::text,
+			t_binlog_name,
+			i_binlog_position,
+			jsb_event_after,
+			jsb_event_before,
+			i_my_event_time
+		FROM
+			sch_ninja.t_log_replica_test_1
+		ORDER BY
+			i_id_event;
+	""")
+	log_rows = pg_engine.pgsql_cur.fetchall()
+	assert len(log_rows) == len(group_insert)
+	for log_row, row_data in zip(log_rows, group_insert):
+		global_data = row_data["global_data"]
+		assert log_row[:6] == (id_batch, global_data["table"], global_data["schema"], global_data["action"], global_data["binlog"], global_data["logpos"])
+		assert log_row[6] == json.loads(json.dumps(row_data["event_after"], cls=pg_encoder))
+		assert log_row[7] == json.loads(json.dumps(row_data["event_before"], cls=pg_encoder))
+		assert log_row[8] == global_data["event_time"]
@@ -0,0 +1,93 @@
+import logging
+import pytest
+
+pytest.importorskip("pymysql")
+pytest.importorskip("pymysqlreplication")
+
+from pg_ninja.lib import mysql_lib
+
+class fake_buffered_cursor(object):
+	def __init__(self, total_rows):
+		self.total_rows = total_rows
+
+	def execute(self, *args):
+		pass
+
+	def fetchone(self):
+		return {"table_rows": self.total_rows, "copy_limit": 0}
+
+class fake_unbuffered_cursor(object):
+	"""
+		The cursor returns the rows with the csv data and the primary key, keeping the largest fetch.
+	"""
+	def __init__(self, total_rows):
+		self.rows = [("%s,row %s" % (row_id, row_id), row_id) for row_id in range(1, total_rows + 1)]
+		self.max_fetch = 0
+
+	def execute(self, *args):
+		pass
+
+	def fetchmany(self, size):
+		self.max_fetch = max(self.max_fetch, size)
+		csv_results = self.rows[:size]
+		del self.rows[:size]
+		return csv_results
+
+class fake_engine(object):
+	def __init__(self, fail_copy):
+		self.fail_copy = fail_copy
+		self.copied = []
+
+	def get_client_encoding(self):
+		return "UTF8"
+
+	def copy_data(self, csv_file, schema, table, column_list):
+		csv_data = csv_file.read(100)
+		if self.fail_copy:
+			raise Exception("copy failed")
+		while True:
+			csv_read = csv_file.read(100)
+			if not csv_read:
+				break
+			csv_data += csv_read
+		self.copied.append(csv_data.decode())
+
+def get_source(monkeypatch, tmp_path, copy_mode, total_rows, fail_copy=False):
+	source = mysql_lib.mysql_source()
+	source.logger = logging.getLogger("pg_ninja_tests")
+	source.schema_loading = {"my_schema": {"loading": "loading_schema", "destination": "dest_schema"}}
+	source.out_dir = str(tmp_path)
+	source.copy_mode = copy_mode
+	source.copy_max_memory = 1
+	source.charset = "utf8"
+	source.copy_snapshot = {"File": "mysql-bin.000001", "Position": 4}
+	source.cursor_unbuffered = fake_unbuffered_cursor(total_rows)
+	source.pg_engine = fake_engine(fail_copy)
+	source.inserted = []
+	monkeypatch.setattr(source, "connect_db_buffered", lambda: setattr(source, "cursor_buffered", fake_buffered_cursor(total_rows)))
+	monkeypatch.setattr(source, "disconnect_db_buffered", lambda: None)
+	monkeypatch.setattr(source, "generate_select_statements", lambda schema, table: {"select_csv": "csv", "select_stat": "stat", "column_list": "id,value"})
+	monkeypatch.setattr(source, "_mysql_source__get_index_data", lambda schema, table: [{"index_name": "PRIMARY", "index_columns": "id"}])
+	monkeypatch.setattr(source, "insert_table_data", lambda ins_arg: source.inserted.append(ins_arg))
+	return source
+
+@pytest.mark.parametrize("copy_mode", ["direct", "file"])
+def test_copy_data_streams_the_rows(monkeypatch, tmp_path, copy_mode):
+	"""
+		The estimated slice is larger than the table, the rows must be read in groups of copy_stream's fetch_rows.
+	"""
+	source = get_source(monkeypatch, tmp_path, copy_mode, 2500)
+	master_status = source.copy_data("my_schema", "t_test")
+	assert master_status == source.copy_snapshot
+	assert source.cursor_unbuffered.max_fetch == 1000
+	assert source.pg_engine.copied == ["\n".join("%s,row %s" % (row_id, row_id) for row_id in range(1, 2501)) + "\n"]
+	assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.parametrize("copy_mode", ["direct", "file"])
+def test_copy_data_failed_slice_keys(monkeypatch, tmp_path, copy_mode):
+	source = get_source(monkeypatch, tmp_path, copy_mode, 2500, fail_copy=True)
+	source.copy_data("my_schema", "t_test")
+	assert len(source.inserted) == 1
+	assert source.inserted[0]["slice_insert"] == [0]
+	assert source.inserted[0]["slice_keys"] == {0: ((1, ), (2500, ))}
+	assert source.cursor_unbuffered.rows == []
@@ -0,0 +1,125 @@
+import logging
+import multiprocessing
+import os
+import sys
+import pytest
+
+pytest.importorskip("pymysql")
+pytest.importorskip("pymysqlreplication")
+
+from pg_ninja.lib import mysql_lib
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the copy workers require the fork start method")
+
+class fake_cursor(object):
+	def execute(self, *args):
+		pass
+
+class fake_connection(object):
+	open = True
+
+class fake_engine(object):
+	def clone_engine(self):
+		return fake_engine()
+
+	def connect_db(self):
+		pass
+
+	def disconnect_db(self):
+		pass
+
+	def delete_copy_chunk(self, *args):
+		pass
+
+	def store_table(self, schema, table, table_pkey, master_status):
+		pass
+
+class fake_source(object):
+	"""
+		The methods replacing the MySQL access of mysql_source, for the source and its copy workers. 
+		The table big is split in three chunks, copy_data exits the worker's process abruptly 
+		when it reaches the table listed in crash_table.
+	"""
+	crash_table = None
+
+	def connect_db_buffered(self):
+		self.cursor_buffered = fake_cursor()
+
+	def disconnect_db_buffered(self):
+		pass
+
+	def disconnect_db_unbuffered(self):
+		pass
+
+	def get_master_coordinates(self):
+		return [{"File": "mysql-bin.000001", "Position": 4}]
+
+	def set_copy_split_size(self):
+		self.copy_split_size = 50
+
+	def _mysql_source__get_table_sizes(self):
+		return [("my_schema", "big", 100), ("my_schema", "small", 1)]
+
+	def _mysql_source__get_copy_chunks(self, schema, table):
+		return [{"number": chunk_number, "total": 3} for chunk_number in range(1, 4)]
+
+	def start_copy_snapshot(self, master_status):
+		self.copy_snapshot = master_status
+		self.conn_unbuffered = fake_connection()
+
+	def copy_data(self, schema, table, copy_chunk=None):
+		if table == fake_source.crash_table:
+			os._exit(3)
+		return self.copy_snapshot
+
+	def create_indices(self, schema, table):
+		return ["id"]
+
+@pytest.fixture
+def fake_mysql(monkeypatch):
+	for method_name, method in vars(fake_source).items():
+		if callable(method):
+			monkeypatch.setattr(mysql_lib.mysql_source, method_name, method, raising=False)
+	monkeypatch.setattr(fake_source, "crash_table", None)
+
+def get_source():
+	source = mysql_lib.mysql_source()
+	source.logger = logging.getLogger("pg_ninja_tests")
+	source.source = "test"
+	source.sources = {}
+	source.source_config = {"copy_workers": 2, "copy_chunk_retries": 0}
+	source.type_override = {}
+	source.schema_loading = {"my_schema": {"loading": "loading_schema", "destination": "dest_schema"}}
+	source.out_dir = "/tmp"
+	source.copy_mode = "file"
+	source.copy_max_memory = 1
+	source.hexify = []
+	source.pg_engine = fake_engine()
+	return source
+
+@pytest.fixture
+def spawn_default():
+	"""
+		Sets spawn as the default start method, as on macOS and on Linux from Python 3.14.
+	"""
+	start_method = multiprocessing.get_start_method(allow_none=True)
+	multiprocessing.set_start_method("spawn", force=True)
+	yield
+	multiprocessing.set_start_method(start_method, force=True)
+
+def test_parallel_copy_with_spawn_default(fake_mysql, spawn_default, caplog):
+	source = get_source()
+	with caplog.at_level(logging.ERROR):
+		source.copy_tables()
+	assert caplog.records == []
+	assert source.chunk_status[("my_schema", "big")]["pending"].value == 0
+	assert source.chunk_status[("my_schema", "big")]["failed"].value == 0
+
+def test_parallel_copy_reports_dead_workers(fake_mysql, monkeypatch, caplog):
+	monkeypatch.setattr(fake_source, "crash_table", "big")
+	source = get_source()
+	with caplog.at_level(logging.ERROR):
+		source.copy_tables()
+	messages = [record.getMessage() for record in caplog.records]
+	assert [message for message in messages if "ended with exit code 3" in message]
+	assert [message for message in messages if "my_schema.big has" in message]
@@ -0,0 +1,92 @@
+import pytest
+
+pytest.importorskip("pymysql")
+pytest.importorskip("pymysqlreplication")
+
+from pg_ninja.lib.mysql_lib import gtid_set
+
+UUID_A = "3e11fa47-71ca-11e1-9e33-c80aa9429562"
+UUID_B = "8c7a0c6a-1d7f-11ee-a8a6-0242ac110002"
+
+def test_parse_single_interval():
+	gtid = gtid_set("%s:1-100" % UUID_A)
+	assert gtid.intervals == {UUID_A: [[1, 100]]}
+	assert str(gtid) == "%s:1-100" % UUID_A
+
+def test_parse_gaps_and_single_transactions():
+	gtid = gtid_set("%s:1-100:105-110:120" % UUID_A)
+	assert gtid.intervals == {UUID_A: [[1, 100], [105, 110], [120, 120]]}
+	assert str(gtid) == "%s:1-100:105-110:120" % UUID_A
+
+def test_parse_multi_uuid_executed_gtid_set():
+	gtid = gtid_set("%s:1-20,\n%s:1-5:7" % (UUID_B, UUID_A.upper()))
+	assert gtid.intervals == {UUID_A: [[1, 5], [7, 7]], UUID_B: [[1, 20]]}
+	assert str(gtid) == "%s:1-5:7,\n%s:1-20" % (UUID_A, UUID_B)
+
+def test_parse_empty_set():
+	assert gtid_set("").intervals == {}
+	assert gtid_set(None).intervals == {}
+	assert str(gtid_set()) == ""
+
+def test_parse_unsorted_overlapping_intervals():
+	gtid = gtid_set("%s:50-60:1-10:11-20:55-70" % UUID_A)
+	assert gtid.intervals == {UUID_A: [[1, 20], [50, 70]]}
+
+def test_add_gtid_extends_last_interval():
+	gtid = gtid_set("%s:1-100" % UUID_A)
+	gtid.add_gtid("%s:101" % UUID_A)
+	assert gtid.intervals == {UUID_A: [[1, 101]]}
+
+def test_add_gtid_already_executed():
+	gtid = gtid_set("%s:1-100" % UUID_A)
+	gtid.add_gtid("%s:50" % UUID_A)
+	assert gtid.intervals == {UUID_A: [[1, 100]]}
+
+def test_add_gtid_gap_and_fill():
+	gtid = gtid_set("%s:1-10" % UUID_A)
+	gtid.add_gtid("%s:12" % UUID_A)
+	assert gtid.intervals == {UUID_A: [[1, 10], [12, 12]]}
+	gtid.add_gtid("%s:11" % UUID_A)
+	assert gtid.intervals == {UUID_A: [[1, 12]]}
+
+def test_add_gtid_before_first_interval():
+	gtid = gtid_set("%s:5-10" % UUID_A)
+	gtid.add_gtid("%s:1" % UUID_A)
+	assert gtid.intervals == {UUID_A: [[1, 1], [5, 10]]}
+
+def test_add_gtid_new_uuid():
+	gtid = gtid_set("%s:1-10" % UUID_A)
+	gtid.add_gtid("%s:1" % UUID_B.upper())
+	assert gtid.intervals == {UUID_A: [[1, 10]], UUID_B: [[1, 1]]}
+
+def test_merge_sets():
+	gtid = gtid_set("%s:1-10:20-30" % UUID_A)
+	gtid.merge(gtid_set("%s:11-19,\n%s:1-3" % (UUID_A, UUID_B)))
+	assert gtid.intervals == {UUID_A: [[1, 30]], UUID_B: [[1, 3]]}
+
+def test_merge_text_keeps_existing_intervals():
+	gtid = gtid_set("%s:1-10" % UUID_A)
+	gtid.merge_text("%s:5-15:40" % UUID_A)
+	assert gtid.intervals == {UUID_A: [[1, 15], [40, 40]]}
+
+def test_merge_does_not_share_intervals():
+	other_set = gtid_set("%s:1-10" % UUID_A)
+	gtid = gtid_set()
+	gtid.merge(other_set)
+	gtid.add_gtid("%s:11" % UUID_A)
+	assert other_set.intervals == {UUID_A: [[1, 10]]}
+
+def test_parse_tagged_gtids():
+	gtid = gtid_set("%s:1-5:Tag_1:1-3:7,\n%s:tag_2:10" % (UUID_A, UUID_B))
+	assert gtid.intervals == {
+		UUID_A: [[1, 5]],
+		"%s:tag_1" % UUID_A: [[1, 3], [7, 7]],
+		"%s:tag_2" % UUID_B: [[10, 10]],
+	}
+	assert gtid_set(str(gtid)).intervals == gtid.intervals
+
+def test_add_tagged_gtid():
+	gtid = gtid_set("%s:1-5:tag_1:1-3" % UUID_A)
+	gtid.add_gtid("%s:tag_1:4" % UUID_A)
+	gtid.add_gtid("%s:6" % UUID_A)
+	assert gtid.intervals == {UUID_A: [[1, 6]], "%s:tag_1" % UUID_A: [[1, 4]]}
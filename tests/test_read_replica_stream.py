@@ -0,0 +1,174 @@
+import logging
+import pytest
+
+pytest.importorskip("pymysql")
+pytest.importorskip("pymysqlreplication")
+
+from pymysqlreplication.event import QueryEvent, RotateEvent, XidEvent
+from pymysqlreplication.row_event import WriteRowsEvent
+from pg_ninja.lib import mysql_lib
+
+BINLOG_FILE = "mysql-bin.000001"
+
+class fake_packet(object):
+	def __init__(self, log_pos):
+		self.log_pos = log_pos
+
+class fake_rotate(RotateEvent):
+	def __init__(self, next_binlog, position):
+		self.next_binlog = next_binlog
+		self.position = position
+		self.timestamp = 0
+
+class fake_query(QueryEvent):
+	def __init__(self, query, start_pos, log_pos):
+		self.query = query
+		self.schema = b"my_schema"
+		self.packet = fake_packet(log_pos)
+		self.start_pos = start_pos
+		self.timestamp = 0
+
+class fake_xid(XidEvent):
+	def __init__(self, start_pos, log_pos):
+		self.packet = fake_packet(log_pos)
+		self.start_pos = start_pos
+		self.timestamp = 0
+
+class fake_write(WriteRowsEvent):
+	rows = None
+	def __init__(self, row_id, start_pos, log_pos, table_map_pos):
+		self.table = "t_test"
+		self.schema = "my_schema"
+		self.rows = [{"values": {"id": row_id, "value": "row %s" % row_id}}]
+		self.packet = fake_packet(log_pos)
+		self.start_pos = start_pos
+		self.table_map_pos = table_map_pos
+		self.timestamp = 0
+
+def build_binlog(transactions, rows_per_transaction):
+	"""
+		Builds the events of transactions with one row per rows event. Each transaction is BEGIN,
+		a table map (not returned by the reader), the rows events and the XidEvent.
+	"""
+	binlog_events = []
+	position = 4
+	row_id = 0
+	for transaction in range(transactions):
+		binlog_events.append(fake_query("BEGIN", position, position + 10))
+		table_map_pos = position + 10
+		position += 20
+		for row_event in range(rows_per_transaction):
+			row_id += 1
+			binlog_events.append(fake_write(row_id, position, position + 10, table_map_pos))
+			position += 10
+		binlog_events.append(fake_xid(position, position + 10))
+		position += 10
+	return binlog_events, row_id
+
+class fake_stream_reader(object):
+	"""
+		Emulates BinLogStreamReader reading from log_pos. As the real reader, the rows events are discarded
+		when the transaction's TableMapEvent was before the starting position.
+	"""
+	binlog_events = []
+	def __init__(self, log_file=None, log_pos=None, **kwargs):
+		self.log_pos = log_pos
+
+	def __iter__(self):
+		yield fake_rotate(BINLOG_FILE, self.log_pos)
+		for binlogevent in self.binlog_events:
+			if binlogevent.start_pos < self.log_pos:
+				continue
+			if isinstance(binlogevent, WriteRowsEvent) and binlogevent.table_map_pos < self.log_pos:
+				continue
+			yield binlogevent
+
+	def close(self):
+		pass
+
+class fake_engine(object):
+	def __init__(self):
+		self.written_rows = []
+
+	def clone_engine(self):
+		return self
+
+	def connect_db(self):
+		pass
+
+	def set_synchronous_commit(self):
+		pass
+
+	def write_batch(self, group_insert):
+		self.written_rows.extend(group_insert)
+
+	def get_inconsistent_tables(self):
+		return {}
+
+	def get_type_map_version(self):
+		return 1
+
+	def get_table_type_map(self):
+		return {"my_schema": {"t_test": {"id": "int", "value": "varchar"}}}
+
+	def get_table_pkey(self, schema, table):
+		return ["id"]
+
+	def get_table_groups(self):
+		return {}
+
+def get_source(monkeypatch, binlog_events, replica_compaction):
+	monkeypatch.setattr(mysql_lib, "BinLogStreamReader", fake_stream_reader)
+	monkeypatch.setattr(fake_stream_reader, "binlog_events", binlog_events)
+	source = mysql_lib.mysql_source()
+	source.logger = logging.getLogger("pg_ninja_tests")
+	source.source = "test"
+	source.pg_engine = fake_engine()
+	source.schema_mappings = {"my_schema": {"clear": "dest_schema", "obfuscate": "obf_schema"}}
+	source.schema_replica = ["my_schema"]
+	source.skip_tables = {}
+	source.limit_tables = {}
+	source.stream_only_tables = None
+	source.stream_ignored_tables = None
+	source.replica_conn = {}
+	source.my_server_id = 100
+	source.sleep_loop = 1
+	source.replica_batch_size = 2
+	source.replica_batch_bytes = None
+	source.replica_batch_seconds = 0
+	source.replica_compaction = replica_compaction
+	source.hexify = [] + source.hexify_always
+	return source
+
+@pytest.mark.parametrize("replica_compaction", [False, True])
+def test_batch_ends_on_transaction_commit(monkeypatch, replica_compaction):
+	"""
+		The batch size is reached in the middle of each transaction. Reading the batches one after another,
+		each from the position saved by the previous one, must return all the rows once.
+	"""
+	binlog_events, total_rows = build_binlog(4, 5)
+	commit_positions = [binlogevent.packet.log_pos for binlogevent in binlog_events if isinstance(binlogevent, XidEvent)]
+	source = get_source(monkeypatch, binlog_events, replica_compaction)
+	log_position = 4
+	saved_positions = []
+	for id_batch in range(1, 20):
+		batch_data = [[id_batch, BINLOG_FILE, log_position, "t_log_replica_test_1", None, None]]
+		master_data, close_batch = source._mysql_source__read_replica_stream(batch_data)
+		if not close_batch:
+			break
+		log_position = master_data["Position"]
+		saved_positions.append(log_position)
+	assert [row_data["event_after"]["id"] for row_data in source.pg_engine.written_rows] == list(range(1, total_rows + 1))
+	assert saved_positions == commit_positions
+	batch_ids = [row_data["global_data"]["batch_id"] for row_data in source.pg_engine.written_rows]
+	assert batch_ids == sorted(batch_ids)
+
+def test_resume_in_the_middle_of_a_transaction_loses_rows(monkeypatch):
+	"""
+		The reader emulation discards the rows of a transaction started before the resume position,
+		which is why the batch must never end in the middle of a transaction.
+	"""
+	binlog_events, total_rows = build_binlog(1, 5)
+	reader = fake_stream_reader(log_file=BINLOG_FILE, log_pos=binlog_events[2].packet.log_pos)
+	monkeypatch.setattr(fake_stream_reader, "binlog_events", binlog_events)
+	assert [binlogevent for binlogevent in reader if isinstance(binlogevent, WriteRowsEvent)] == []
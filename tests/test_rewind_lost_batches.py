@@ -0,0 +1,159 @@
+import json
+import pytest
+
+def set_unlogged(pg_engine):
+	pg_engine.sources["test"]["log_tables_durability"] = "unlogged"
+	pg_engine.set_log_tables()
+	pg_engine.pgsql_cur.execute("""
+		SELECT count(*) FROM pg_class WHERE relname LIKE 't_log_replica_test_%%' AND relkind='r' AND relpersistence='u';
+	""")
+	assert pg_engine.pgsql_cur.fetchone()[0] == 2
+
+def add_table(pg_engine, table_name, binlog_name, binlog_position):
+	pg_engine.pgsql_cur.execute("""
+		INSERT INTO sch_ninja.t_replica_tables (i_id_source, v_table_name, v_schema_name, v_table_pkey, t_binlog_name, i_binlog_position)
+		VALUES (%s, %s, 'test_clear', ARRAY['id'], %s, %s);
+	""", (pg_engine.i_id_source, table_name, binlog_name, binlog_position))
+
+def add_batch(pg_engine, binlog_position, log_table, tables_consistent=None):
+	"""
+		Adds a processed batch with three events in the log table and returns the batch id and the events ids.
+	"""
+	pg_engine.pgsql_cur.execute("""
+		INSERT INTO sch_ninja.t_replica_batch (i_id_source, t_binlog_name, i_binlog_position, b_started, b_processed, v_log_table, jsb_tables_consistent)
+		VALUES (%s, 'mysql-bin.000001', %s, True, True, %s, %s)
+		RETURNING i_id_batch;
+	""", (pg_engine.i_id_source, binlog_position, log_table, json.dumps(tables_consistent) if tables_consistent else None))
+	id_batch = pg_engine.pgsql_cur.fetchone()[0]
+	id_events = []
+	for event_id in range(3):
+		pg_engine.pgsql_cur.execute("""
+			INSERT INTO sch_ninja.%s (i_id_batch, v_table_name, v_schema_name, enm_binlog_event, t_binlog_name, i_binlog_position, jsb_event_after, jsb_event_before)
+			VALUES (%%s, 't_test', 'test_clear', 'insert', 'mysql-bin.000001', %%s, '{"id": 1}', '{}')
+			RETURNING i_id_event;
+		""" % log_table, (id_batch, binlog_position + event_id + 1))
+		id_events.append(pg_engine.pgsql_cur.fetchone()[0])
+	pg_engine.pgsql_cur.execute("""
+		INSERT INTO sch_ninja.t_batch_events (i_id_batch, i_id_max_event) VALUES (%s, %s);
+	""", (id_batch, id_events[-1]))
+	return id_batch, id_events
+
+def crash_recovery(pg_engine):
+	"""
+		The crash recovery resets the unlogged tables to empty, the same state is obtained truncating the log tables.
+	"""
+	pg_engine.pgsql_cur.execute("TRUNCATE sch_ninja.t_log_replica_test_1, sch_ninja.t_log_replica_test_2;")
+
+def get_batches(pg_engine):
+	pg_engine.pgsql_cur.execute("""
+		SELECT i_id_batch, b_started, b_processed, jsb_tables_consistent, t_replayed_binlog_name, i_replayed_binlog_position
+		FROM sch_ninja.t_replica_batch
+		ORDER BY i_id_batch;
+	""")
+	return pg_engine.pgsql_cur.fetchall()
+
+def get_table_position(pg_engine, table_name):
+	pg_engine.pgsql_cur.execute("""
+		SELECT t_binlog_name, i_binlog_position FROM sch_ninja.t_replica_tables WHERE v_table_name=%s;
+	""", (table_name, ))
+	return pg_engine.pgsql_cur.fetchone()
+
+def test_rewind_lost_batches_after_crash(pg_engine):
+	set_unlogged(pg_engine)
+	add_table(pg_engine, "t_test", None, None)
+	add_table(pg_engine, "t_late", "mysql-bin.000001", 300)
+	first_batch, first_events = add_batch(pg_engine, 100, "t_log_replica_test_1", [["test_clear", "t_test", None, None]])
+	second_batch, second_events = add_batch(pg_engine, 200, "t_log_replica_test_2", [["test_clear", "t_late", "mysql-bin.000001", 150]])
+	pg_engine.pgsql_cur.execute("""
+		UPDATE sch_ninja.t_batch_events SET i_id_last_event=%s, t_binlog_name='mysql-bin.000001', i_binlog_position=101 WHERE i_id_batch=%s;
+	""", (first_events[0], first_batch))
+	crash_recovery(pg_engine)
+
+	pg_engine.rewind_lost_batches()
+
+	batches = get_batches(pg_engine)
+	assert batches == [(first_batch, False, False, None, 'mysql-bin.000001', 101)]
+	assert get_table_position(pg_engine, "t_late") == ('mysql-bin.000001', 150)
+	pg_engine.pgsql_cur.execute("SELECT count(*) FROM sch_ninja.t_batch_events;")
+	assert pg_engine.pgsql_cur.fetchone()[0] == 0
+
+def test_rewind_lost_batches_not_replayed(pg_engine):
+	set_unlogged(pg_engine)
+	add_table(pg_engine, "t_test", "mysql-bin.000001", 500)
+	first_batch, first_events = add_batch(pg_engine, 100, "t_log_replica_test_1", [["test_clear", "t_test", "mysql-bin.000001", 50]])
+	crash_recovery(pg_engine)
+
+	pg_engine.rewind_lost_batches()
+
+	assert get_batches(pg_engine) == [(first_batch, False, False, None, None, None)]
+	assert get_table_position(pg_engine, "t_test") == ('mysql-bin.000001', 50)
+
+def test_rewind_lost_batches_events_present(pg_engine):
+	set_unlogged(pg_engine)
+	first_batch, first_events = add_batch(pg_engine, 100, "t_log_replica_test_1")
+	second_batch, second_events = add_batch(pg_engine, 200, "t_log_replica_test_2")
+	batches = get_batches(pg_engine)
+
+	pg_engine.rewind_lost_batches()
+
+	assert get_batches(pg_engine) == batches
+	pg_engine.pgsql_cur.execute("SELECT count(*) FROM sch_ninja.t_log_replica;")
+	assert pg_engine.pgsql_cur.fetchone()[0] == 6
+
+def add_events(pg_engine, id_batch, log_table, events):
+	"""
+		Adds the events, a list of tuples with the table name, the row id and the binlog position, and returns the events ids.
+	"""
+	id_events = []
+	for table_name, row_id, binlog_position in events:
+		pg_engine.pgsql_cur.execute("""
+			INSERT INTO sch_ninja.%s (i_id_batch, v_table_name, v_schema_name, enm_binlog_event, t_binlog_name, i_binlog_position, jsb_event_after, jsb_event_before)
+			VALUES (%%s, %%s, 'test_clear', 'insert', 'mysql-bin.000001', %%s, %%s, '{}')
+			RETURNING i_id_event;
+		""" % log_table, (id_batch, table_name, binlog_position, json.dumps({"id": row_id})))
+		id_events.append(pg_engine.pgsql_cur.fetchone()[0])
+	return id_events
+
+@pytest.mark.parametrize("replay_cursor", [True, False])
+def test_rewind_lost_batches_keeps_replayed_partitions(pg_engine, replay_cursor):
+	"""
+		The parallel replay committed the partition of t_second after the replay cursor, then the server crashed.
+		When the batch is read again the partition must be mapped to the new events, which are not replayed twice.
+		Without replay cursor the partition is the first committed replay of the batch.
+	"""
+	set_unlogged(pg_engine)
+	pg_engine.pgsql_cur.execute("""
+		DROP SCHEMA IF EXISTS test_clear CASCADE;
+		CREATE SCHEMA test_clear;
+		CREATE TABLE test_clear.t_first (id integer PRIMARY KEY);
+		CREATE TABLE test_clear.t_second (id integer PRIMARY KEY);
+	""")
+	add_table(pg_engine, "t_first", None, None)
+	add_table(pg_engine, "t_second", None, None)
+	batch_events = [("t_first", 1, 101), ("t_second", 1, 102), ("t_first", 2, 103), ("t_second", 2, 103)]
+	id_batch, first_events = add_batch(pg_engine, 100, "t_log_replica_test_1")
+	pg_engine.pgsql_cur.execute("DELETE FROM sch_ninja.t_log_replica WHERE i_id_batch=%s;", (id_batch, ))
+	id_events = add_events(pg_engine, id_batch, "t_log_replica_test_1", batch_events)
+	pg_engine.pgsql_cur.execute("UPDATE sch_ninja.t_batch_events SET i_id_max_event=%s WHERE i_id_batch=%s;", (id_events[-1], id_batch))
+	if replay_cursor:
+		pg_engine.pgsql_cur.execute("""
+			UPDATE sch_ninja.t_batch_events SET i_id_last_event=%s, t_binlog_name='mysql-bin.000001', i_binlog_position=101 WHERE i_id_batch=%s;
+		""", (id_events[0], id_batch))
+	pg_engine._pg_engine__replay_events(pg_engine, id_batch, [id_events[1], id_events[3]], False, False)
+	crash_recovery(pg_engine)
+
+	pg_engine.rewind_lost_batches()
+
+	pg_engine.pgsql_cur.execute("SELECT count(*) FROM sch_ninja.t_replay_partitions WHERE i_id_batch=%s;", (id_batch, ))
+	assert pg_engine.pgsql_cur.fetchone()[0] == 1
+	pg_engine.pgsql_cur.execute("UPDATE sch_ninja.t_replica_batch SET b_started=True WHERE i_id_batch=%s;", (id_batch, ))
+	new_events = add_events(pg_engine, id_batch, "t_log_replica_test_2", batch_events)
+	pg_engine.set_batch_processed(id_batch)
+
+	pg_engine.pgsql_cur.execute("SELECT i_id_last_event FROM sch_ninja.t_batch_events WHERE i_id_batch=%s;", (id_batch, ))
+	assert pg_engine.pgsql_cur.fetchone()[0] == (new_events[0] if replay_cursor else 0)
+	pg_engine.pgsql_cur.execute("SELECT i_id_events FROM sch_ninja.t_replay_partitions WHERE i_id_batch=%s;", (id_batch, ))
+	assert pg_engine.pgsql_cur.fetchall() == [([new_events[1], new_events[3]], )]
+	pg_engine.pgsql_cur.execute("SELECT i_id_batch, i_id_evt_replay FROM sch_ninja.fn_get_replay_chunk(100, %s);", (pg_engine.i_id_source, ))
+	replay_chunk = [new_events[2]] if replay_cursor else [new_events[0], new_events[2]]
+	assert pg_engine.pgsql_cur.fetchone() == (id_batch, replay_chunk)
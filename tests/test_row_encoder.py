@@ -0,0 +1,67 @@
+import datetime
+import decimal
+import json
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from pg_ninja.lib import pg_lib
+from pg_ninja.lib.pg_lib import pg_encoder, row_encoder
+
+class date_subclass(datetime.date):
+	pass
+
+class decimal_subclass(decimal.Decimal):
+	pass
+
+GOLDEN_ROWS = [
+	row_encoder.get_golden_sample(),
+	{"date": datetime.date(1970, 1, 1), "datetime": datetime.datetime(2018, 1, 2, 3, 4, 5)},
+	{"datetime": datetime.datetime(2018, 1, 2, 3, 4, 5, 123, tzinfo=datetime.timezone.utc)},
+	{"time": datetime.time(23, 59, 59, 999999), "timedelta": datetime.timedelta(seconds=-1)},
+	{"decimal": decimal.Decimal("0.00"), "exponent": decimal.Decimal("1E+3"), "negative": decimal.Decimal("-1.5")},
+	{"bytes": b"", "binary": b"\x00\x01\x02", "quote": b"'\""},
+	{"null": None, "empty": "", "zero": 0, "false": False},
+	{"subclass_date": date_subclass(2018, 1, 2), "subclass_decimal": decimal_subclass("1.10")},
+	{},
+]
+
+@pytest.mark.parametrize("row_data", GOLDEN_ROWS)
+def test_row_encoder_matches_pg_encoder(row_data):
+	encoder = row_encoder()
+	assert encoder.dumps(row_data) == json.dumps(row_data, cls=pg_encoder)
+
+def test_row_encoder_known_output():
+	encoder = row_encoder()
+	row_data = {
+		"date": datetime.date(2018, 1, 2),
+		"decimal": decimal.Decimal("10.50"),
+		"bytes": b"ab",
+		"null": None,
+	}
+	assert encoder.dumps(row_data) == '{"date": "2018-01-02", "decimal": "10.50", "bytes": "b\'ab\'", "null": null}'
+
+def test_row_encoder_rejects_unsupported_types():
+	encoder = row_encoder()
+	with pytest.raises(TypeError):
+		encoder.dumps({"object": object()})
+	with pytest.raises(TypeError):
+		json.dumps({"object": object()}, cls=pg_encoder)
+
+def test_row_encoder_reused_across_rows():
+	encoder = row_encoder()
+	for row_data in GOLDEN_ROWS:
+		assert encoder.dumps(row_data) == json.dumps(row_data, cls=pg_encoder)
+
+def test_row_encoder_simplejson_backend():
+	simplejson = pytest.importorskip("simplejson")
+	encoder = row_encoder()
+	assert encoder.backend == "simplejson"
+	for row_data in GOLDEN_ROWS:
+		assert encoder.dumps(row_data) == json.dumps(row_data, cls=pg_encoder)
+
+def test_row_encoder_without_simplejson(monkeypatch):
+	monkeypatch.setattr(pg_lib, "simplejson", None)
+	encoder = row_encoder()
+	assert encoder.backend == "json"
+	assert encoder.dumps(GOLDEN_ROWS[0]) == json.dumps(GOLDEN_ROWS[0], cls=pg_encoder)
@@ -0,0 +1,113 @@
+import binascii
+import pytest
+
+pytest.importorskip("pymysql")
+pytest.importorskip("pymysqlreplication")
+
+from pg_ninja.lib.mysql_lib import mysql_source
+
+class fake_engine(object):
+	def __init__(self, table_pkey):
+		self.table_pkey = table_pkey
+
+	def get_table_pkey(self, schema, table):
+		return self.table_pkey
+
+def get_source(table_pkey=None, obfuscation=None, replica_compaction=False, replica_changed_columns=False, fk_tables=None):
+	source = mysql_source()
+	source.hexify = [] + source.hexify_always
+	source.obfuscation = obfuscation or {}
+	source.replica_compaction = replica_compaction
+	source.replica_changed_columns = replica_changed_columns
+	source.fk_tables = fk_tables or {}
+	source.pg_engine = fake_engine(table_pkey)
+	source.schema_mappings = {"my_schema": {"clear": "dest_schema", "obfuscate": "obf_schema"}}
+	source.table_type_map = {
+		"my_schema": {
+			"t_test": {"id": "int", "name": "varchar", "payload": "varbinary", "picture": "blob", "email": "varchar"},
+		}
+	}
+	return source
+
+def get_row_plan(source):
+	return source._mysql_source__get_row_plan("my_schema", "t_test")
+
+def hexify_row(row_image, hexify_columns):
+	mysql_source()._mysql_source__hexify_row(row_image, hexify_columns)
+	return row_image
+
+def test_row_plan_columns():
+	row_plan = get_row_plan(get_source())
+	assert row_plan["columns"] == {"id", "name", "payload", "picture", "email"}
+	assert sorted(row_plan["hexify"]) == ["payload", "picture"]
+	assert row_plan["obfuscate"] == []
+	assert row_plan["pkey"] is None
+	assert row_plan["compact"] is False
+
+def test_row_plan_obfuscation():
+	obf_mode = {"mode": "normal", "nonhash_start": 0, "nonhash_length": 0}
+	row_plan = get_row_plan(get_source(obfuscation={"my_schema": {"t_test": {"email": obf_mode}}}))
+	assert row_plan["obfuscate"] == [("email", obf_mode)]
+
+def test_row_plan_is_cached():
+	source = get_source()
+	row_plan = get_row_plan(source)
+	source.table_type_map["my_schema"]["t_test"]["other"] = "blob"
+	assert get_row_plan(source) is row_plan
+	source.row_plans = {}
+	assert "other" in get_row_plan(source)["hexify"]
+
+def test_row_plan_pkey_for_changed_columns():
+	row_plan = get_row_plan(get_source(table_pkey=["id"], replica_changed_columns=True))
+	assert row_plan["pkey"] == ["id"]
+	assert row_plan["compact"] is False
+
+def test_row_plan_pkey_for_compaction():
+	row_plan = get_row_plan(get_source(table_pkey=["id"], replica_compaction=True))
+	assert row_plan["pkey"] == ["id"]
+	assert row_plan["compact"] is True
+
+def test_row_plan_without_pkey_is_not_compacted():
+	row_plan = get_row_plan(get_source(table_pkey=None, replica_compaction=True))
+	assert row_plan["pkey"] is None
+	assert row_plan["compact"] is False
+
+def test_row_plan_obfuscated_pkey_is_not_used():
+	obf_mode = {"mode": "numeric"}
+	row_plan = get_row_plan(get_source(table_pkey=["id"], replica_compaction=True, obfuscation={"my_schema": {"t_test": {"id": obf_mode}}}))
+	assert row_plan["pkey"] is None
+	assert row_plan["compact"] is False
+
+@pytest.mark.parametrize("fk_table", [("dest_schema", "t_test"), ("obf_schema", "t_test")])
+def test_row_plan_fk_tables_are_not_compacted(fk_table):
+	row_plan = get_row_plan(get_source(table_pkey=["id"], replica_compaction=True, fk_tables={fk_table: 1}))
+	assert row_plan["pkey"] == ["id"]
+	assert row_plan["compact"] is False
+
+def test_hexify_row():
+	row_image = {"id": 1, "payload": b"\x00\xff", "picture": b"ab", "name": "text"}
+	assert hexify_row(row_image, ["payload", "picture"]) == {"id": 1, "payload": "00ff", "picture": "6162", "name": "text"}
+
+def test_hexify_row_empty_and_null_values():
+	row_image = {"id": 1, "payload": b"", "picture": None}
+	assert hexify_row(row_image, ["payload", "picture"]) == {"id": 1, "payload": "", "picture": None}
+
+def test_hexify_row_missing_columns():
+	row_image = {"id": 1}
+	assert hexify_row(row_image, ["payload"]) == {"id": 1}
+
+def test_hexify_row_matches_the_per_column_conversion():
+	"""
+		The row plan must produce the same values of the per column loop used before the row plans.
+	"""
+	source = get_source()
+	column_map = source.table_type_map["my_schema"]["t_test"]
+	row_image = {"id": 1, "name": "text", "payload": b"\x01", "picture": b"", "email": None}
+	legacy_image = dict(row_image)
+	for column_name in legacy_image:
+		column_type = column_map.get(column_name, "text")
+		if column_type in source.hexify and legacy_image[column_name]:
+			legacy_image[column_name] = binascii.hexlify(legacy_image[column_name]).decode()
+		elif column_type in source.hexify and isinstance(legacy_image[column_name], bytes):
+			legacy_image[column_name] = ''
+	assert hexify_row(row_image, get_row_plan(source)["hexify"]) == legacy_image
@@ -0,0 +1,47 @@
+import logging
+import pytest
+
+pytest.importorskip("pymysql")
+pytest.importorskip("pymysqlreplication")
+
+from pg_ninja.lib.mysql_lib import mysql_source
+
+def get_source(source_config):
+	source = mysql_source()
+	source.logger = logging.getLogger("pg_ninja_tests")
+	source.source_config = source_config
+	return source
+
+@pytest.mark.parametrize("setting_value, size", [
+	(1000, 1000),
+	("1000", 1000),
+	("10k", 10*1024),
+	("300M", 300*1024*1024),
+	("2G", 2*1024*1024*1024),
+])
+def test_size_suffixes(setting_value, size):
+	source = get_source({"copy_max_memory": setting_value, "copy_split_size": setting_value, "replica_batch_bytes": setting_value})
+	source.set_copy_max_memory()
+	source.set_copy_split_size()
+	source.set_replica_batch_bytes()
+	assert (source.copy_max_memory, source.copy_split_size, source.replica_batch_bytes) == (size, size, size)
+
+@pytest.mark.parametrize("source_config", [{}, {"copy_split_size": None, "replica_batch_bytes": None}, {"copy_split_size": "", "replica_batch_bytes": ""}])
+def test_optional_sizes_not_set(source_config):
+	source = get_source(source_config)
+	source.set_copy_split_size()
+	source.set_replica_batch_bytes()
+	assert (source.copy_split_size, source.replica_batch_bytes) == (None, None)
+
+@pytest.mark.parametrize("setting_name, set_method", [
+	("copy_max_memory", "set_copy_max_memory"),
+	("copy_split_size", "set_copy_split_size"),
+	("replica_batch_bytes", "set_replica_batch_bytes"),
+])
+@pytest.mark.parametrize("setting_value", ["10T", "M", "1.5G", "ten"])
+def test_invalid_size(setting_name, set_method, setting_value, caplog):
+	source = get_source({setting_name: setting_value})
+	with caplog.at_level(logging.ERROR), pytest.raises(SystemExit) as exit_info:
+		getattr(source, set_method)()
+	assert exit_info.value.code == 3
+	assert "Invalid value %s for the parameter %s" % (setting_value, setting_name) in caplog.text
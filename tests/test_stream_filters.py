@@ -0,0 +1,65 @@
+import logging
+import pytest
+
+pytest.importorskip("pymysql")
+pytest.importorskip("pymysqlreplication")
+
+from pg_ninja.lib.mysql_lib import mysql_source
+
+def stream_filters(schema_replica, limit_tables, skip_tables):
+	source = mysql_source()
+	source.logger = logging.getLogger("pg_ninja_tests")
+	source.schema_replica = schema_replica
+	source.limit_tables = limit_tables
+	source.skip_tables = skip_tables
+	source._mysql_source__build_stream_filters()
+	return source.stream_only_tables, source.stream_ignored_tables
+
+def test_no_filters():
+	assert stream_filters(["sch_a", "sch_b"], {}, {}) == (None, None)
+
+def test_limit_tables_for_all_the_schemas():
+	limit_tables = {"sch_a": ["t2", "t1"], "sch_b": ["t1", "t3"]}
+	assert stream_filters(["sch_a", "sch_b"], limit_tables, {}) == (["t1", "t2", "t3"], None)
+
+def test_limit_tables_for_some_schemas_only():
+	"""
+		A schema without limit_tables replicates all its tables, the table names can't be restricted in the reader.
+	"""
+	limit_tables = {"sch_a": ["t1"]}
+	assert stream_filters(["sch_a", "sch_b"], limit_tables, {}) == (None, None)
+
+def test_empty_limit_tables_list():
+	limit_tables = {"sch_a": ["t1"], "sch_b": []}
+	assert stream_filters(["sch_a", "sch_b"], limit_tables, {}) == (None, None)
+
+def test_skip_tables_in_all_the_schemas():
+	skip_tables = {"sch_a": ["t1", "t2"], "sch_b": ["t2", "t1"]}
+	assert stream_filters(["sch_a", "sch_b"], {}, skip_tables) == (None, ["t1", "t2"])
+
+def test_skip_tables_replicated_in_another_schema():
+	"""
+		The table t1 is skipped in sch_a only, the reader must still emit its events for sch_b.
+	"""
+	skip_tables = {"sch_a": ["t1", "t2"], "sch_b": ["t2"]}
+	assert stream_filters(["sch_a", "sch_b"], {}, skip_tables) == (None, ["t2"])
+
+def test_skip_tables_excluded_by_limit_tables():
+	"""
+		A table skipped in one schema and not listed in the limit_tables of the other is never stored.
+	"""
+	limit_tables = {"sch_b": ["t3"]}
+	skip_tables = {"sch_a": ["t1"]}
+	assert stream_filters(["sch_a", "sch_b"], limit_tables, skip_tables) == (None, ["t1"])
+
+def test_skip_tables_of_a_schema_not_replicated():
+	skip_tables = {"sch_c": ["t1"]}
+	assert stream_filters(["sch_a"], {}, skip_tables) == (None, None)
+
+def test_limit_and_skip_tables():
+	limit_tables = {"sch_a": ["t1", "t2"], "sch_b": ["t2"]}
+	skip_tables = {"sch_a": ["t2"]}
+	assert stream_filters(["sch_a", "sch_b"], limit_tables, skip_tables) == (["t1", "t2"], None)
+
+def test_no_replicated_schema():
+	assert stream_filters([], {}, {}) == (None, None)
@@ -0,0 +1,43 @@
+def add_batch(pg_engine, binlog_position, log_table, batch_log_table, replayed):
+	pg_engine.pgsql_cur.execute("""
+		INSERT INTO sch_ninja.t_replica_batch (i_id_source, t_binlog_name, i_binlog_position, b_started, b_processed, b_replayed, v_log_table)
+		VALUES (%s, 'mysql-bin.000001', %s, True, True, %s, %s)
+		RETURNING i_id_batch;
+	""", (pg_engine.i_id_source, binlog_position, replayed, batch_log_table))
+	id_batch = pg_engine.pgsql_cur.fetchone()[0]
+	pg_engine.pgsql_cur.execute("""
+		INSERT INTO sch_ninja.%s (i_id_batch, v_table_name, v_schema_name, enm_binlog_event, t_binlog_name, i_binlog_position, jsb_event_after, jsb_event_before)
+		VALUES (%%s, 't_test', 'test_clear', 'insert', 'mysql-bin.000001', %%s, '{"id": 1}', '{}');
+	""" % log_table, (id_batch, binlog_position))
+	return id_batch
+
+def count_events(pg_engine, log_table):
+	pg_engine.pgsql_cur.execute("SELECT count(*) FROM sch_ninja.%s;" % log_table)
+	return pg_engine.pgsql_cur.fetchone()[0]
+
+def test_truncate_replayed_log_tables(pg_engine):
+	add_batch(pg_engine, 100, "t_log_replica_test_1", "t_log_replica_test_1", True)
+	add_batch(pg_engine, 200, "t_log_replica_test_2", "t_log_replica_test_2", False)
+
+	pg_engine.truncate_replayed_log_tables()
+
+	assert count_events(pg_engine, "t_log_replica_test_1") == 0
+	assert count_events(pg_engine, "t_log_replica_test_2") == 1
+
+def test_truncate_with_legacy_batches(pg_engine):
+	"""
+		A batch without log table, written by the previous catalogue versions, blocks only the log table with its events.
+	"""
+	add_batch(pg_engine, 100, "t_log_replica_test_1", None, False)
+	add_batch(pg_engine, 200, "t_log_replica_test_2", "t_log_replica_test_2", True)
+	add_batch(pg_engine, 300, "t_log_replica_test_2", None, True)
+
+	pg_engine.truncate_replayed_log_tables()
+
+	assert count_events(pg_engine, "t_log_replica_test_1") == 1
+	assert count_events(pg_engine, "t_log_replica_test_2") == 0
+
+	pg_engine.pgsql_cur.execute("UPDATE sch_ninja.t_replica_batch SET b_replayed=True;")
+	pg_engine.truncate_replayed_log_tables()
+
+	assert count_events(pg_engine, "t_log_replica_test_1") == 0